@@ -0,0 +1,289 @@
+"""
+Benchmarks for the passes of the compiler in main.py
+
+run with
+python benchmarks.py [benchmark name]
+(runs every benchmark if no name is given)
+"""
+
+import os
+import sys
+import time
+import pickle
+import tempfile
+import tracemalloc
+
+import main
+
+main.DEBUG = False
+
+
+def bench_filter():
+    # the token filter (line continuations and semicolons) should scale linearly
+    # with the number of tokens. The time per token should stay about the same
+    print("filter_tokens (line continuations and semicolons)")
+    print(f"{'tokens':>12} {'seconds':>10} {'ns/token':>10}")
+
+    # generated code with a lot of semicolon separated statements
+    # and some lines broken with \
+    pattern = ["int", "x", "=", "1", ";", "x", "=", "x", "+", "2", ";", "\\", "\n", "`1", ";", "\n", "`2"]
+
+    compiler = main.Compiler.__new__(main.Compiler)
+    size = 10_000
+    while size <= 10_000_000:
+        tokens = pattern * (size // len(pattern))
+        start = time.perf_counter()
+        for x in compiler.filter_tokens(tokens):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{len(tokens):>12} {elapsed:>10.3f} {elapsed / len(tokens) * 1e9:>10.1f}")
+        size *= 10
+
+
+def bench_compound():
+    # compound assignments (+=, <<=, ||= ...) are desugared in one walk over the
+    # syntax tree, so the lines per second should stay about the same as functions grow
+    print("compound assignments (lines per second)")
+    print(f"{'lines':>12} {'parse':>12} {'desugar':>12} {'lower':>12}")
+
+    # every compound operator, with a few operators on the right
+    statements = [
+        "a + = b * 2 + c",
+        "a - = ( b - c ) * 3",
+        "a * = b",
+        "a / = b / 2",
+        "a % = 7",
+        "a ^ = b ^ c",
+        "a | = b | c",
+        "a | | = b & & c",
+        "a & = b",
+        "a & & = b | | c",
+        "a < < = 2",
+        "a > > = b + 1",
+    ]
+    sequencer = main.Sequencer.__new__(main.Sequencer)
+    size = 1_000
+    while size <= 100_000:
+        lines = [main.Line(statements[i % len(statements)].split()) for i in range(size)]
+
+        start = time.perf_counter()
+        function = main.Function("bench", [], ["void"], "public", lines)
+        function.body = main.TreeBuilder(lines).build()
+        parse = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sequencer.convert_operation_equals(function)
+        desugar = time.perf_counter() - start
+
+        function.body = main.TreeBuilder(lines).build()
+        start = time.perf_counter()
+        sequencer.convert_operations(function)
+        lower = time.perf_counter() - start
+
+        print(f"{size:>12} {size / parse:>12.0f} {size / desugar:>12.0f} {size / lower:>12.0f}")
+        size *= 10
+
+
+def bench_numbering():
+    # numbering the variables of a function with a lot of locals. Variables are
+    # ints until they are printed, so the time per line should stay about the same
+    print("number_variables (lines per second)")
+    print(f"{'locals':>12} {'lines':>10} {'lines/s':>12}")
+
+    the_class = main.Class("Main", [], [])
+    size = 1_000
+    while size <= 100_000:
+        lines = []
+        for i in range(size):
+            lines.append(main.Line(["int", f"v{i}", "=", str(i)]))
+            lines.append(main.Line([f"v{i}", "=", f"v{i // 2}", "+", f"v{i}"]))
+        function = main.Function("bench", [], ["void"], "public", lines)
+        function.body = main.TreeBuilder(lines).build()
+
+        sequencer = main.Sequencer.__new__(main.Sequencer)
+        sequencer.classes = [the_class]
+        sequencer.tables = {}
+        sequencer.imports = None
+        sequencer.names = None
+        sequencer.reachable = None
+        sequencer.fields = {}
+        sequencer.convert_operations(function)
+        start = time.perf_counter()
+        sequencer.number_variables(function, the_class)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>12} {len(function.lines):>10} {len(function.lines) / elapsed:>12.0f}")
+        size *= 10
+
+
+def bench_ir():
+    # lowering a long function to TCABIR, and how big the instructions are.
+    # every instruction is four ints in one array, and a few bytes in a file
+    print("TCABIR (instructions per second, bytes per instruction)")
+    print(f"{'lines':>12} {'instructions':>12} {'lower/s':>12} {'write/s':>12} {'read/s':>12} {'memory':>8} {'file':>8}")
+
+    size = 1_000
+    while size <= 100_000:
+        source = ["public class Main {", "    public static void main(String[] args){", "        int a = 1", "        int b = 300"]
+        for i in range(size):
+            source.append(f"        a = (a + b * {i % 256}) % 7")
+        source += ["    }", "}"]
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with open("ir.tcab", "w") as f:
+                f.write("\n".join(source) + "\n")
+            compiler = main.Compiler("ir.tcab")
+            parser = main.Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
+            sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+            start = time.perf_counter()
+            program = main.Lowerer(sequencer).program
+            lower = time.perf_counter() - start
+        finally:
+            os.remove("ir.tcab")
+            os.chdir(cwd)
+            os.rmdir(directory)
+
+        start = time.perf_counter()
+        data = program.to_bytes()
+        write = time.perf_counter() - start
+        start = time.perf_counter()
+        main.Program.from_bytes(data)
+        read = time.perf_counter() - start
+
+        n = len(program)
+        memory = program.code.itemsize * len(program.code) / n
+        print(f"{size:>12} {n:>12} {n / lower:>12.0f} {n / write:>12.0f} {n / read:>12.0f} {memory:>8.1f} {len(data) / n:>8.1f}")
+        size *= 10
+
+
+def bench_optimize():
+    # how many instructions each level of the Optimizer leaves of a long function,
+    # and how fast it gets there. Every statement has a constant to fold and a
+    # repeated sum (that only -O2 works out once)
+    print("optimizer (instructions left, instructions per second)")
+    print(f"{'lines':>12} {'instructions':>12} {'-O1':>10} {'-O1/s':>12} {'-O2':>10} {'-O2/s':>12}")
+
+    size = 1_000
+    while size <= 100_000:
+        source = ["public class Main {", "    public static void main(String[] args){", "        int[] arr = [1, 2]", "        int a = arr[1]", "        int b = 300", "        int c = 0"]
+        for i in range(size):
+            source.append(f"        c = (a + b) * (a + b) + {i % 256} * 2")
+            source.append("        a = c % 7")
+        source += ["        return a", "    }", "}"]
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with open("optimize.tcab", "w") as f:
+                f.write("\n".join(source) + "\n")
+            compiler = main.Compiler("optimize.tcab")
+            parser = main.Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
+            sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+            data = main.Lowerer(sequencer).program.to_bytes()
+            results = []
+            for level in [1, 2]:
+                program = main.Program.from_bytes(data)
+                n = len(program)
+                start = time.perf_counter()
+                main.Optimizer(program, level)
+                results.append((len(program), n / (time.perf_counter() - start)))
+        finally:
+            os.remove("optimize.tcab")
+            os.chdir(cwd)
+            os.rmdir(directory)
+
+        (left1, speed1), (left2, speed2) = results
+        print(f"{len(source):>12} {n:>12} {left1:>10} {speed1:>12.0f} {left2:>10} {speed2:>12.0f}")
+        size *= 10
+
+
+def synthetic_source(classes:int):
+    # a program with a lot of small classes
+    result = ["public class Main {", "    public static void main(String[] args){", "        int x = 1", "    }", "}"]
+    for i in range(classes):
+        result += [
+            f"class Generated{i} {{",
+            "    int a = 1",
+            "    float b = 2.5",
+            "    public int twice(int v){",
+            "        int w = v + v",
+            "        return w",
+            "    }",
+            "}",
+        ]
+    return "\n".join(result) + "\n"
+
+
+def count(classes:list):
+    # the number of classes, functions and lines in a tree of classes
+    result = [0, 0, 0]
+    for x in classes:
+        result[0] += 1
+        result[1] += len(x.functions)
+        result[2] += len(x.lines) + sum([len(f.lines) for f in x.functions])
+        sub = count(x.subclasses)
+        for i in range(3):
+            result[i] += sub[i]
+    return result
+
+
+def bench_memory():
+    # how many bytes each Line and Class takes, on their own and in a whole tree
+    print("memory (bytes per object)")
+    n = 100_000
+
+    source = main.SourceFile("memory.tcab", "int x = 1\n")
+    store = main.TokenStore.from_tokens(source, ["int", "x", "=", "1", "\n", "`1"])
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    lines = [main.Line(store=store, start=0, end=4) for x in range(n)]
+    line_bytes = (tracemalloc.get_traced_memory()[0] - before) / n
+    before = tracemalloc.get_traced_memory()[0]
+    classes = [main.Class("Generated", [], []) for x in range(n)]
+    class_bytes = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+    del lines, classes
+    print(f"{'Line':>12} {line_bytes:>10.1f}")
+    print(f"{'Class':>12} {class_bytes:>10.1f}")
+    print()
+
+    print("parsed tree of a generated program")
+    print(f"{'classes':>12} {'lines':>10} {'bytes/line':>10} {'pickled':>10}")
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        for size in [1_000, 10_000]:
+            with open("memory.tcab", "w") as f:
+                f.write(synthetic_source(size))
+            tracemalloc.start()
+            compiler = main.Compiler("memory.tcab")
+            parser = main.Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            classes, functions, lines = count(parser.classes)
+            pickled = len(pickle.dumps(parser.classes, pickle.HIGHEST_PROTOCOL))
+            print(f"{classes:>12} {lines:>10} {used / lines:>10.1f} {pickled / lines:>10.1f}")
+            del compiler, parser
+    finally:
+        os.remove("memory.tcab")
+        os.chdir(cwd)
+        os.rmdir(directory)
+
+
+BENCHMARKS = {
+    "filter": bench_filter,
+    "compound": bench_compound,
+    "memory": bench_memory,
+    "numbering": bench_numbering,
+    "ir": bench_ir,
+    "optimize": bench_optimize,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
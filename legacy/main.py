@@ -9,32 +9,192 @@ The compiler will also apply heavy optimizations to the program, including algor
 
 """
 
+import io
+import os
+import re
+import json
+import mmap
+import zlib
+import pickle
+import socket
+import hashlib
+import time
+import traceback
+from array import array
+from itertools import chain
+from collections import deque
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 DEBUG = True
 
+# use the original character by character tokenizer instead of the Lexer
+# (useful for diffing the token streams of the two)
+LEGACY_TOKENIZER = False
+
+# memory map source files and tokenize them in pieces instead of reading them
+# whole. The tokens then flow through the early passes without ever being
+# gathered into one big list
+STREAM_SOURCE = False
+# roughly how many bytes of the source are tokenized at a time when streaming
+CHUNK_SIZE = 1 << 20
+
+# preprocess imported files in parallel (see BuildScheduler)
+PARALLEL_IMPORTS = False
+
+# keep preprocessed files in this directory, so that files that did not
+# change are not preprocessed again (None turns the cache off)
+CACHE_DIR = None
+
+# part of the key of every cached file. Change it whenever preprocessing changes
+COMPILER_VERSION = "0.1"
+
+# keep running, and rebuild whenever a source file changes (see Daemon)
+WATCH = False
+
+# answer requests to check files on this Unix socket (see CompileServer).
+# None does not start a server
+SERVER_SOCKET = None
+
+# write the TCABIR of the program to this file (see Program). None does not write it
+IR_OUTPUT = None
+
+# how hard the TCABIR is optimized (see Optimizer), like -O0/-O1/-O2:
+#   0 - not at all
+#   1 - constant folding, copy propagation and dead code elimination, once
+#   2 - also common subexpressions, and the passes are repeated until nothing changes
+OPTIMIZE_LEVEL = 1
+# the most times the passes are repeated at level 2
+OPTIMIZE_ROUNDS = 8
+
 def debug(message:str):
     if DEBUG:
         print(message)
 
+class SourceFile:
+    """
+    The contents of a source file.
+    The offsets where each line starts are only found the first time a line
+    is asked for, after which any line can be fetched without splitting the file.
+    The contents are either a str or a read only memory map of the file (in
+    which case offsets are in bytes).
+    """
+    def __init__(self, filename:str, data):
+        self.filename = filename
+        self.data = data
+        self.mapped = not isinstance(data, str)
+        self._line_starts = None
+
+    @classmethod
+    def map(cls, filename:str):
+        with open(filename, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files cannot be mapped
+                data = ""
+        return cls(filename, data)
+
+    def __getstate__(self):
+        # a memory map cannot be sent to another process, so it is mapped again there
+        state = self.__dict__.copy()
+        if self.mapped:
+            state["data"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.mapped:
+            self.data = SourceFile.map(self.filename).data
+
+    def chunks(self, size:int=CHUNK_SIZE):
+        # pieces of the source of about size bytes that each end with a newline
+        if not self.mapped:
+            yield self.data
+            return
+        position = 0
+        n = len(self.data)
+        while position < n:
+            end = self.data.find(b"\n", position + size)
+            end = n if end == -1 else end + 1
+            yield self.data[position:end].decode()
+            position = end
+
+    def find(self, token:str, position:int):
+        if self.mapped:
+            return self.data.find(token.encode(), position)
+        return self.data.find(token, position)
+
+    def length(self, token:str):
+        if self.mapped:
+            return len(token.encode())
+        return len(token)
+
+    def line_starts(self):
+        if self._line_starts == None:
+            self._line_starts = array('I', [0])
+            for x in re.finditer(b"\n" if self.mapped else "\n", self.data):
+                self._line_starts.append(x.end())
+        return self._line_starts
+
+    def line(self, line_number:int):
+        # get a line (starting at 1) without its newline, or None if there is no such line
+        starts = self.line_starts()
+        if line_number < 1 or line_number > len(starts):
+            return None
+        start = starts[line_number-1]
+        if line_number == len(starts):
+            line = self.data[start:]
+        else:
+            line = self.data[start:starts[line_number]-1]
+        if self.mapped:
+            return line.decode()
+        return line
+
+
 # keep a list of exceptions to display just before writing the output
 class ErrorMessage:
+    __slots__ = ["file", "type", "line_number", "line", "source", "cause", "suggestions"]
+
     def __init__(self):
         self.file = ""
         self.type = "N/A"
         self.line_number = "0"
         self.line = ""
+        self.source = None
         self.cause = "The cause is unkown..."
         self.suggestions = "Good Luck!"
 
+    def get_line(self):
+        # the offending line is only looked up once the error is shown
+        if self.line == "":
+            self.line = "ERROR while fetching line"
+            if self.source != None:
+                line = self.source.line(int(self.line_number))
+                if line != None:
+                    self.line = line
+        return self.line
+
     def __str__(self):
         result = "-" * 80
         result += "\n"
         result += f"FILE: {self.file}\n"
         result += f"ERROR: ({self.type}) in line {self.line_number}:\n"
-        result += f"LINE: \n\t{self.line}\n"
+        result += f"LINE: \n\t{self.get_line()}\n"
         result += f"CAUSE: \n\t{self.cause}\n"
         result += f"SUGGESTIONS: \n\t{self.suggestions}\n"
         return result
 
+    def to_dict(self):
+        return {
+            "file": self.file,
+            "type": self.type,
+            "line_number": int(self.line_number),
+            "line": self.get_line(),
+            "cause": self.cause,
+            "suggestions": self.suggestions,
+        }
+
 
 RESERVED_WORDS = set(["int", "bool", "float", "short", "long", "double", "char", "void", "class", "public", "private", "protected", "extends", "return", "if", "for", "while", "import", "as", "use", "try", "catch", "switch", "case", "else", "new", "asm", "static", "extends"])
 
@@ -43,6 +203,8 @@ class Directive:
     """
     A compiler directive
     """
+    __slots__ = ["tokens"]
+
     def __init__(self, tokens: list[str]):
         self.tokens = tokens
 
@@ -53,6 +215,8 @@ class Use:
     or
     use System.out.println as print;
     """
+    __slots__ = ["tokens", "path", "first", "second"]
+
     def __init__(self, tokens: list[str]):
         self.tokens = tokens
         self.parse()
@@ -62,23 +226,68 @@ class Use:
         if "as" in self.tokens:
             as_index = self.tokens.index("as")
 
-            self.first = "".join(self.tokens[use_index+1:as_index])
+            # the names of the dotted path that is used (System, out, println)
+            self.path = [x for x in self.tokens[use_index+1:as_index] if x != "."]
             self.second = "".join(self.tokens[as_index+1:])
         else:
-            self.first = self.tokens[use_index+1:]
-            self.second = self.tokens[-1]
+            self.path = [x for x in self.tokens[use_index+1:] if x != "."]
+            self.second = self.path[-1]
+        self.first = ".".join(self.path)
 
 
 class Line:
     """
     A single line of code.
+    The tokens can either be owned by the line, or be a range [start, end) of a
+    TokenStore. A ranged line only builds its own token list once a pass asks
+    for line.tokens (so that it can change them). The range is kept after
+    that, so the line can still be found in the store.
+    Lines are the most common object of a build, so they have no __dict__.
     """
-    def __init__(self, tokens: list[str]):
-        self.tokens = tokens
+    __slots__ = ["_tokens", "store", "start", "end", "is_declaration", "line_number"]
+
+    def __init__(self, tokens: list[str]=None, store=None, start:int=0, end:int=0, line_number:int=0):
+        self._tokens = tokens
+        self.store = store
+        self.start = start
+        self.end = end
         self.is_declaration = False
 
+        # the line in the source file that this line starts on (0 if unknown)
+        if store != None and start < end:
+            line_number = store.lines[start]
+        self.line_number = line_number
+
+    @property
+    def tokens(self):
+        if self._tokens == None:
+            self._tokens = self.store.texts(self.start, self.end)
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens: list[str]):
+        self._tokens = tokens
+
+    def __getstate__(self):
+        # a tuple pickles smaller than the names and values of the slots
+        return (self._tokens, self.store, self.start, self.end, self.is_declaration, self.line_number)
+
+    def __setstate__(self, state):
+        self._tokens, self.store, self.start, self.end, self.is_declaration, self.line_number = state
+
+    def copy_tokens(self):
+        # a copy of the tokens that does not make a ranged line own its tokens
+        if self._tokens == None:
+            return self.store.texts(self.start, self.end)
+        return self._tokens.copy()
+
+    def __len__(self):
+        if self._tokens == None:
+            return self.end - self.start
+        return len(self._tokens)
+
     def __str__(self):
-        return self.tokens.__str__()
+        return self.copy_tokens().__str__()
 
 
 class Block:
@@ -86,9 +295,19 @@ class Block:
     A simple block of code.
     contains its own scope and is enclosed in {}
     """
+    __slots__ = ["lines", "is_declaration", "body"]
+
     def __init__(self, lines:list[str]):
         self.lines = lines
         self.is_declaration = False
+        # the syntax tree of the lines, built by the Parser
+        self.body = None
+
+    def token_range(self):
+        # the [start, end) range of the TokenStore that this block was built from
+        if len(self.lines) < 1:
+            return 0, 0
+        return self.lines[0].start, self.lines[-1].end
 
     def print(self):
         for line in self.lines:
@@ -103,6 +322,8 @@ class Class(Block):
     """
     A class.
     """
+    __slots__ = ["name", "parents", "subclasses", "functions", "directives", "uses", "file", "is_global", "parsed", "errors"]
+
     def __init__(self, class_name:str, parents:list[str], lines:list[str]):
         Block.__init__(self, lines)
         self.name = class_name
@@ -113,7 +334,10 @@ class Class(Block):
         self.uses = []
         self.file = ""
         self.is_global = True
-        self.converted = False
+        # whether a Parser has already handled this class (and its subclasses)
+        self.parsed = False
+        # the errors the Parser found in this class, reported again by later builds
+        self.errors = []
 
     def get_scope(self):
         # check the first line of this classes' definition
@@ -147,6 +371,8 @@ class Function(Block):
     """
     A single function.
     """
+    __slots__ = ["name", "params", "return_type", "access", "directives"]
+
     def __init__(self, function_name:str, params:list[str], return_type:list[str], access:str, lines:list[str]):
         Block.__init__(self, lines)
         self.name = function_name
@@ -155,22 +381,1513 @@ class Function(Block):
         self.access = access
         self.directives = []
 
+    def copy(self):
+        # a copy that a trace can change without changing this function
+        # (the syntax tree is copied, the lines are shared)
+        result = Function(self.name, list(self.params), self.return_type, self.access, self.lines)
+        result.directives = self.directives
+        if self.body != None:
+            result.body = copy_tree(self.body)
+        return result
+
+
+# binary operator : precedence (higher binds tighter)
+BINARY_PRECEDENCE = {
+        "||":0,
+        "&&":1,
+        "|":2,
+        "^":3,
+        "&":4,
+
+        "==":5,
+        "!=":5,
+
+        ">":6,
+        ">=":6,
+        "<":6,
+        "<=":6,
+
+        "<<":7,
+        ">>":7,
+
+        "+":8,
+        "-":8,
+
+        "%":9,
+        "*":9,
+        "/":9,
+        }
+UNARY_OPERATORS = set(["-", "~", "!", "new"])
+
+# operator : the function it becomes (see Sequencer.convert_operations)
+OPERATOR_FUNCTIONS = {
+        "||":"logicalOr",
+        "&&":"logicalAnd",
+        "|":"or",
+        "^":"xor",
+        "&":"and",
+
+        "==":"equals",
+        "!=":"doesNotEqual",
+
+        ">":"isGreaterThan",
+        ">=":"isGreaterThanOrEqualTo",
+        "<":"isLessThan",
+        "<=":"isLessThanOrEqualTo",
+
+        "<<":"leftShift",
+        ">>":"rightShift",
+
+        "+":"plus",
+        "-":"minus",
+
+        "%":"mod",
+        "*":"times",
+        "/":"dividedBy",
+
+        "unary -":"negate",
+        "unary ~":"not",
+        "unary !":"logicalNot",
+        }
+UNARY_PRECEDENCE = 10
+# calls, indexes and member accesses
+POSTFIX_PRECEDENCE = 11
+
+# the functions of operators that give back a bool (the others give back the type they are called on)
+BOOL_FUNCTIONS = set(["logicalOr", "logicalAnd", "equals", "doesNotEqual", "isGreaterThan", "isGreaterThanOrEqualTo", "isLessThan", "isLessThanOrEqualTo", "logicalNot"])
+
+# compound assignment : the operator it applies (x += y is x = x + y)
+COMPOUND_OPERATORS = {
+        "+=":"+",
+        "-=":"-",
+        "*=":"*",
+        "/=":"/",
+        "%=":"%",
+        "^=":"^",
+        "|=":"|",
+        "||=":"||",
+        "&=":"&",
+        "&&=":"&&",
+        "<<=":"<<",
+        ">>=":">>",
+        }
+
+# binary operators that the Lexer splits into two tokens
+SPLIT_OPERATORS = ["<<", ">>", "&&", "||", "==", "!=", "<=", ">="]
+
+WORD = re.compile(r"[A-Za-z_$][\w$]*\Z")
+
+
+class Node:
+    """
+    A node of the syntax tree that the Parser builds for every class and function.
+    """
+    __slots__ = []
+
+    def copy(self):
+        # a copy of this node and of every node under it.
+        # the lines are shared, since no pass changes them
+        result = object.__new__(type(self))
+        for the_class in type(self).__mro__:
+            for name in the_class.__dict__.get("__slots__", []):
+                setattr(result, name, copy_tree(getattr(self, name)))
+        return result
+
+
+class Name(Node):
+    """
+    A variable, function or class. Dotted names (System.out.println) are kept whole.
+    variable is what the Sequencer numbered it as (see variable_text)
+    """
+    __slots__ = ["name", "variable"]
+    def __init__(self, name:str):
+        self.name = name
+        self.variable = None
+
+
+class Literal(Node):
+    """
+    A number, string or character (as written)
+    """
+    __slots__ = ["value"]
+    def __init__(self, value:str):
+        self.value = value
+
+
+class UnaryOp(Node):
+    __slots__ = ["op", "operand"]
+    def __init__(self, op:str, operand:Node):
+        self.op = op
+        self.operand = operand
+
+
+class BinaryOp(Node):
+    __slots__ = ["op", "left", "right"]
+    def __init__(self, op:str, left:Node, right:Node):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class Call(Node):
+    __slots__ = ["function", "args"]
+    def __init__(self, function:Node, args:list[Node]):
+        self.function = function
+        self.args = args
+
+
+class Keyword(Node):
+    """
+    A keyword argument of a call (name = value)
+    """
+    __slots__ = ["name", "value"]
+    def __init__(self, name:str, value:Node):
+        self.name = name
+        self.value = value
+
+
+class Member(Node):
+    """
+    An attribute of something that is not just a name, like get().x
+    """
+    __slots__ = ["value", "name"]
+    def __init__(self, value:Node, name:str):
+        self.value = value
+        self.name = name
+
+
+class Index(Node):
+    __slots__ = ["value", "index"]
+    def __init__(self, value:Node, index:Node):
+        self.value = value
+        self.index = index
+
+
+class Splice(Node):
+    """
+    value[start:end], where start and end can be left out
+    """
+    __slots__ = ["value", "start", "end"]
+    def __init__(self, value:Node, start:Node, end:Node):
+        self.value = value
+        self.start = start
+        self.end = end
+
+
+class ArrayLiteral(Node):
+    __slots__ = ["items"]
+    def __init__(self, items:list[Node]):
+        self.items = items
+
+
+class Statement(Node):
+    """
+    A statement. line is the Line it starts on
+    """
+    __slots__ = ["line"]
+
+
+class Declaration(Statement):
+    """
+    int[] x = value (value is None without an =).
+    type is every token before the name, including access specifiers.
+    variable is the number of the variable it declares (see Name)
+    """
+    __slots__ = ["type", "name", "value", "variable"]
+    def __init__(self, type:list[str], name:str, value:Node, line:Line=None):
+        self.type = type
+        self.name = name
+        self.value = value
+        self.line = line
+        self.variable = None
+
+
+class Assignment(Statement):
+    """
+    target op value, where op is = or a compound operator like +=
+    """
+    __slots__ = ["target", "op", "value"]
+    def __init__(self, target:Node, op:str, value:Node, line:Line=None):
+        self.target = target
+        self.op = op
+        self.value = value
+        self.line = line
+
+
+class ExpressionStatement(Statement):
+    """
+    An expression on its own (usually a Call)
+    """
+    __slots__ = ["value"]
+    def __init__(self, value:Node, line:Line=None):
+        self.value = value
+        self.line = line
+
+
+class If(Statement):
+    """
+    else if is an If that is the only statement of orelse
+    """
+    __slots__ = ["condition", "body", "orelse"]
+    def __init__(self, condition:Node, body:list[Statement], orelse:list[Statement], line:Line=None):
+        self.condition = condition
+        self.body = body
+        self.orelse = orelse
+        self.line = line
+
+
+class While(Statement):
+    __slots__ = ["condition", "body"]
+    def __init__(self, condition:Node, body:list[Statement], line:Line=None):
+        self.condition = condition
+        self.body = body
+        self.line = line
+
+
+class For(Statement):
+    """
+    for (init; condition; step) (any of the three can be None)
+    """
+    __slots__ = ["init", "condition", "step", "body"]
+    def __init__(self, init:Statement, condition:Node, step:Statement, body:list[Statement], line:Line=None):
+        self.init = init
+        self.condition = condition
+        self.step = step
+        self.body = body
+        self.line = line
+
+
+class ForEach(Statement):
+    """
+    for target in iterable (target is a Declaration or a Name)
+    """
+    __slots__ = ["target", "iterable", "body"]
+    def __init__(self, target:Node, iterable:Node, body:list[Statement], line:Line=None):
+        self.target = target
+        self.iterable = iterable
+        self.body = body
+        self.line = line
+
+
+class Scope(Statement):
+    """
+    A block on its own { ... }
+    """
+    __slots__ = ["body"]
+    def __init__(self, body:list[Statement], line:Line=None):
+        self.body = body
+        self.line = line
+
+
+class Return(Statement):
+    __slots__ = ["value"]
+    def __init__(self, value:Node, line:Line=None):
+        self.value = value
+        self.line = line
+
+
+class Break(Statement):
+    __slots__ = []
+    def __init__(self, line:Line=None):
+        self.line = line
+
+
+class Continue(Statement):
+    __slots__ = []
+    def __init__(self, line:Line=None):
+        self.line = line
+
+
+class Raw(Statement):
+    """
+    A statement that could not be read. The tokens are kept for the later passes
+    """
+    __slots__ = ["tokens"]
+    def __init__(self, tokens:list[str], line:Line=None):
+        self.tokens = tokens
+        self.line = line
+
+
+def copy_tree(value):
+    # a copy of a node or a list of them (anything else is shared)
+    if isinstance(value, Node):
+        return value.copy()
+    if isinstance(value, list):
+        return [copy_tree(x) for x in value]
+    return value
+
+
+def bodies(body:list[Statement]):
+    # every list of statements in body (including body itself)
+    pending = [body]
+    while len(pending) > 0:
+        body = pending.pop()
+        yield body
+        for node in body:
+            match node:
+                case If():
+                    pending += [node.body, node.orelse]
+                case While() | For() | ForEach() | Scope():
+                    pending.append(node.body)
+
+
+def walk(body:list[Statement]):
+    # every statement in body (including the init and step of for loops)
+    for statements in bodies(body):
+        for node in statements:
+            yield node
+            if isinstance(node, For):
+                if node.init != None:
+                    yield node.init
+                if node.step != None:
+                    yield node.step
+
+
+def expression_names(node:Node):
+    # the dotted names used in an expression. Members of anything that
+    # is not just a name (get().x) and the functions that operators
+    # become are given as ".name"
+    pending = [node]
+    while len(pending) > 0:
+        node = pending.pop()
+        match node:
+            case Name():
+                yield node.name
+            case UnaryOp():
+                if "unary " + node.op in OPERATOR_FUNCTIONS:
+                    yield "." + OPERATOR_FUNCTIONS["unary " + node.op]
+                pending.append(node.operand)
+            case BinaryOp():
+                yield "." + OPERATOR_FUNCTIONS[node.op]
+                pending += [node.left, node.right]
+            case Call():
+                pending.append(node.function)
+                pending += node.args
+            case Keyword():
+                pending.append(node.value)
+            case Member():
+                yield "." + node.name
+                pending.append(node.value)
+            case Index():
+                yield ".getElement"
+                pending += [node.value, node.index]
+            case Splice():
+                yield ".splice"
+                pending += [node.value, node.start, node.end]
+            case ArrayLiteral():
+                pending += node.items
+
+
+def expression_nodes(node:Node):
+    # every node of an expression (including node itself)
+    pending = [node]
+    while len(pending) > 0:
+        node = pending.pop()
+        if node == None:
+            continue
+        yield node
+        match node:
+            case UnaryOp():
+                pending.append(node.operand)
+            case BinaryOp():
+                pending += [node.left, node.right]
+            case Call():
+                pending.append(node.function)
+                pending += node.args
+            case Keyword():
+                pending.append(node.value)
+            case Member():
+                pending.append(node.value)
+            case Index():
+                pending += [node.value, node.index]
+            case Splice():
+                pending += [node.value, node.start, node.end]
+            case ArrayLiteral():
+                pending += node.items
+
+
+def statement_expressions(node:Statement):
+    # the expressions of a single statement (not the statements inside it)
+    match node:
+        case Declaration():
+            return [node.value]
+        case Assignment():
+            return [node.target, node.value]
+        case ExpressionStatement() | Return():
+            return [node.value]
+        case If() | While() | For():
+            return [node.condition]
+        case ForEach():
+            return [node.iterable]
+    return []
+
+
+def literal_type(value:str):
+    # the type of a literal as it is written
+    if value[0] == '"':
+        return "String"
+    if value[0] == "'":
+        return "char"
+    if "." in value:
+        return "float"
+    return "int"
+
+
+def type_name(tokens:list[str]):
+    # the (dotted) name of the class in the type of a declaration
+    return "".join([x for x in tokens if x not in ["[", "]", "private", "public", "protected", "static"]])
+
+
+def statement_names(node:Statement):
+    # the dotted names used by a single statement (not the statements inside it)
+    match node:
+        case Declaration():
+            yield type_name(node.type)
+            yield from expression_names(node.value)
+        case Assignment():
+            if node.op in COMPOUND_OPERATORS:
+                yield "." + OPERATOR_FUNCTIONS[COMPOUND_OPERATORS[node.op]]
+            if isinstance(node.target, Index):
+                yield ".setElement"
+            yield from expression_names(node.target)
+            yield from expression_names(node.value)
+        case ExpressionStatement() | Return():
+            yield from expression_names(node.value)
+        case If() | While() | For():
+            yield from expression_names(node.condition)
+        case ForEach():
+            if isinstance(node.target, Declaration):
+                yield from statement_names(node.target)
+            yield from expression_names(node.iterable)
+        case Raw():
+            # every dotted name in the tokens
+            yield from re.findall(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*", " ".join([x for x in node.tokens if isinstance(x, str)]).replace(" . ", "."))
+
+
+def expression_tokens(node:Node, precedence:int=0):
+    # the tokens of an expression, split the same way the Lexer splits them.
+    # parentheses are only put where precedence needs them.
+    # names that were numbered are written as their variables (#N)
+    match node:
+        case Name():
+            if node.variable != None:
+                return [variable_text(node.variable)]
+            result = []
+            for part in node.name.split("."):
+                result += [part, "."]
+            return result[:-1]
+        case Literal():
+            if node.value[0].isdigit() and "." in node.value:
+                whole, fraction = node.value.split(".", 1)
+                return [whole, ".", fraction]
+            return [node.value]
+        case UnaryOp():
+            result = [node.op] if node.op == "new" else list(node.op)
+            result += expression_tokens(node.operand, UNARY_PRECEDENCE)
+            inner = UNARY_PRECEDENCE
+        case BinaryOp():
+            inner = BINARY_PRECEDENCE[node.op]
+            result = expression_tokens(node.left, inner) + list(node.op) + expression_tokens(node.right, inner + 1)
+        case Call():
+            result = expression_tokens(node.function, POSTFIX_PRECEDENCE) + ["("]
+            for i in range(len(node.args)):
+                if i > 0:
+                    result.append(",")
+                result += expression_tokens(node.args[i])
+            return result + [")"]
+        case Keyword():
+            return [node.name, "="] + expression_tokens(node.value)
+        case Member():
+            return expression_tokens(node.value, POSTFIX_PRECEDENCE) + [".", node.name]
+        case Index():
+            return expression_tokens(node.value, POSTFIX_PRECEDENCE) + ["["] + expression_tokens(node.index) + ["]"]
+        case Splice():
+            result = expression_tokens(node.value, POSTFIX_PRECEDENCE) + ["["]
+            if node.start != None:
+                result += expression_tokens(node.start)
+            result.append(":")
+            if node.end != None:
+                result += expression_tokens(node.end)
+            return result + ["]"]
+        case ArrayLiteral():
+            result = ["["]
+            for i in range(len(node.items)):
+                if i > 0:
+                    result.append(",")
+                result += expression_tokens(node.items[i])
+            return result + ["]"]
+
+    if inner < precedence:
+        return ["("] + result + [")"]
+    return result
+
+
+def statement_tokens(node:Statement):
+    # the tokens of a simple statement (one that fits on a line)
+    match node:
+        case Declaration():
+            result = node.type + [node.name if node.variable == None else variable_text(node.variable)]
+            if node.value != None:
+                result += ["="] + expression_tokens(node.value)
+            return result
+        case Assignment():
+            return expression_tokens(node.target) + list(node.op) + expression_tokens(node.value)
+        case ExpressionStatement():
+            return expression_tokens(node.value)
+        case Return():
+            if node.value == None:
+                return ["return"]
+            return ["return"] + expression_tokens(node.value)
+        case Break():
+            return ["break"]
+        case Continue():
+            return ["continue"]
+        case Raw():
+            return node.tokens.copy()
+
+
+def is_declaration(tokens:list[str]):
+    # whether tokens are a type followed by a name.
+    # the type can end in a word, *, or ]
+    if len(tokens) < 2 or "(" in tokens or not WORD.match(tokens[-1]):
+        return False
+    the_equal = len(tokens)
+    j = 0
+    words = 0
+    while j < the_equal:
+        # look for *, ], or a word followed by a word other than .
+        if tokens[j] == "*":
+            # next can be either *, a word, [, or ]
+            words = 0
+            if j + 1 < the_equal:
+                if tokens[j+1] not in ["*", "[", "]"]:
+                    return True
+        elif tokens[j] == "[":
+            # skip until "]"
+            words = 0
+            while j < the_equal and tokens[j] != "]":
+                j += 1
+            j -= 1
+        elif tokens[j] == "]":
+            # next can be [, =, or another word
+            words = 0
+            if j + 1 < the_equal:
+                if tokens[j+1] not in ["[", "="]:
+                    return True
+        elif WORD.match(tokens[j]):
+            # this is a word (operators and literals are not)
+            words += 1
+        else:
+            # reset word counter
+            words = 0
+
+        j += 1
+
+        if words == 2:
+            return True
+    return False
+
+
+def find_assignment(tokens:list[str]):
+    # the index of the = of an assignment (outside of any brackets),
+    # and the operator it is part of (=, +=, <<=, ...). None, None if there is none
+    inside = 0
+    j = 0
+    m = len(tokens)
+    while j < m:
+        if tokens[j] in ["(", "["]:
+            inside += 1
+        elif tokens[j] in [")", "]"]:
+            inside -= 1
+        elif tokens[j] == "=" and inside == 0:
+            if j + 1 < m and tokens[j+1] == "=":
+                # ==
+                j += 2
+                continue
+            # the longest compound operator that ends here (the Lexer splits them up)
+            for size in [2, 1]:
+                if j >= size and "".join(tokens[j-size:j+1]) in COMPOUND_OPERATORS:
+                    return j, "".join(tokens[j-size:j+1])
+            if j == 0 or tokens[j-1] not in ["!", "<", ">", "="]:
+                return j, "="
+            # otherwise this is a comparison (<=, >=, !=)
+        j += 1
+    return None, None
+
+
+class ExpressionParser:
+    """
+    Reads an expression from a list of tokens (by precedence climbing).
+    Raises ValueError if the tokens are not exactly one expression.
+    """
+    def __init__(self, tokens:list[str]):
+        self.tokens = tokens
+        self.i = 0
+
+    def parse(self):
+        result = self.expression(0)
+        if self.i != len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.i]}")
+        return result
+
+    def peek(self, offset:int=0):
+        if self.i + offset < len(self.tokens):
+            return self.tokens[self.i + offset]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token == None:
+            raise ValueError("Unexpected end of expression")
+        self.i += 1
+        return token
+
+    def expect(self, token:str):
+        if self.next() != token:
+            raise ValueError(f"Expected {token}")
+
+    def operator(self):
+        # the binary operator at i (which can be split over two tokens), and how many tokens it takes
+        token = self.peek()
+        if token == None:
+            return None, 0
+        after = self.peek(1)
+        if after != None:
+            for spelling in SPLIT_OPERATORS:
+                if token == spelling[0] and after == spelling[1]:
+                    return spelling, 2
+        if token in BINARY_PRECEDENCE:
+            return token, 1
+        return None, 0
+
+    def expression(self, precedence:int):
+        left = self.unary()
+        while True:
+            op, size = self.operator()
+            if op == None or BINARY_PRECEDENCE[op] < precedence:
+                return left
+            self.i += size
+            # every binary operator is left associative
+            right = self.expression(BINARY_PRECEDENCE[op] + 1)
+            left = BinaryOp(op, left, right)
+
+    def unary(self):
+        if self.peek() in UNARY_OPERATORS:
+            op = self.next()
+            return UnaryOp(op, self.unary())
+        return self.postfix(self.primary())
+
+    def primary(self):
+        token = self.next()
+        if token == "(":
+            result = self.expression(0)
+            self.expect(")")
+            return result
+        if token == "[":
+            return ArrayLiteral(self.arguments("]"))
+        if token[0] in ['"', "'"]:
+            return Literal(token)
+        if token[0].isdigit():
+            # floats are split into 2 . 5
+            if self.peek() == "." and self.peek(1) != None and self.peek(1)[0].isdigit():
+                self.i += 2
+                return Literal(token + "." + self.tokens[self.i - 1])
+            return Literal(token)
+        if WORD.match(token):
+            name = token
+            while self.peek() == "." and self.peek(1) != None and WORD.match(self.peek(1)):
+                name += "." + self.peek(1)
+                self.i += 2
+            return Name(name)
+        raise ValueError(f"Unexpected {token}")
+
+    def postfix(self, value:Node):
+        while True:
+            token = self.peek()
+            if token == "(":
+                self.i += 1
+                value = Call(value, self.arguments(")"))
+            elif token == "[":
+                self.i += 1
+                start = None
+                if self.peek() != ":":
+                    start = self.expression(0)
+                if self.peek() == ":":
+                    self.i += 1
+                    end = None
+                    if self.peek() != "]":
+                        end = self.expression(0)
+                    self.expect("]")
+                    value = Splice(value, start, end)
+                else:
+                    self.expect("]")
+                    value = Index(value, start)
+            elif token == "." and self.peek(1) != None and WORD.match(self.peek(1)):
+                value = Member(value, self.peek(1))
+                self.i += 2
+            else:
+                return value
+
+    def arguments(self, close:str):
+        # expressions separated by , up to close
+        result = []
+        if self.peek() == close:
+            self.i += 1
+            return result
+        while True:
+            if WORD.match(self.peek() or "") and self.peek(1) == "=" and self.peek(2) != "=":
+                name = self.next()
+                self.i += 1
+                result.append(Keyword(name, self.expression(0)))
+            else:
+                result.append(self.expression(0))
+            token = self.next()
+            if token == close:
+                return result
+            if token != ",":
+                raise ValueError(f"Expected , or {close}")
+
+
+class TreeBuilder:
+    """
+    Builds the syntax tree of a block from its lines.
+    The tokens of all of the lines are read as one stream, since a statement
+    does not always sit on a line of its own (for loop headers are split at the
+    semicolons, and a block can be opened and closed on one line).
+    A statement that cannot be read is kept as Raw.
+    """
+    def __init__(self, lines:list[Line]):
+        self.lines = lines
+        self.tokens = []
+        # the index of the line of each token
+        self.line_of = []
+        for i in range(len(lines)):
+            tokens = lines[i].copy_tokens()
+            self.tokens += tokens
+            self.line_of += [i] * len(tokens)
+        self.i = 0
+
+    def build(self):
+        body = self.statements()
+        while self.i < len(self.tokens):
+            # skip a } that closes nothing
+            self.i += 1
+            body += self.statements()
+        return body
+
+    def peek(self):
+        if self.i < len(self.tokens):
+            return self.tokens[self.i]
+        return None
+
+    def line_ends(self, j:int):
+        # whether token j is the last token of its line
+        return j + 1 == len(self.tokens) or self.line_of[j + 1] != self.line_of[j]
+
+    def statements(self):
+        # statements up to a } (or the end)
+        result = []
+        while self.peek() != None and self.peek() != "}":
+            result.append(self.statement())
+        return result
+
+    def statement(self):
+        start = self.i
+        line = self.lines[self.line_of[start]]
+        try:
+            result = self.compound(line)
+            if result == None:
+                result = self.simple(self.rest(), line)
+            return result
+        except ValueError:
+            # keep the rest of the line as it is
+            self.i = start
+            while not self.line_ends(self.i):
+                self.i += 1
+            self.i += 1
+            return Raw(self.tokens[start:self.i], line)
+
+    def compound(self, line:Line):
+        # statements with blocks (and return, break and continue). None for anything else
+        match self.peek():
+            case "{":
+                return Scope(self.block(), line)
+            case "if":
+                self.i += 1
+                condition = ExpressionParser(self.until_block()).parse()
+                body = self.block()
+                orelse = []
+                if self.peek() == "else":
+                    self.i += 1
+                    if self.peek() == "if":
+                        orelse = [self.statement()]
+                    else:
+                        orelse = self.block()
+                return If(condition, body, orelse, line)
+            case "while":
+                self.i += 1
+                condition = ExpressionParser(self.until_block()).parse()
+                return While(condition, self.block(), line)
+            case "for":
+                self.i += 1
+                header = self.until_block()
+                if len(header) > 1 and header[0] == "(" and header[-1] == ")" and "in" not in header:
+                    return self.for_loop(header, line)
+                if len(header) > 1 and header[0] == "(" and header[-1] == ")":
+                    header = header[1:-1]
+                if "in" not in header:
+                    raise ValueError("Expected in")
+                split = header.index("in")
+                target = header[:split]
+                if is_declaration(target):
+                    target = Declaration(target[:-1], target[-1], None, line)
+                else:
+                    target = ExpressionParser(target).parse()
+                iterable = ExpressionParser(header[split+1:]).parse()
+                return ForEach(target, iterable, self.block(), line)
+            case "return":
+                self.i += 1
+                value = None
+                tokens = self.rest()
+                if len(tokens) > 0:
+                    value = ExpressionParser(tokens).parse()
+                return Return(value, line)
+            case "break":
+                self.i += 1
+                self.rest()
+                return Break(line)
+            case "continue":
+                self.i += 1
+                self.rest()
+                return Continue(line)
+        return None
+
+    def for_loop(self, header:list[str], line:Line):
+        # the three parts of the header were put on lines of their own by the semicolons
+        parts = [[]]
+        for j in range(self.header_start, self.header_start + len(header) - 2):
+            parts[-1].append(self.tokens[j + 1])
+            if self.line_ends(j + 1) and len(parts) < 3:
+                parts.append([])
+        if len(parts) != 3:
+            raise ValueError("Expected for (init; condition; step)")
+        init = self.simple(parts[0], line) if len(parts[0]) > 0 else None
+        condition = ExpressionParser(parts[1]).parse() if len(parts[1]) > 0 else None
+        step = self.simple(parts[2], line) if len(parts[2]) > 0 else None
+        return For(init, condition, step, self.block(), line)
+
+    def until_block(self):
+        # the tokens up to the { that opens a block
+        self.header_start = self.i
+        inside = 0
+        while self.peek() != None:
+            token = self.peek()
+            if token in ["(", "["]:
+                inside += 1
+            elif token in [")", "]"]:
+                inside -= 1
+            elif token == "{" and inside == 0:
+                return self.tokens[self.header_start:self.i]
+            self.i += 1
+        raise ValueError("Expected {")
+
+    def block(self):
+        if self.peek() != "{":
+            raise ValueError("Expected {")
+        self.i += 1
+        result = self.statements()
+        if self.peek() != "}":
+            raise ValueError("Expected }")
+        self.i += 1
+        return result
+
+    def rest(self):
+        # the tokens up to the end of the line (or a } that closes the block).
+        # brackets that are still open carry on to the next line
+        start = self.i
+        inside = 0
+        while self.peek() != None:
+            token = self.peek()
+            if token in ["(", "["]:
+                inside += 1
+            elif token in [")", "]"]:
+                inside -= 1
+            elif token == "}" and inside <= 0:
+                break
+            self.i += 1
+            if inside <= 0 and self.line_ends(self.i - 1):
+                break
+        return self.tokens[start:self.i]
+
+    def simple(self, tokens:list[str], line:Line):
+        # a declaration, an assignment or an expression
+        if len(tokens) == 0:
+            raise ValueError("Expected a statement")
+        the_equal, op = find_assignment(tokens)
+        if the_equal != None:
+            target = tokens[:the_equal + 1 - len(op)]
+            value = ExpressionParser(tokens[the_equal+1:]).parse()
+            if op == "=" and is_declaration(target):
+                return Declaration(target[:-1], target[-1], value, line)
+            return Assignment(ExpressionParser(target).parse(), op, value, line)
+        if is_declaration(tokens):
+            return Declaration(tokens[:-1], tokens[-1], None, line)
+        return ExpressionStatement(ExpressionParser(tokens).parse(), line)
+
+
+class Lexer:
+    """
+    Single pass tokenizer.
+    Emits the same token stream as Compiler.legacy_tokenize without walking the
+    source one character at a time. Depending on the state (code, quotes or
+    comment), a precompiled regex jumps straight to the next character that can
+    change that state. Everything in between is sliced out by its span, and plain
+    code is split into tokens with a single findall.
+    The state is kept between calls to feed(), so the source can also be given
+    in pieces, as long as each piece ends with a newline.
+    """
+
+    # break characters that end up as tokens of their own
+    SYMBOLS = "\n*$#.,[]<>&|~^()@%/=+-;'\"{}:"
+    BREAK_SET = frozenset(SYMBOLS + " \t")
+
+    WORD = f"[^{re.escape(SYMBOLS)} \t]+"
+    TOKEN = re.compile(f"{WORD}|[{re.escape(SYMBOLS)}]")
+    WORD_TAIL = re.compile(f"{WORD}\\Z")
+
+    # the characters that can change the state of the tokenizer
+    CODE_STOP = re.compile(r'["/@{}\n]')
+    QUOTES_STOP = re.compile(r'["}\n]')
+    COMMENT_STOP = re.compile(r'["/@}\n]')
+
+    def __init__(self):
+        self.current_token = ""
+        self.quotes = 0
+        self.comment = 0
+        self.multi = 0
+        self.doc = 0
+        self.current_line = 1
+        # how many tokens given back by earlier calls to feed were taken back
+        self.dropped = 0
+
+    def tokenize(self, data:str):
+        debug("Tokenizing the source file...")
+
+        result = self.feed(data)
+        result += self.finish()
+
+        debug("Comments are now removed!")
+        debug("Finished tokenizing!")
+
+        return result
+
+    def tokenize_stream(self, chunks):
+        # tokenize the source one piece at a time, giving back tokens as they are found
+        debug("Tokenizing the source file as a stream...")
+
+        # the last token of a piece is held back, since the next piece can still take it back
+        held = []
+        for chunk in chunks:
+            tokens = self.feed(chunk)
+            if self.dropped > 0:
+                del held[-self.dropped:]
+                self.dropped = 0
+            yield from held
+            held = tokens[-1:]
+            yield from tokens[:-1]
+        yield from held
+        yield from self.finish()
+
+        debug("Finished tokenizing!")
+
+    def finish(self):
+        # give back the token that was still being built when the source ended
+        result = []
+        if self.current_token != "":
+            result.append(self.current_token)
+            self.current_token = ""
+        return result
+
+    def feed(self, data:str):
+        breaks = self.BREAK_SET
+        result = []
+        append = result.append
+        current_token = self.current_token
+        quotes = self.quotes
+        comment = self.comment
+        multi = self.multi
+        doc = self.doc
+
+        current_line = self.current_line
+        n = len(data)
+        i = 0
+
+        while i < n:
+            start = i
+            if quotes:
+                stop = self.QUOTES_STOP.search(data, i)
+                i = n if stop == None else stop.start()
+                current_token += data[start:i]
+            elif comment:
+                stop = self.COMMENT_STOP.search(data, i)
+                i = n if stop == None else stop.start()
+                if i > start:
+                    # nothing in a comment is kept, except for the word right before the stop
+                    tail = self.WORD_TAIL.search(data, start, i)
+                    if tail == None:
+                        current_token = ""
+                    elif tail.start() == start:
+                        current_token += tail.group()
+                    else:
+                        current_token = tail.group()
+            else:
+                stop = self.CODE_STOP.search(data, i)
+                i = n if stop == None else stop.start()
+                if i > start:
+                    tokens = self.TOKEN.findall(data, start, i)
+                    if len(current_token) > 0:
+                        if len(tokens) > 0 and data[start] not in breaks:
+                            tokens[0] = current_token + tokens[0]
+                        else:
+                            append(current_token)
+                        current_token = ""
+                    # a word directly before the stop may still be changed by it
+                    if len(tokens) > 0 and data[i-1] not in breaks:
+                        current_token = tokens.pop()
+                    result += tokens
+
+            if i == n:
+                break
+
+            c = data[i]
+
+            # newlines and braces in plain code do not change the state
+            if not quotes and not comment and (c == "\n" or ((c == "{" or c == "}") and not doc)):
+                if len(current_token) > 0:
+                    append(current_token)
+                    current_token = ""
+                append(c)
+                if c != "\n":
+                    append("\n")
+                append(f"`{current_line}")
+                if c == "\n":
+                    current_line += 1
+                i += 1
+                continue
+
+            # toggle whether or not we are in quotes
+            if c == '"':
+                if not (i > 0 and n > i + 1 and data[i-1] == "'" and data[i+1] == "'"):
+                    quotes ^= 1
+
+            if not quotes:
+                # toggle whether or not we are in a comment
+                if c == "/":
+                    if n > i + 1 and data[i+1] == "*":
+                        if comment == 0:
+                            multi = 1
+                        comment = 1
+                    if i > 0:
+                        if data[i-1] == "*":
+                            if multi:
+                                comment = 0
+                                multi = 0
+                                i += 1
+                                continue
+                        elif data[i-1] == "/":
+                            if not multi:
+                                comment = 1
+                                multi = 0
+                elif c == "@":
+                    if n > i + 1:
+                        if comment == 0:
+                            multi = 1
+                        comment = 1
+                        doc = 1
+
+            # you found the end of a documentation block
+            if c == "}" and doc:
+                multi = 0
+                comment = 0
+                doc = 0
+                i += 1
+                continue
+
+            if quotes:
+                current_token += c
+            else:
+                if len(current_token) > 0:
+                    if c == '"':
+                        current_token += '"'
+                    if not comment:
+                        append(current_token)
+
+                if c == "\n":
+                    if comment:
+                        if not multi:
+                            comment = 0
+                            if len(result) > 0:
+                                del result[-1]
+                            else:
+                                # the token was given back by an earlier call
+                                self.dropped += 1
+                            append(c)
+                    else:
+                        append(c)
+                elif c == "{" or c == "}":
+                    if not comment:
+                        append(c)
+                        append("\n")
+                        append(f"`{current_line}")
+                elif c != '"':
+                    if not comment:
+                        append(c)
+
+                current_token = ""
+
+            # save the line number for error messages
+            if c == "\n":
+                append(f"`{current_line}")
+                current_line += 1
+
+            i += 1
+
+        self.current_token = current_token
+        self.quotes = quotes
+        self.comment = comment
+        self.multi = multi
+        self.doc = doc
+        self.current_line = current_line
+
+        return result
+
+
+# token kinds used by the TokenStore
+TOKEN_WORD = 0
+TOKEN_SYMBOL = 1
+TOKEN_STRING = 2
+TOKEN_NEWLINE = 3
+TOKEN_LINE_NUMBER = 4
+
+
+class TokenStore:
+    """
+    Compact storage for a token stream.
+    Instead of a list of separate strings, each token is a kind, a [start, end)
+    span into the source and an index into a table of interned strings, all
+    kept in flat arrays. Equal tokens (every "(", every use of a variable name)
+    share a single string.
+    The line each token starts on is kept in a parallel table, so the stream
+    itself only holds real tokens.
+    """
+    def __init__(self, source:SourceFile):
+        self.source = source
+        self.kinds = array('H')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.ids = array('I')
+        self.strings = []
+        self.string_ids = {}
+        self._brace_pairs = None
+
+    @staticmethod
+    def token_kind(token:str):
+        if token == "\n":
+            return TOKEN_NEWLINE
+        if token[0] == '`':
+            return TOKEN_LINE_NUMBER
+        if token[0] == '"':
+            return TOKEN_STRING
+        if len(token) == 1 and token in Lexer.BREAK_SET:
+            return TOKEN_SYMBOL
+        return TOKEN_WORD
+
+    @classmethod
+    def from_tokens(cls, source:SourceFile, tokens:list[str]):
+        # build a store from a plain token stream.
+        # the saved line numbers from the tokenizer go into the line table
+        # instead of the stream. They also tell where to start looking for
+        # the span of the next tokens in the source.
+        # newlines get an empty span, since some of them were inserted
+        store = cls(source)
+        line_starts = source.line_starts()
+
+        position = 0
+        line_number = 1
+        # the token before the last one (the tokenizer also puts a newline and a
+        # line number after every brace, but the line goes on after those)
+        before = None
+        last = None
+        for token in tokens:
+            kind = cls.token_kind(token)
+            if kind == TOKEN_LINE_NUMBER:
+                if before not in ["{", "}"] or last != "\n":
+                    line_number = int(token[1:]) + 1
+                    if line_number <= len(line_starts):
+                        position = max(position, line_starts[line_number-1])
+                continue
+            before, last = last, token
+            start = position
+            if kind != TOKEN_NEWLINE:
+                found = source.find(token, position)
+                if found != -1:
+                    start = found
+                    position = found + source.length(token)
+            store.append(kind, token, start, max(start, position), line_number)
+        return store
+
+    def intern(self, token:str):
+        index = self.string_ids.get(token)
+        if index == None:
+            index = len(self.strings)
+            self.strings.append(token)
+            self.string_ids[token] = index
+        return index
+
+    def append(self, kind:int, token:str, start:int, end:int, line_number:int=0):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line_number)
+        self.ids.append(self.intern(token))
+
+    def brace_pairs(self):
+        # the index of the matching brace for every matched { and },
+        # found with a single pass over the stream
+        if self._brace_pairs == None:
+            self._brace_pairs = {}
+            kinds = self.kinds
+            ids = self.ids
+            opener = self.string_ids.get("{")
+            closer = self.string_ids.get("}")
+            opens = []
+            for i in range(len(ids)):
+                if kinds[i] != TOKEN_SYMBOL:
+                    continue
+                if ids[i] == opener:
+                    opens.append(i)
+                elif ids[i] == closer and len(opens) > 0:
+                    j = opens.pop()
+                    self._brace_pairs[j] = i
+                    self._brace_pairs[i] = j
+        return self._brace_pairs
+
+    def position(self, i:int):
+        # the (line, column) of a token, both starting at 1
+        line_number = self.lines[i]
+        return line_number, self.starts[i] - self.source.line_starts()[line_number-1] + 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def text(self, i:int):
+        return self.strings[self.ids[i]]
+
+    def texts(self, start:int, end:int):
+        strings = self.strings
+        return [strings[x] for x in self.ids[start:end]]
+
+    def __iter__(self):
+        strings = self.strings
+        for x in self.ids:
+            yield strings[x]
+
+
+def find_block_end(lines:list[Line], i:int, n:int):
+    # lines[i] opens a block with the { at its end.
+    # get the index of the line (before n) with the matching },
+    # or n if the block is never closed
+    opener = lines[i]
+    if opener.store == None or opener.end <= opener.start or opener.store.text(opener.end - 1) != "{":
+        return n
+    close = opener.store.brace_pairs().get(opener.end - 1)
+    if close == None:
+        return n
+    j = bisect_right(lines, close, i + 1, n, key=lambda x: x.start) - 1
+    if j <= i or lines[j].store != opener.store or close >= lines[j].end:
+        return n
+    return j
+
+
+class ImportResolver:
+    """
+    Keeps track of the files of one build.
+    Every file is known by its canonical path (os.path.realpath), so the same file
+    reached through different relative paths is only imported once. Import
+    statements are resolved once per directory, and the import graph is
+    kept so that circular imports can be reported.
+    """
+    def __init__(self):
+        # filename : canonical path
+        self.canonicals = {}
+        # (directory, import path) : (filename, import path)
+        self.resolved = {}
+        # canonical paths of the files imported so far
+        self.seen = set()
+        # filenames in the order they were imported
+        self.files = []
+        # canonical path : canonical paths of the files it imports
+        self.graph = {}
+        # filename : SourceFile of every file of the build (to show the lines of errors)
+        self.sources = {}
+
+    def canonical(self, filename:str):
+        result = self.canonicals.get(filename)
+        if result == None:
+            result = os.path.realpath(filename)
+            self.canonicals[filename] = result
+        return result
+
+    def add(self, filename:str, source:SourceFile=None):
+        # mark a file as imported. Returns False if it already was
+        if source != None:
+            self.sources[filename] = source
+        key = self.canonical(filename)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        self.files.append(filename)
+        return True
+
+    def resolve(self, filename:str, curr:list[str]):
+        # get the path of the file an import statement in filename refers to
+        # (and the path as it was written)
+        the_path = curr[1:]
+        directory = filename.rpartition("/")[0]
+        key = (directory, tuple(the_path))
+        result = self.resolved.get(key)
+        if result == None:
+            result = (self.join(directory, the_path), the_path)
+            self.resolved[key] = result
+        return result
+
+    def join(self, directory:str, the_path:list[str]):
+        # first, see how many .'s prepend the first directory/file
+        dots = 0
+        for x in the_path:
+            if x == '.':
+                dots += 1
+            else:
+                break
+        path_start = dots
+
+        this_path = directory.split("/")
+        while this_path[-1] not in [".", ".."] and dots > 0:
+            del this_path[-1]
+            dots -= 1
+
+        for x in range(dots):
+            this_path.append("..")
+
+        for j in range(path_start, len(the_path)):
+            this_path.append(the_path[j])
+
+        # join the path back
+        this_path = [x for x in this_path if x != "."]
+        return "/".join(this_path) + ".tcab"
+
+    def add_imports(self, module):
+        # add the imports of a preprocessed file to the import graph
+        self.graph[self.canonical(module.filename)] = [self.canonical(this_path) for this_path, the_path in module.import_paths]
+
+    def cycles(self):
+        # the groups of files that import each other (directly or not).
+        # (Tarjan's strongly connected components, without recursion)
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        result = []
+        for start in self.graph:
+            if start in index:
+                continue
+            index[start] = low[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            work = [(start, iter(self.graph[start]))]
+            while len(work) > 0:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.graph.get(child, []))))
+                        break
+                    if child in on_stack:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if len(work) > 0:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        group = []
+                        while True:
+                            x = stack.pop()
+                            on_stack.discard(x)
+                            group.append(x)
+                            if x == node:
+                                break
+                        if len(group) > 1 or node in self.graph.get(node, []):
+                            result.append(group[::-1])
+        return result
+
+    def report_cycles(self):
+        for group in self.cycles():
+            debug(f"Circular import: {' -> '.join(group + group[:1])}")
+
 
 class Compiler:
-    def __init__(self, filename:str, imports:list[str]=[], relation:str=""):
+    def __init__(self, filename:str, resolver:ImportResolver=None, relation:str="", follow_imports:bool=True):
         self.EXCEPTIONS = []
-        self.imports = imports
+        # the file that started a build owns the resolver
+        owner = resolver == None
+        if owner:
+            resolver = ImportResolver()
+        self.resolver = resolver
         self.relation = relation
+        self.follow_imports = follow_imports
+        # the files whose classes link_imports put into this one
+        self.linked = None
 
         if filename[:2] != "./":
             filename = "./" + filename
-        self.imports.append(filename)
+        self.resolver.add(filename)
         self.filename = filename
-        self.data = self.open_file(self.filename)
-        self.tokens = self.tokenize(self.data)
-        self.handle_broken_lines()
-        self.remove_semicolons()
+        self.store = None
+        if STREAM_SOURCE:
+            self.source = self.map_file(self.filename)
+            self.data = self.source.data
+        else:
+            self.data = self.open_file(self.filename)
+            self.source = SourceFile(self.filename, self.data)
+        self.resolver.sources[self.filename] = self.source
+
+        self.cache = None
+        if CACHE_DIR != None:
+            self.cache = ModuleCache(CACHE_DIR)
+            if self.cache.load(self):
+                debug(f"Loaded {self.filename} from the cache")
+                self.import_modules()
+                if owner:
+                    self.resolver.report_cycles()
+                return
+
+        if STREAM_SOURCE:
+            # nothing is tokenized until preprocess pulls on this
+            self.tokens = self.filter_tokens(Lexer().tokenize_stream(self.source.chunks()))
+        else:
+            self.tokens = self.filter_tokens(self.tokenize(self.data))
         self.preprocess()
+        if owner:
+            self.resolver.report_cycles()
+
+    @property
+    def imports(self):
+        # the files of the build, in the order they were imported
+        return self.resolver.files
 
     def open_file(self, filename:str):
         debug("Attempting to open the file...")
@@ -184,30 +1901,37 @@ class Compiler:
         debug("Finished reading file!")
         return data 
 
+    def map_file(self, filename:str):
+        debug("Attempting to map the file...")
+        try:
+            source = SourceFile.map(filename)
+        except OSError:
+            print(f"Error opening file {filename}")
+            print(f"Please make sure this file exists or download any required dependencies first.")
+            exit()
+        debug("Finished mapping file!")
+        return source
+
 
     def add_error(self, file:str, line: Line, error_type: str, cause: str, suggestions: str):
         result = ErrorMessage()
         result.file = file
         result.type = error_type
         result.line_number = self.parse_line_number(line)
-        if result.line_number == "0":
-            result.line = "ERROR while fetching line"
-        else:
-            try:
-                result.line = self.data.split("\n")[int(result.line_number)]
-            except:
-                result.line = "ERROR while fetching line"
+        result.source = self.resolver.sources.get(file)
         result.cause = cause
         result.suggestions = suggestions
         self.EXCEPTIONS.append(result)
 
     def parse_line_number(self, line: Line):
-        if len(line.tokens) > 0:
-            if len(line.tokens[0]) > 0 and line.tokens[0][0] == '`':
-                return line.tokens[0][1:]
-        return "0"
+        return str(line.line_number)
+
+    def tokenize(self, data:str):
+        if LEGACY_TOKENIZER:
+            return self.legacy_tokenize(data)
+        return Lexer().tokenize(data)
 
-    def tokenize(self, lines:list[str]):
+    def legacy_tokenize(self, lines:list[str]):
         debug("Tokenizing the source file...")
 
         break_tokens = ["\n", "*", "$", "#", ".", ",", "[", "]", "<", ">", "&", "|", "\t", " ", "~", "^", "(", ")", "@", "%", "/", "=", "+", "-", ";", "'", '"', "{", "}", ":"]
@@ -330,55 +2054,46 @@ class Compiler:
         return result
 
 
-    def handle_broken_lines(self):
-        # handle lines that are broken
-        # onto multiple lines using \
-        # at the end of a line
-        
-        debug("Handling lines broken with \\ ...")
-        # do this by finding "//" token directly before \n token
-        quotes = 0
-
-        i = 0
-        n = len(self.tokens)
-        while i < n:
-            if self.tokens[i] == '"':
-                quotes ^= 1
-                quotes &= 1
-            if self.tokens[i] == '\n' and i > 0:
-                if self.tokens[i-1] == '\\':
-                    del self.tokens[i-1]
-                    del self.tokens[i-1]
-                    i -= 1
-                    n -= 2
-                    continue
-            i += 1
-        debug("Broken lines have been handled!")
-
-
-    def remove_semicolons(self):
-        # remove all semicolons.
+    def filter_tokens(self, tokens):
+        # remove lines broken onto multiple lines using \ at the end of a line,
+        # and semicolons, in a single pass over the token stream.
         # can ignore whether or not we are in quotes since
         # strings are tokenized together
-        debug("Removing semicolons...")
-        i = 0
-        n = len(self.tokens)
-        while i < n:
-            if self.tokens[i] == ";":
-                if n > i + 1:
-                    # if the semicolon separates two statements
-                    if self.tokens[i+1] != "\n":
-                        self.tokens[i] = "\n"
-                        i += 1
-                        continue
-                # otherwise, just remove the semicolon
-                del self.tokens[i]
-                i -= 1
-                n -= 1
-            i += 1
-        debug("Semicolons have been removed!")
+        debug("Handling lines broken with \\ and removing semicolons...")
+
+        # \ tokens are held back until it is known whether a newline follows them
+        held = 0
+        semicolon = False
+        for token in chain(tokens, [None]):
+            if token == "\\":
+                held += 1
+                continue
+            if token == "\n" and held > 0:
+                held -= 1
+                continue
+
+            if held > 0:
+                if semicolon:
+                    yield "\n"
+                    semicolon = False
+                for x in range(held):
+                    yield "\\"
+                held = 0
+
+            if token == None:
+                break
+
+            # if the semicolon separates two statements, it becomes a newline.
+            # otherwise, just remove the semicolon
+            if semicolon and token != "\n":
+                yield "\n"
+            semicolon = token == ";"
+            if not semicolon:
+                yield token
+
+        debug("Broken lines and semicolons have been handled!")
+
 
-    
     def check_variable_name(self, line:Line, var_name:str):
         # check to make sure that a variable name follows naming standards
         
@@ -397,21 +2112,21 @@ class Compiler:
 
         result = []
 
+        # move the tokens into a compact store. Lines only refer to a range of it
+        self.store = TokenStore.from_tokens(self.source, self.tokens)
+        self.tokens = []
+        kinds = self.store.kinds
+
         i = 0
-        n = len(self.tokens)
+        n = len(self.store)
 
-        curr_line = []
+        line_start = 0
         while i < n:
-            if self.tokens[i] == "\n":
-                # ignore lines with nothing on them (except for the line number)
-                if len(curr_line) == 1 and len(curr_line[0]) > 0 and curr_line[0][0] == "`":
-                    pass
-                else:
-                    if len(curr_line) != 0:
-                        result.append(Line(curr_line))
-                curr_line = []
-            else:
-                curr_line.append(self.tokens[i])
+            if kinds[i] == TOKEN_NEWLINE:
+                # ignore lines with nothing on them
+                if i - line_start != 0:
+                    result.append(Line(store=self.store, start=line_start, end=i))
+                line_start = i + 1
 
             i += 1
         
@@ -419,23 +2134,25 @@ class Compiler:
 
         self.classes = []
 
-        global_scope = [1] * len(result)
+        # the lines that are not in any class
+        global_lines = []
+
+        # the classes that are open at the current line (innermost last),
+        # with the line each of them ends on. Every line goes to the class
+        # that is innermost when it is reached, so that subclasses are not
+        # part of their parent's lines
+        scopes = []
 
         # now we should convert some of those lines into classes
         i = 0
         n = len(result)
         while i < n:
-            # first, remove all saved line numbers
-            curr = result[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            while len(scopes) > 0 and scopes[-1][1] < i:
+                scopes.pop()
 
-            print(curr)
+            curr = result[i].copy_tokens()
+
+            debug(curr)
 
             m = len(curr)
             if m > 0:
@@ -481,45 +2198,18 @@ class Compiler:
                                         if curr[3] == "{":
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
-
-                                            new_class = Class(class_name, [], inner_lines)
-
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
-
+                                            new_class = Class(class_name, [], [])
 
                                             debug(f"Class {class_name} found!")
 
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
                                         elif curr[3] == "extends":
                                             # get all parent classes
@@ -535,45 +2225,18 @@ class Compiler:
                                             
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
-
-                                            new_class = Class(class_name, parent_classes, inner_lines)
-
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
-
+                                            new_class = Class(class_name, parent_classes, [])
 
                                             debug(f"Class {class_name} found!")
 
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
 
                                         
@@ -622,44 +2285,18 @@ class Compiler:
                                         if curr[3] == "{":
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
+                                            new_class = Class(class_name, [], [])
 
-                                            new_class = Class(class_name, [], inner_lines)
+                                            debug(f"Class {class_name} found!")
 
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
-
-                                            debug(f"Class {class_name} found!")
-
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
                                         elif curr[3] == "extends":
                                             # get all parent classes
@@ -675,44 +2312,18 @@ class Compiler:
                                             
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
-
-                                            new_class = Class(class_name, parent_classes, inner_lines)
-
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
+                                            new_class = Class(class_name, parent_classes, [])
 
                                             debug(f"Class {class_name} found!")
 
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
 
                                         
@@ -763,44 +2374,18 @@ class Compiler:
                                         if curr[2] == "{":
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
-
-                                            new_class = Class(class_name, [], inner_lines)
-
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
+                                            new_class = Class(class_name, [], [])
 
                                             debug(f"Class {class_name} found!")
 
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
                                         elif curr[2] == "extends":
                                             # get all parent classes
@@ -816,45 +2401,18 @@ class Compiler:
                                             
 
                                             # for now, just start gathering lines into a class block
-                                            # iterate through each token, trying to find the matching }
-                                            inner_lines = []
-
-                                            j = i + 1
-                                            number_of_lines = len(result)
-                                            opens = 1
-                                            # iterate through lines until the end of the file
-                                            while j < number_of_lines:
-                                                k = 0
-                                                tokens_len = len(result[j].tokens)
-                                                while k < tokens_len:
-                                                    if result[j].tokens[k] == "{":
-                                                        opens += 1
-                                                    elif result[j].tokens[k] == "}":
-                                                        opens -= 1
-
-                                                    if opens == 0:
-                                                        break
-                                                    k += 1
-                                                if opens == 0:
-                                                    break
-                                                j += 1
+                                            # look up the line with the matching }
+                                            j = find_block_end(result, i, len(result))
 
                                             # if the class definition was never closed
-                                            if opens != 0:
+                                            if j == len(result):
                                                 self.add_error(self.filename, result[i], "SYNTAX", "'{' was never closed...", "Find the appropriate place to close it and put '}'")
                                             
-                                            inner_lines = result[i:j+1]
-
-                                            new_class = Class(class_name, parent_classes, inner_lines)
-
-                                            # update the global scope
-                                            for k in range(i, j+1):
-                                                global_scope[k] = 0
-
+                                            new_class = Class(class_name, parent_classes, [])
 
                                             debug(f"Class {class_name} found!")
 
-                                            self.classes.append(new_class)
+                                            self.nest_class(new_class, j, scopes)
                                             
 
                                         
@@ -871,110 +2429,66 @@ class Compiler:
                             
                     case default:
                         pass
+
+            if len(scopes) > 0:
+                scopes[-1][0].lines.append(result[i])
+            else:
+                global_lines.append(result[i])
+
             i += 1
             
-        # the classes should now all be gathered
+        # the classes should now all be gathered (with their subclasses)
         # now make sure that everything is inside of a class (except for imports and compiler directives)
         remaining_lines = []
 
-        for i in range(len(global_scope)):
+        for line in global_lines:
             # check each line in the global scope to make sure it is 
             # either an import or compiler directive
-            if global_scope[i]:
-                curr = result[i].tokens.copy()
-                j = 0
-                while j < len(curr):
-                    if len(curr[j]) > 0:
-                        if curr[j][0] == '`':
-                            del curr[j]
-                            j -= 1
-                    j += 1
-
-                n = len(curr)
-                if n < 1:
-                    self.add_error(self.filename, result[i], "SYNTAX", "Stray token found in global scope...", "Remove it.")
+            curr = line.copy_tokens()
 
-                else:
-                    if curr[0] == "import" or curr[0] == "#":
-                        remaining_lines.append(result[i])
-                    else:
-                        self.add_error(self.filename, result[i], "SYNTAX", "Only classes, import statments, or compiler directives are allowed in the global scope...", "Remove the offending statement or put it in a class.")
-
-        for x in self.classes:
-            x.file = self.filename
+            n = len(curr)
+            if n < 1:
+                self.add_error(self.filename, line, "SYNTAX", "Stray token found in global scope...", "Remove it.")
 
-        # we now have all global lines
-        # and all classes put into an array
-        # now we can further block each class
-        self.handle_subclasses()
+            else:
+                if curr[0] == "import" or curr[0] == "#":
+                    remaining_lines.append(line)
+                else:
+                    self.add_error(self.filename, line, "SYNTAX", "Only classes, import statments, or compiler directives are allowed in the global scope...", "Remove the offending statement or put it in a class.")
 
-        print("REMAINING LINES:")
-        [print(x) for x in remaining_lines]
+        debug("REMAINING LINES:")
+        [debug(x) for x in remaining_lines]
 
         # now we need to handle import statements.
         # all import statements must be in the global scope
         self.handle_imports(remaining_lines)
 
     
-    def handle_subclasses(self):
-        ends = []
-        classes = []
-        is_subclasses = []
-        for i in range(len(self.classes)):
-            start = int(self.parse_line_number(self.classes[i].lines[0]))
-            
-            is_subclass = 0
-
-            # iterate backwards through the possible superclasses
-            for j in range(len(classes)-1, -1, -1):
-                if start < ends[j]:
-                    classes[j].subclasses.append(self.classes[i])
-                    print(f"{classes[j]} has subclass {self.classes[i]}") 
-                    is_subclass = 1
-
-                    subclass_start = 0
-                    subclass_line_number = int(self.parse_line_number(self.classes[i].lines[0]))
-                    for x in classes[j].lines:
-                        curr_line_number = int(self.parse_line_number(x))
-                        if curr_line_number == subclass_line_number:
-                            break
-                        subclass_start += 1
-
-                    subclass_end = subclass_start + len(self.classes[i].lines) - 1
-                    
-                    classes[j].lines = classes[j].lines[0:subclass_start] + classes[j].lines[subclass_end+1:]
-
-                    break
-
-            end = int(self.parse_line_number(self.classes[i].lines[-1]))
-            ends.append(end)
-            classes.append(self.classes[i])
-            is_subclasses.append(is_subclass)
-
-        # remove classes from the global scope if they are subclasses
-        self.classes = [classes[x] for x in range(len(classes)) if is_subclasses[x] == 0]
+    def nest_class(self, new_class:Class, end:int, scopes:list):
+        # the class is either global or a subclass of the innermost class that is still open.
+        # it stays open until line end
+        new_class.file = self.filename
+        if len(scopes) > 0:
+            parent = scopes[-1][0]
+            parent.subclasses.append(new_class)
+            debug(f"class {parent.name} has subclass class {new_class.name}")
+        else:
+            self.classes.append(new_class)
+        scopes.append((new_class, end))
 
 
     def handle_imports(self, remaining:list[Line]):
         # To handle imports, simply include all of the code from that file
         # instead of just putting the code at the top, put it all in a class
         # with the same name as the file it is imported from
-        result = []
 
-        # rather than getting stuck in an infinite loop during a circular import,
-        # only import each unique filename once
+        # find the files this file imports (in order)
+        self.import_paths = []
         i = 0
         n = len(remaining)
         while i < n:
             # check each line to see if it is an import
-            curr = remaining[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = remaining[i].copy_tokens()
 
             m = len(curr)
 
@@ -986,57 +2500,91 @@ class Compiler:
                     n -= 1
 
                     debug("Handling import statement.")
-                    # if this is an import statement
+                    self.import_paths.append(self.resolver.resolve(self.filename, curr))
 
-                    # first, see how many .'s prepend the first directory/file
-                    the_path = curr[1:]
+            i += 1
 
-                    dots = 0
-                    for x in the_path:
-                        if x == '.':
-                            dots += 1
-                        else:
-                            break
-                    path_start = dots
-
-                    this_path = self.filename.split("/")[:-1]
-                    while this_path[-1] not in [".", ".."] and dots > 0:
-                        del this_path[-1]
-                        dots -= 1
-
-                    for x in range(dots):
-                        this_path.append("..")
-
-                    for j in range(path_start, len(the_path)):
-                        this_path.append(the_path[j])
-
-                    # join the path back
-                    j = 0
-                    while j < len(this_path):
-                        if this_path[j] == ".":
-                            del this_path[j]
-                            j -= 1
-                        j += 1
-                    this_path = "/".join(this_path)
-                    this_path += ".tcab"
-
-                    # this path should represent a file.
-                    # try to open the file in a new compiler object
-                    if "./" + this_path not in self.imports:
-                        debug(f"Creating new compiler object for {this_path}")
-                        new_compiler = Compiler(this_path, self.imports, the_path)
-                        # update your imports
-                        self.imports = new_compiler.imports
-                        result.append(new_compiler)
-
-                        # make imported classes not global (for access protection later)
-                        for x in range(len(new_compiler.classes)):
-                            new_compiler.classes[x].is_global = False
-                    else:
-                        debug("This file has already been imported... ignoring")
+        self.remaining_lines = remaining
 
+        # this file is now done, apart from what it imports
+        if self.cache != None:
+            self.cache.save(self)
 
-            i += 1
+        return self.import_modules()
+
+    def import_modules(self):
+        result = []
+        self.resolver.add_imports(self)
+
+        # when built by a BuildScheduler, the imported files are
+        # preprocessed elsewhere and linked in afterwards
+        if not self.follow_imports:
+            return result
+
+        # rather than getting stuck in an infinite loop during a circular import,
+        # only import each unique file once
+        for this_path, the_path in self.import_paths:
+            # this path should represent a file.
+            # try to open the file in a new compiler object
+            if self.resolver.canonical(this_path) not in self.resolver.seen:
+                debug(f"Creating new compiler object for {this_path}")
+                new_compiler = Compiler(this_path, self.resolver, the_path)
+                result.append(new_compiler)
+            else:
+                debug("This file has already been imported... ignoring")
+
+        self.add_imported(result)
+
+        debug("All imports have been preprocessed!")
+        return result
+
+    def link_imports(self, modules:dict, resolver:ImportResolver):
+        # the same as handle_imports, but with every imported file already preprocessed
+        # (modules maps the canonical path of each file to its Compiler).
+        # files that were linked before are kept as they are
+        result = []
+        self.linked = []
+        self.resolver = resolver
+        for this_path, the_path in self.import_paths:
+            key = resolver.canonical(this_path)
+            if key not in resolver.seen:
+                new_compiler = modules[key]
+                new_compiler.relation = the_path
+                resolver.add(new_compiler.filename, new_compiler.source)
+                if new_compiler.linked == None:
+                    new_compiler.link_imports(modules, resolver)
+                else:
+                    new_compiler.add_linked(modules, resolver)
+                result.append(new_compiler)
+                self.linked.append(key)
+            else:
+                debug("This file has already been imported... ignoring")
+
+        self.add_imported(result)
+        return result
+
+    def add_linked(self, modules:dict, resolver:ImportResolver):
+        # add the files that an already linked file brought in to the resolver,
+        # in the same order as link_imports did
+        self.resolver = resolver
+        for key in self.linked:
+            resolver.add(modules[key].filename, modules[key].source)
+            modules[key].add_linked(modules, resolver)
+
+    def link_copy(self):
+        # a copy of a preprocessed file to link into a single build.
+        # the classes themselves are shared with the original
+        result = Compiler.__new__(Compiler)
+        result.__dict__.update(self.__dict__)
+        result.classes = list(self.classes)
+        result.linked = None
+        return result
+
+    def add_imported(self, result:list):
+        # make imported classes not global (for access protection later)
+        for new_compiler in result:
+            for x in range(len(new_compiler.classes)):
+                new_compiler.classes[x].is_global = False
 
         # encase all imports with relative paths starting with a . in private class . {}
         for i in range(len(result)):
@@ -1060,12 +2608,453 @@ class Compiler:
                     new_class.subclasses = result[i].classes
 
 
-        self.remaining_lines = remaining
+class ModuleCache:
+    """
+    An on disk cache of preprocessed files.
+    An entry holds what a Compiler has after preprocessing a file (but before
+    it follows its imports). Entries are keyed by a hash of the compiler
+    version, the filename and the contents of the file, so a changed file is
+    simply a miss. The source itself is not stored, since it was already read
+    to compute the key.
+    """
 
+    # the parts of a Compiler that are cached
+    FIELDS = ["classes", "remaining_lines", "import_paths", "EXCEPTIONS", "store"]
+    # the classes whose objects are pickled into an entry
+    PICKLED = [Class, Function, Line, TokenStore, ErrorMessage, Directive, Use]
+
+    def __init__(self, directory:str):
+        self.directory = directory
+        self.version = f"{COMPILER_VERSION} {self.layout()}"
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def layout(cls):
+        # what gets pickled: the fields, and what each pickled class keeps (its
+        # slots, or the names its __init__ sets). Entries pickled differently
+        # have other keys, so they are never read back
+        result = [" ".join(cls.FIELDS)]
+        for the_class in cls.PICKLED:
+            names = []
+            for base in reversed(the_class.__mro__):
+                names += base.__dict__.get("__slots__", [])
+            if "__slots__" not in the_class.__dict__:
+                names += the_class.__init__.__code__.co_names
+            result.append(f"{the_class.__name__}({' '.join(names)})")
+        return ";".join(result)
+
+    def path(self, source:SourceFile):
+        key = hashlib.sha256()
+        key.update(self.version.encode())
+        key.update(b"\0")
+        key.update(source.filename.encode())
+        key.update(b"\0")
+        key.update(source.data if source.mapped else source.data.encode())
+        return os.path.join(self.directory, key.hexdigest())
+
+    def load(self, compiler):
+        # fill in the compiler from the cache. Returns whether there was an entry
+        path = self.path(compiler.source)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            unpickler = pickle.Unpickler(io.BytesIO(data))
+            unpickler.persistent_load = lambda x: compiler.source
+            state = unpickler.load()
+        except Exception:
+            # a missing or unreadable entry is just a miss
+            return False
+        if not isinstance(state, dict) or any([x not in state for x in self.FIELDS]):
+            # so is an entry that does not have everything
+            return False
+
+        for field in self.FIELDS:
+            setattr(compiler, field, state[field])
+        compiler.tokens = []
+        return True
+
+    def save(self, compiler):
+        state = {}
+        for field in self.FIELDS:
+            state[field] = getattr(compiler, field)
+
+        data = io.BytesIO()
+        pickler = pickle.Pickler(data, pickle.HIGHEST_PROTOCOL)
+        # leave the source out of the entry
+        pickler.persistent_id = lambda x: "source" if x is compiler.source else None
+        pickler.dump(state)
+
+        # write to a temporary file first, so that a reader never sees half an entry
+        path = self.path(compiler.source)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(zlib.compress(data.getvalue(), 1))
+        os.replace(temporary, path)
+
+
+def modification_time(filename:str):
+    # None if the file is gone
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+def preprocess_module(filename:str, relation:list[str]):
+    # preprocess a single file without following its imports (run in a worker process)
+    try:
+        return Compiler(filename, None, relation, follow_imports=False)
+    except SystemExit:
+        # the file could not be opened (the reason was already printed)
+        return None
+
+
+class BuildScheduler:
+    """
+    Preprocesses a file and everything it imports in parallel.
+    Every file is preprocessed on its own in a process pool. As each one comes
+    back, the files it imports are added to the pool, so the import graph is
+    found as the build goes. The results are then linked together in the same
+    order that Compiler would import them in, so the classes come out the same.
+    """
+    def __init__(self, filename:str, workers:int=None):
+        self.filename = filename
+        self.workers = workers
+
+    def build(self):
+        debug("Preprocessing imports in parallel...")
+        root = Compiler(self.filename, None, "", follow_imports=False)
+        self.resolver = root.resolver
+        modules = {self.resolver.canonical(root.filename): root}
+        scheduled = set(modules)
+
+        with ProcessPoolExecutor(self.workers) as pool:
+            pending = {}
+            self.schedule(root, pool, pending, scheduled)
+            while len(pending) > 0:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    module = future.result()
+                    if module == None:
+                        exit()
+                    modules[key] = module
+                    self.schedule(module, pool, pending, scheduled)
+
+        for module in modules.values():
+            self.resolver.add_imports(module)
+        root.link_imports(modules, self.resolver)
+        self.resolver.report_cycles()
 
         debug("All imports have been preprocessed!")
+        return root
+
+    def schedule(self, module, pool:ProcessPoolExecutor, pending:dict, scheduled:set):
+        for this_path, the_path in module.import_paths:
+            key = self.resolver.canonical(this_path)
+            if key not in scheduled:
+                debug(f"Scheduling {this_path}")
+                scheduled.add(key)
+                pending[pool.submit(preprocess_module, this_path, the_path)] = key
+
+
+class Daemon:
+    """
+    Keeps every file of a program in memory and rebuilds it whenever one of them changes.
+    Only the changed files and the files that import them (directly or not) are
+    preprocessed and parsed again. Every other file keeps its classes from the
+    last build. If a changed file now imports different files, everything is rebuilt,
+    since the order the files are linked in may have changed.
+    """
+    def __init__(self, filename:str, interval:float=0.5):
+        if filename[:2] != "./":
+            filename = "./" + filename
+        self.filename = filename
+        self.interval = interval
+        # only used for its canonical paths, each build links with a new resolver
+        self.paths = ImportResolver()
+        self.root = self.paths.canonical(filename)
+        # canonical path : Compiler (preprocessed, and parsed after the first build)
+        self.modules = {}
+        # canonical path : filename to compile it as
+        self.filenames = {self.root: filename}
+        # canonical path : modification time when it was preprocessed
+        self.mtimes = {}
+        # files that still have to be rebuilt after a failed build
+        self.stale = set()
+
+    def changes(self):
+        return set([key for key in self.mtimes if modification_time(key) != self.mtimes[key]])
+
+    def with_dependents(self, keys:set):
+        # the files in keys, and every file that imports one of them
+        importers = {}
+        for key, module in self.modules.items():
+            for this_path, the_path in module.import_paths:
+                importers.setdefault(self.paths.canonical(this_path), []).append(key)
+
+        result = set()
+        pending = list(keys)
+        while len(pending) > 0:
+            key = pending.pop()
+            if key in result:
+                continue
+            result.add(key)
+            pending += importers.get(key, [])
         return result
 
+    def preprocess(self, keys:set):
+        # preprocess files (and any files they import that are not known yet)
+        pending = sorted(keys)
+        while len(pending) > 0:
+            key = pending.pop()
+            self.mtimes[key] = modification_time(key)
+            module = preprocess_module(self.filenames[key], "")
+            if module == None:
+                return False
+            self.modules[key] = module
+            for this_path, the_path in module.import_paths:
+                child = self.paths.canonical(this_path)
+                if child not in self.modules and child not in pending:
+                    self.filenames[child] = this_path
+                    pending.append(child)
+        return True
+
+    def build(self, changed:set):
+        # rebuild the program after the files in changed were changed.
+        # gives back every error, or None if a file could not be opened
+        graph = {}
+        for key, module in self.modules.items():
+            graph[key] = module.import_paths
+
+        # the main file imports everything, so it is always rebuilt
+        dirty = self.with_dependents(changed | self.stale)
+        dirty.add(self.root)
+        debug(f"Rebuilding {sorted(dirty)}")
+        for key in dirty:
+            self.modules.pop(key, None)
+
+        self.stale = set()
+        if not self.preprocess(dirty):
+            self.stale = dirty
+            return None
+
+        for key in dirty:
+            if key in graph and self.modules[key].import_paths != graph[key]:
+                debug("The imports changed, rebuilding everything...")
+                self.modules = {}
+                if not self.preprocess(set([self.root])):
+                    self.stale = set(graph)
+                    return None
+                break
+
+        root = self.modules[self.root]
+        resolver = ImportResolver()
+        resolver.add(root.filename, root.source)
+        for module in self.modules.values():
+            resolver.add_imports(module)
+        root.link_imports(self.modules, resolver)
+        resolver.report_cycles()
+
+        exceptions = []
+        for filename in root.imports:
+            exceptions += self.modules[resolver.canonical(filename)].EXCEPTIONS
+
+        parser = Parser(root.remaining_lines, root.classes, root.resolver.sources)
+        exceptions += parser.EXCEPTIONS
+
+        sequencer = Sequencer(parser.classes, parser.directives, parser.sources)
+        exceptions += sequencer.EXCEPTIONS
+
+        lowerer = Lowerer(sequencer)
+        exceptions += lowerer.EXCEPTIONS
+
+        return exceptions
+
+    def report(self, changed:set):
+        try:
+            exceptions = self.build(changed)
+        except (Exception, SystemExit):
+            # keep watching, the next change may fix it
+            print(traceback.format_exc())
+            return
+        if exceptions == None:
+            print("BUILD FAILED")
+            return
+        print()
+        print("EXCEPTIONS:")
+        [print(x) for x in exceptions]
+
+    def run(self):
+        self.report(set())
+        while True:
+            time.sleep(self.interval)
+            changed = self.changes()
+            if len(changed) > 0:
+                debug(f"Changed: {sorted(changed)}")
+                self.report(changed)
+
+
+class Batch:
+    """
+    Compiles many programs in one process.
+    The files they import are preprocessed and parsed once and then shared by every
+    program that imports them. Each build links its own copies of those files,
+    so which files a program imported (and in what order) does not leak into
+    the next one.
+    """
+    def __init__(self):
+        # only used for its canonical paths, each build links with a new resolver
+        self.paths = ImportResolver()
+        # canonical path : Compiler (preprocessed, but never linked)
+        self.modules = {}
+        # canonical path : modification time when it was preprocessed
+        self.mtimes = {}
+        # the TCABIR of the last program that was built
+        self.program = None
+
+    def refresh(self):
+        # forget the files that changed since they were preprocessed.
+        # nothing else has to go, since every build links its own copies
+        for key in list(self.modules):
+            if modification_time(key) != self.mtimes[key]:
+                debug(f"{key} changed")
+                del self.modules[key]
+
+    def module(self, filename:str):
+        key = self.paths.canonical(filename)
+        if key not in self.modules:
+            self.mtimes[key] = modification_time(key)
+            module = preprocess_module(filename, "")
+            if module == None:
+                return None
+            self.modules[key] = module
+        return self.modules[key]
+
+    def link(self, root):
+        # link root with copies of every file it imports (directly or not)
+        modules = {self.paths.canonical(root.filename): root}
+        pending = [root]
+        while len(pending) > 0:
+            module = pending.pop()
+            for this_path, the_path in module.import_paths:
+                key = self.paths.canonical(this_path)
+                if key not in modules:
+                    shared = self.module(this_path)
+                    if shared == None:
+                        return None
+                    modules[key] = shared.link_copy()
+                    pending.append(modules[key])
+
+        resolver = ImportResolver()
+        resolver.add(root.filename, root.source)
+        for module in modules.values():
+            resolver.add_imports(module)
+        root.link_imports(modules, resolver)
+        resolver.report_cycles()
+        return modules
+
+    def build(self, filename:str):
+        # compile a single program. Gives back every error,
+        # or None if a file could not be opened
+        # (the main file is never shared, the Sequencer changes it)
+        root = preprocess_module(filename, "")
+        if root == None:
+            return None
+        modules = self.link(root)
+        if modules == None:
+            return None
+
+        exceptions = []
+        for x in root.imports:
+            exceptions += modules[root.resolver.canonical(x)].EXCEPTIONS
+
+        parser = Parser(root.remaining_lines, root.classes, root.resolver.sources)
+        exceptions += parser.EXCEPTIONS
+
+        sequencer = Sequencer(parser.classes, parser.directives, parser.sources)
+        exceptions += sequencer.EXCEPTIONS
+
+        lowerer = Lowerer(sequencer)
+        exceptions += lowerer.EXCEPTIONS
+        self.program = lowerer.program
+
+        return exceptions
+
+
+def compile_many(paths:list[str]):
+    # compile every program in paths, sharing the files they import.
+    # gives back path : errors (None if that program could not be built)
+    batch = Batch()
+    result = {}
+    for path in paths:
+        try:
+            result[path] = batch.build(path)
+        except (Exception, SystemExit):
+            # one broken program should not stop the rest
+            print(traceback.format_exc())
+            result[path] = None
+    return result
+
+
+class CompileServer:
+    """
+    Keeps the compiler in memory and checks files for an editor.
+    It listens on a Unix socket. Each request is a line of JSON such as
+    {"file": "src/main.tcab"}, and is answered with a line of JSON holding the
+    errors of that program ({"errors": [...]}), or {"error": "..."} if it could
+    not be built. The files it imports are kept between requests (see Batch),
+    and are only preprocessed again once they change.
+    Requests are handled one at a time.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.batch = Batch()
+
+    def check(self, request:dict):
+        if not isinstance(request, dict) or not isinstance(request.get("file"), str):
+            return {"error": "Expected {\"file\": path}"}
+        # Compiler wants a path relative to where the server runs
+        filename = os.path.relpath(request["file"])
+
+        self.batch.refresh()
+        try:
+            exceptions = self.batch.build(filename)
+        except (Exception, SystemExit):
+            return {"error": traceback.format_exc()}
+        if exceptions == None:
+            return {"error": f"Could not open {filename} or one of the files it imports"}
+        return {"errors": [x.to_dict() for x in exceptions]}
+
+    def handle(self, connection:socket.socket):
+        # answer requests until the editor hangs up
+        with connection, connection.makefile('rwb') as f:
+            for line in f:
+                try:
+                    response = self.check(json.loads(line))
+                except ValueError:
+                    response = {"error": "Invalid JSON"}
+                f.write(json.dumps(response).encode() + b"\n")
+                f.flush()
+
+    def run(self):
+        # a socket left behind by a server that was killed would stop bind
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(self.path)
+            server.listen()
+            debug(f"Listening on {self.path}")
+            try:
+                while True:
+                    connection, _ = server.accept()
+                    try:
+                        self.handle(connection)
+                    except OSError:
+                        # the editor went away in the middle of a request
+                        debug(traceback.format_exc())
+            finally:
+                os.unlink(self.path)
 
 
 class Parser:
@@ -1073,8 +3062,10 @@ class Parser:
     Takes control after the Compiler has handled all imports and classes
     """
 
-    def __init__(self, remaining_lines:list[Line], classes:list[Class]):
+    def __init__(self, remaining_lines:list[Line], classes:list[Class], sources:dict=None):
         self.EXCEPTIONS = []
+        # filename : SourceFile of the files of the build (see ImportResolver)
+        self.sources = {} if sources == None else sources
 
         self.remaining_lines = remaining_lines
         self.classes = classes
@@ -1108,17 +3099,37 @@ class Parser:
 
         # handle use (as) statements by adding them to Class objects
         for i in range(len(self.classes)):
-            self.classes[x] = self.handle_use_statements(self.classes[x])
+            self.classes[i] = self.handle_use_statements(self.classes[i])
 
         # we should be able to start rearranging lines of code
         # and applying the compiler directives so that we have a sequential program
         # we should be able to catch any syntax errors while do this
 
+        # build the syntax tree of every class and function,
+        # so that the later passes do not have to read the tokens again
+        for x in self.classes:
+            self.build_trees(x)
+
+        # classes that are kept between builds are not parsed again
+        for x in self.classes:
+            self.mark_parsed(x)
+
+    def build_trees(self, the_class:Class):
+        if the_class.parsed:
+            return
+        the_class.body = TreeBuilder(the_class.lines).build()
+        for x in the_class.functions:
+            x.body = TreeBuilder(x.lines).build()
+        for x in the_class.subclasses:
+            self.build_trees(x)
+
+    def mark_parsed(self, the_class:Class):
+        the_class.parsed = True
+        for x in the_class.subclasses:
+            self.mark_parsed(x)
+
     def parse_line_number(self, line: Line):
-        if len(line.tokens) > 0:
-            if len(line.tokens[0]) > 0 and line.tokens[0][0] == '`':
-                return line.tokens[0][1:]
-        return "0"
+        return str(line.line_number)
 
 
     def add_error(self, file: str, line: Line, error_type: str, cause: str, suggestions: str):
@@ -1127,13 +3138,7 @@ class Parser:
         result.file = file
         result.type = error_type
         result.line_number = self.parse_line_number(line)
-        if result.line_number == "0":
-            result.line = "ERROR while fetching line"
-        else:
-            try:
-                result.line = self.data.split("\n")[int(result.line_number)]
-            except:
-                result.line = "ERROR while fetching line"
+        result.source = self.sources.get(file)
         result.cause = cause
         result.suggestions = suggestions
         self.EXCEPTIONS.append(result)
@@ -1144,7 +3149,10 @@ class Parser:
         # handle potential compiler directives, functions, statements inside of functions, declarations, and use statements within a class
         # we will ignore compiler directives until the end
         # we should have enough information to start gathering functions and variable declarations
-        
+        if the_class.parsed:
+            self.EXCEPTIONS += the_class.errors
+            return the_class
+        start = len(self.EXCEPTIONS)
         
         i = 0
         n = len(the_class.lines)
@@ -1163,14 +3171,7 @@ class Parser:
             # functions are in this form:
             # public static void main(float | String test){
             # void main(* test){
-            curr = the_class.lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = the_class.lines[i].copy_tokens()
 
             m = len(curr)
 
@@ -1249,19 +3250,7 @@ class Parser:
 
                                     # now start on the next line and get the contents of this function,
                                     # breaking at the closing line
-                                    opens = 1
-                                    j = i + 1
-                                    while j < n:
-                                        for x in the_class.lines[j].tokens:
-                                            if x == "{":
-                                                opens += 1
-                                            elif x == "}":
-                                                opens -= 1
-                                            if opens == 0:
-                                                break
-                                        if opens == 0:
-                                            break
-                                        j += 1
+                                    j = find_block_end(the_class.lines, i, n)
 
                                     if j == n:
                                         self.add_error(the_class.file, the_class.lines[i], "SYNTAX", "Function {function_name} was never closed", "Put a '}' where it should be closed.")
@@ -1272,32 +3261,20 @@ class Parser:
 
                                         if j != n - 1:
                                             # check if there is a $ method
-                                            if len(the_class.lines[j+1].tokens) > 1:
-                                                if the_class.lines[j+1].tokens[1] == "$":
+                                            if len(the_class.lines[j+1]) > 0:
+                                                if the_class.lines[j+1].tokens[0] == "$":
                                                     # create another function that returns bool with same params
                                                     # with the same name, but starting with $
 
                                                     # now gather the lines for the test_function
-                                                    if len(the_class.lines[j+1].tokens) < 2:
+                                                    if len(the_class.lines[j+1]) < 2:
                                                         self.add_error(the_class.file, the_class.lines[i], "SYNTAX", "Expected '{' after '$'...", "Put '{' after '$'.")
                                                     else:
-                                                        if the_class.lines[j+1].tokens[2] != "{":
+                                                        if the_class.lines[j+1].tokens[1] != "{":
                                                             self.add_error(the_class.file, the_class.lines[i], "SYNTAX", "Expected '{' after '$'...", "Put '{' after '$'.")
                                                         else:
-                                                            opens = 1
                                                             test_function_lines_start = j
-                                                            j = j + 2
-                                                            while j < n:
-                                                                for x in the_class.lines[j].tokens:
-                                                                    if x == "{":
-                                                                        opens += 1
-                                                                    elif x == "}":
-                                                                        opens -= 1
-                                                                    if opens == 0:
-                                                                        break
-                                                                if opens == 0:
-                                                                    break
-                                                                j += 1
+                                                            j = find_block_end(the_class.lines, j + 1, n)
                                                             if j == n:
                                                                 self.add_error(the_class.file, the_class.lines[i], "SYNTAX", "Function ${function_name} was never closed", "Put a '}' where it should be closed.")
                                                             else:
@@ -1323,6 +3300,7 @@ class Parser:
         for i in range(len(the_class.subclasses)):
             the_class.subclasses[i] = self.handle_inside_class(the_class.subclasses[i])
 
+        the_class.errors = self.EXCEPTIONS[start:]
 
         return the_class
 
@@ -1335,14 +3313,7 @@ class Parser:
         i = 0
         n = len(self.remaining_lines)
         while i < n:
-            curr = self.remaining_lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = self.remaining_lines[i].copy_tokens()
 
             m = len(curr)
 
@@ -1368,14 +3339,7 @@ class Parser:
         i = 0
         n = len(the_function.lines)
         while i < n:
-            curr = the_function.lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = the_function.lines[i].copy_tokens()
 
             m = len(curr)
 
@@ -1393,18 +3357,14 @@ class Parser:
 
 
     def handle_class_directives(self, the_class:Class):
+        if the_class.parsed:
+            return the_class
+
         # handle directives in the remaining section
         i = 0
         n = len(the_class.lines)
         while i < n:
-            curr = the_class.lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = the_class.lines[i].copy_tokens()
 
             m = len(curr)
 
@@ -1431,20 +3391,16 @@ class Parser:
 
 
     def handle_use_statements(self, the_class: Class):
+        if the_class.parsed:
+            return the_class
+
         # first, iterate through the lines of the class
         # and look for the use
 
         i = 0
         n = len(the_class.lines)
         while i < n:
-            curr = the_class.lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        del curr[j]
-                        j -= 1
-                j += 1
+            curr = the_class.lines[i].copy_tokens()
 
             m = len(curr)
 
@@ -1465,6 +3421,511 @@ class Parser:
         return the_class
 
 
+class NameTrie:
+    """
+    Dotted names (System.out.println) stored one name per level,
+    so finding a.b.c.d is a walk of depth 4.
+    """
+    __slots__ = ["children", "value"]
+
+    def __init__(self):
+        # name : NameTrie
+        self.children = {}
+        self.value = None
+
+    def insert(self, path:list[str], value):
+        node = self
+        for name in path:
+            child = node.children.get(name)
+            if child == None:
+                child = NameTrie()
+                node.children[name] = child
+            node = child
+        node.value = value
+        return node
+
+    def find(self, path:list[str]):
+        # the value of the longest start of path that has one,
+        # and how many names of path it covers (None, 0 if there is none)
+        node = self
+        result = None
+        depth = 0
+        for i in range(len(path)):
+            node = node.children.get(path[i])
+            if node == None:
+                break
+            if node.value != None:
+                result = node.value
+                depth = i + 1
+        return result, depth
+
+
+# bytes taken by a variable of each builtin type
+TYPE_SIZES = {"bool": 1, "char": 1, "short": 2, "int": 4, "float": 4, "long": 8, "double": 8}
+
+
+def variable_text(token):
+    # how a token of a numbered line is written out. Variables are ints (#N)
+    # and members of variables are (N, "name") tuples (#N.name)
+    if isinstance(token, int):
+        return f"#{token}"
+    if isinstance(token, tuple):
+        return f"#{token[0]}.{token[1]}"
+    return token
+
+
+class Variables:
+    """
+    The variables of a trace, numbered from 0.
+    A variable is an index into each of the lists rather than an object,
+    and is only written as #N when it is printed (see variable_text).
+    """
+    def __init__(self):
+        # the name of each variable in the source
+        self.names = []
+        # the type of each variable (None if it is not known).
+        # a class that was numbered itself is its number
+        self.types = []
+        # bytes taken by each variable (0 if not known)
+        self.sizes = []
+        # the SymbolTable each variable belongs to
+        self.scopes = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name:str, scope):
+        self.names.append(name)
+        self.types.append(None)
+        self.sizes.append(0)
+        self.scopes.append(scope)
+        return len(self.names) - 1
+
+    def set_type(self, num:int, the_type:list):
+        self.types[num] = the_type
+        if len(the_type) == 1 and isinstance(the_type[0], str):
+            self.sizes[num] = TYPE_SIZES.get(the_type[0], 0)
+
+    def type_texts(self):
+        # "#<varnum>":"type" of every variable with a known type
+        result = {}
+        for i in range(len(self.types)):
+            if self.types[i] != None:
+                result[variable_text(i)] = [variable_text(x) for x in self.types[i]]
+        return result
+
+
+class SymbolTable:
+    """
+    The names of one scope, chained to the scope around it.
+    In a function the chain is block -> function -> class -> parents -> imports.
+    Each scope is a dict, so finding a name costs one lookup per scope.
+    """
+    def __init__(self, parent=None, name:str=""):
+        self.parent = parent
+        self.name = name
+        # name : what it is (a variable number in functions, a Class, Function or Declaration in classes)
+        self.symbols = {}
+        # alias : the names of the dotted path it stands for (use ... as ...)
+        self.aliases = {}
+        # the scopes of the classes this one extends, searched before the parent
+        self.bases = []
+
+    def declare(self, name:str, value):
+        self.symbols[name] = value
+
+    def find_here(self, name:str, seen:set):
+        # look in this scope and the classes it extends, but not the scopes around it
+        if name in self.symbols:
+            return self.symbols[name]
+        seen.add(id(self))
+        for base in self.bases:
+            if id(base) not in seen:
+                result = base.find_here(name, seen)
+                if result != None:
+                    return result
+        return None
+
+    def find(self, name:str):
+        # what a name refers to in the closest scope that has it (None if no scope does)
+        scope = self
+        while scope != None:
+            if name in scope.symbols:
+                return scope.symbols[name]
+            if len(scope.bases) > 0:
+                result = scope.find_here(name, set())
+                if result != None:
+                    return result
+            scope = scope.parent
+        return None
+
+    def alias(self, name:str):
+        scope = self
+        while scope != None:
+            if name in scope.aliases:
+                return scope.aliases[name]
+            scope = scope.parent
+        return None
+
+    def is_used(self, path:list[str]):
+        # whether a use statement names path (use System.out.println)
+        scope = self
+        while scope != None:
+            if path in scope.aliases.values():
+                return True
+            scope = scope.parent
+        return False
+
+    def expand(self, path:list[str]):
+        # replace an alias at the start of a dotted path with the names it stands for
+        seen = set()
+        while True:
+            target = self.alias(path[0])
+            if target == None or path[0] in seen:
+                return path
+            seen.add(path[0])
+            path = target + path[1:]
+
+    def resolve(self, path:list[str]):
+        # a dotted path whose first name is a variable (a.plus -> (2, "plus"))
+        # None if the first name is not a variable
+        result = self.find(path[0])
+        if not isinstance(result, int):
+            return None
+        if len(path) == 1:
+            return result
+        return (result, ".".join(path[1:]))
+
+
+class Reachability:
+    """
+    Finds every class and function that can be reached from Main.main.
+    Names are looked up through the scopes of a Sequencer. A member of something
+    whose class is not known (x.twice) reaches the functions with that name
+    in every reachable class.
+    """
+    def __init__(self, sequencer):
+        self.sequencer = sequencer
+        # id(class or function) : the class it is in
+        self.enclosing = {}
+        # function name : functions with that name
+        self.by_name = {}
+        # names used as members of something
+        self.members = set()
+        # ids of the classes and functions found so far
+        self.reachable = set()
+        # classes and functions that were reached but not looked through yet
+        self.pending = []
+
+        pending = list(sequencer.classes)
+        while len(pending) > 0:
+            x = pending.pop()
+            for f in x.functions:
+                self.enclosing[id(f)] = x
+                self.by_name.setdefault(f.name, []).append(f)
+            for y in x.subclasses:
+                self.enclosing[id(y)] = x
+                pending.append(y)
+
+    def run(self, main_function:Function):
+        self.pending.append(main_function)
+        while len(self.pending) > 0:
+            x = self.pending.pop()
+            if id(x) in self.reachable:
+                continue
+            self.reachable.add(id(x))
+            if isinstance(x, Class):
+                self.visit_class(x)
+            else:
+                self.visit_function(x)
+        return self.reachable
+
+    def visit_class(self, the_class:Class):
+        # the classes it is in and extends, and the functions that were used as members
+        if id(the_class) in self.enclosing:
+            self.pending.append(self.enclosing[id(the_class)])
+        for name in the_class.parents:
+            parent = self.sequencer.imports_table().find(name)
+            if isinstance(parent, Class):
+                self.pending.append(parent)
+        for f in the_class.functions:
+            if f.name in self.members:
+                self.pending.append(f)
+        # the values the attributes start with
+        if the_class.body != None:
+            for node in walk(the_class.body):
+                for name in statement_names(node):
+                    self.visit_name(the_class, name)
+
+    def visit_function(self, the_function:Function):
+        the_class = self.enclosing[id(the_function)]
+        self.pending.append(the_class)
+        # its test function ($main)
+        for f in self.by_name.get("$" + the_function.name, []):
+            if self.enclosing[id(f)] is the_class:
+                self.pending.append(f)
+        # the classes of the params and the return type
+        return_type = the_function.return_type
+        if isinstance(return_type, str):
+            return_type = [return_type]
+        for x in the_function.params + return_type:
+            if isinstance(x, str) and WORD.match(x) and x not in RESERVED_WORDS:
+                self.visit_name(the_class, x)
+        if the_function.body != None:
+            for node in walk(the_function.body):
+                for name in statement_names(node):
+                    self.visit_name(the_class, name)
+
+    def add_member(self, name:str):
+        if name in self.members:
+            return
+        self.members.add(name)
+        for f in self.by_name.get(name, []):
+            if id(self.enclosing[id(f)]) in self.reachable:
+                self.pending.append(f)
+
+    def visit_name(self, the_class:Class, name:str):
+        if name.startswith("."):
+            self.add_member(name[1:])
+            return
+        if len(name) < 1:
+            return
+
+        table = self.sequencer.class_table(the_class)
+        path = table.expand(name.split("."))
+        value = table.find(path[0])
+        rest = path[1:]
+        if value == None:
+            # a dotted path from the global scope (lib.util.Util.twice)
+            value, depth = self.sequencer.name_trie().find(path)
+            if value != None:
+                rest = path[depth:]
+
+        # follow the rest of the path through the classes it names
+        value, rest = self.sequencer.follow(value, rest)
+
+        if isinstance(value, Declaration):
+            # an attribute. The class it is in sets its value,
+            # and its members can be any function of its class
+            self.pending.append(self.sequencer.attributes[id(value)])
+            self.visit_name(the_class, type_name(value.type))
+        elif isinstance(value, (Class, Function)):
+            self.pending.append(value)
+
+        # a member of a local variable, an attribute or something unknown
+        if len(rest) > 0:
+            self.add_member(rest[0])
+
+
+class Numbering:
+    """
+    Numbers the variables of a traced function (or the value of an attribute)
+    by walking its syntax tree.
+    The numbers are put on the nodes (Name.variable and Declaration.variable).
+    Every list of statements is a scope of its own (the header of a for loop
+    is one more), so a declaration only hides the names around it until the
+    end of its block. Attributes are variables of the Sequencer (see field)
+    """
+    # words of a declaration that are not part of its type
+    ACCESS = set(["private", "public", "protected", "static"])
+    BUILTIN_TYPES = set(["int", "bool", "float", "short", "long", "double", "char", "void", "*"])
+
+    def __init__(self, sequencer, name:str, the_class:Class, variables:Variables):
+        self.sequencer = sequencer
+        self.the_class = the_class
+        self.variables = variables
+        # the params, and every name that is not declared in the function
+        self.function_scope = SymbolTable(sequencer.class_table(the_class), name)
+        # "name":varnum (every name numbered in this function)
+        self.found = {}
+        # the line of the statement being numbered (for errors)
+        self.line = None
+
+    def add(self, name:str, scope:SymbolTable):
+        varnum = self.variables.add(name, scope)
+        scope.declare(name, varnum)
+        self.found[name] = varnum
+        return varnum
+
+    def run(self, the_function:Function):
+        self.params(the_function)
+        if the_function.body != None:
+            self.statements(the_function.body, self.function_scope)
+        return the_function
+
+    def params(self, the_function:Function):
+        # parse through the function's params
+        curr = " ".join(the_function.params)
+        curr = curr.split(" , ")
+        new_params = []
+        curr = [x.strip() for x in curr]
+        for x in range(len(curr)):
+            if len(curr[x]) == 0:
+                # a function without params
+                continue
+            splitted = curr[x].split(" ")
+            varname = splitted[-1]
+            vartype = splitted[:-1]
+            vartype = "".join(vartype).split("|")
+            for y in range(len(vartype)):
+                if vartype[y] not in self.BUILTIN_TYPES:
+                    varnum = self.function_scope.symbols.get(vartype[y])
+                    if varnum == None:
+                        varnum = self.add(vartype[y], self.function_scope)
+                        self.variables.set_type(varnum, ["class"])
+                    vartype[y] = varnum
+
+            varnum = self.add(varname, self.function_scope)
+            self.variables.set_type(varnum, vartype)
+
+            new_params.append(varnum)
+
+        the_function.params = new_params
+
+    def statements(self, body:list[Statement], scope:SymbolTable):
+        for node in body:
+            self.statement(node, scope)
+
+    def statement(self, node:Statement, scope:SymbolTable):
+        self.line = node.line
+        match node:
+            case Declaration():
+                self.declare(node, scope)
+                if node.value != None:
+                    self.expression(node.value, scope)
+            case Assignment():
+                self.expression(node.target, scope)
+                self.expression(node.value, scope)
+            case ExpressionStatement() | Return():
+                if node.value != None:
+                    self.expression(node.value, scope)
+            case If():
+                self.expression(node.condition, scope)
+                self.statements(node.body, SymbolTable(scope, "block"))
+                self.statements(node.orelse, SymbolTable(scope, "block"))
+            case While():
+                self.expression(node.condition, scope)
+                self.statements(node.body, SymbolTable(scope, "block"))
+            case For():
+                header = SymbolTable(scope, "for")
+                if node.init != None:
+                    self.statement(node.init, header)
+                if node.condition != None:
+                    self.expression(node.condition, header)
+                if node.step != None:
+                    self.statement(node.step, header)
+                self.statements(node.body, SymbolTable(header, "block"))
+            case ForEach():
+                # the iterable can not see the variable it is looped with
+                self.expression(node.iterable, scope)
+                header = SymbolTable(scope, "for")
+                if isinstance(node.target, Declaration):
+                    self.declare(node.target, header)
+                elif isinstance(node.target, Name) and not isinstance(header.find(node.target.name), int):
+                    # for x in arr declares x if it was not declared before
+                    node.target.variable = self.add(node.target.name, header)
+                else:
+                    self.expression(node.target, header)
+                self.statements(node.body, SymbolTable(header, "block"))
+            case Scope():
+                self.statements(node.body, SymbolTable(scope, "block"))
+
+    def expression(self, node:Node, scope:SymbolTable):
+        nodes = list(expression_nodes(node))
+        # the names that are called (f of f(x))
+        called = set([id(x.function) for x in nodes if isinstance(x, Call)])
+        for x in nodes:
+            if isinstance(x, Name):
+                self.name(x, scope, id(x) in called)
+
+    def declare(self, node:Declaration, scope:SymbolTable):
+        # the name being declared only hides names from outer scopes
+        the_type = self.type(node.type, scope)
+        varnum = scope.symbols.get(node.name)
+        if varnum == None:
+            debug(f"Found new variable: {node.name}")
+            varnum = self.add(node.name, scope)
+            self.variables.set_type(varnum, the_type)
+        node.variable = varnum
+
+    def type(self, tokens:list[str], scope:SymbolTable):
+        # the type of a declaration. A class in it is a variable of its own
+        # (String s is [#3]), the rest is kept as it is written (int[])
+        tokens = [x for x in tokens if x not in self.ACCESS]
+        result = []
+        for x in " ".join(tokens).replace(" . ", ".").split():
+            if x in RESERVED_WORDS or not all([WORD.match(y) for y in x.split(".")]):
+                result.append(x)
+                continue
+            varnum = scope.find(x)
+            if not isinstance(varnum, int):
+                debug(f"Found new variable: {x}")
+                varnum = self.add(x, self.function_scope)
+                self.variables.set_type(varnum, ["class"])
+            result.append(varnum)
+        if len(result) == 1 and isinstance(result[0], int):
+            # a class that was numbered
+            return result
+        return ["".join([variable_text(x) for x in result])]
+
+    def name(self, node:Name, scope:SymbolTable, is_called:bool=False):
+        # a variable, a method or attribute of one (a.plus -> (2, "plus")),
+        # or a new variable for a class, function or something that was used
+        # (use System.out.println). Anything else is an error
+        if node.name in RESERVED_WORDS or node.name in ["true", "false"]:
+            return
+        path = node.name.split(".")
+        is_used = False
+        varnum = scope.find(node.name)
+        if not isinstance(varnum, int):
+            # check use statements to see if it is an alias
+            aliased = scope.expand(path)
+            if aliased != path:
+                path = aliased
+                is_used = True
+                debug(f"{node.name} is an alias of {'.'.join(path)}")
+                varnum = scope.find(".".join(path))
+        if not isinstance(varnum, int):
+            # a method or attribute of a variable (a.plus)
+            varnum = scope.resolve(path)
+
+        if varnum == None:
+            name = ".".join(path)
+            # classes, functions and attributes known by their dotted path
+            value, rest = self.sequencer.find_path(self.the_class, path)
+            if value == None and not is_used and not scope.is_used(path):
+                if is_called and len(path) == 1:
+                    # not in the program, so it is called as a system call
+                    debug(f"{name} is a system call")
+                else:
+                    self.sequencer.add_error(self.the_class.file, self.line, "SYNTAX", f"{path[0]} was never declared...", f"Declare {path[0]} before it is used, or import the class it is in.")
+                    self.sequencer.unknown.add(id(node))
+                return
+
+            if isinstance(value, Declaration):
+                # an attribute (or a member of one), the same variable in every function
+                varnum = self.sequencer.field(value)
+                self.found[name] = varnum
+                node.variable = varnum if len(rest) == 0 else (varnum, ".".join(rest))
+                return
+
+            debug(f"Found new variable: {name}")
+            # names that were not declared in the function are visible to all of it
+            varnum = self.add(name, self.function_scope)
+            if len(rest) == 0 and isinstance(value, Class):
+                debug(f"{name} is the class {value.name}")
+                self.variables.set_type(varnum, ["class"])
+            elif len(rest) == 0 and isinstance(value, Function):
+                debug(f"{name} is the function {value.name}")
+                self.variables.set_type(varnum, ["function"])
+
+            # TODO
+            # check to make sure that the new variable
+            # does not violate access specifiers
+
+        node.variable = varnum
+
+
 class Sequencer:
     """
     This class will deal with laying out the program in a sequential manner.
@@ -1472,31 +3933,58 @@ class Sequencer:
     variables/functions/classes are defined.
     It will also have to take compiler directives into account
     """
-    def __init__(self, classes:list[Class], directives:list[Directive]):
+    def __init__(self, classes:list[Class], directives:list[Directive], sources:dict=None):
         self.classes = classes
         self.directives = directives
         self.EXCEPTIONS = []
+        # filename : SourceFile of the files of the build (see ImportResolver)
+        self.sources = {} if sources == None else sources
+        # id(class) : SymbolTable of the class
+        self.tables = {}
+        # the global scope (every class that can be reached by name)
+        self.imports = None
+        # the dotted paths of every class and function (Main.Inner.Deeper)
+        self.names = None
+        # ids of the classes and functions reachable from Main.main (None before that is known)
+        self.reachable = None
+        self.enclosing = {}
+        # the variables of every traced function (all variables are global)
+        self.variables = Variables()
+        # (id(class), id(function), argument types) : the traced copy of the function
+        self.traces = {}
+        # id(traced copy) : (its class, the types it was traced for)
+        self.trace_keys = {}
+        # how many calls were given a function that was already traced
+        self.trace_hits = 0
+        # id(Call) : the traced function it calls
+        self.call_targets = {}
+        # ids of the names that were never declared (already reported)
+        self.unknown = set()
+        # id(class) : the attributes of the class, lowered (see class_fields)
+        self.fields = {}
+        # id(attribute) : the class it is an attribute of
+        self.attributes = {}
+        # id(attribute) : its variable (see field)
+        self.field_variables = {}
+        # (class, lowered attribute) of every attribute with a value, in the order
+        # they are set at the start of Main.main
+        self.initializers = []
+        # the trace of Main.main
+        self.main_trace = None
+        # id(traced function) : the traced functions it calls
+        self.callees = {}
 
         self.trace()
 
     def parse_line_number(self, line: Line):
-        if len(line.tokens) > 0:
-            if len(line.tokens[0]) > 0 and line.tokens[0][0] == '`':
-                return line.tokens[0][1:]
-        return "0"
+        return str(line.line_number)
 
     def add_error(self, file: str, line: Line, error_type: str, cause: str, suggestions: str):
         result = ErrorMessage()
         result.file = file
         result.type = error_type
         result.line_number = self.parse_line_number(line)
-        if result.line_number == "0":
-            result.line = "ERROR while fetching line"
-        else:
-            try:
-                result.line = self.data.split("\n")[int(result.line_number)]
-            except:
-                result.line = "ERROR while fetching line"
+        result.source = self.sources.get(file)
         result.cause = cause
         result.suggestions = suggestions
         self.EXCEPTIONS.append(result)
@@ -1515,7 +4003,7 @@ class Sequencer:
                 main_class = x
 
         if not main_class_found:
-            self.add_error("*", Line(["`-1"]), "SYNTAX", "A class named Main is required in the global context...", "Add a Main class to this file or use a different file as the global scope.")
+            self.add_error("*", Line([]), "SYNTAX", "A class named Main is required in the global context...", "Add a Main class to this file or use a different file as the global scope.")
         else:
             # now, make sure that there is a main method in that class
             # the main method should either accept no args or a single String[] arg
@@ -1526,7 +4014,7 @@ class Sequencer:
                     main_function_found = 1
                     main_function = x
             if not main_function_found:
-                self.add_error("*", Line(["`-1"]), "SYNTAX", "A function named main is required in a class named Main within the global context...", "Add a main function.")
+                self.add_error("*", Line([]), "SYNTAX", "A function named main is required in a class named Main within the global context...", "Add a main function.")
             else:
                 return main_class, main_function
         return None, None
@@ -1537,227 +4025,35 @@ class Sequencer:
         # its equivalent simple operation
         # i += 1
         # => i = i + 1
-
-        i = 0
-        n = len(the_function.lines)
-        while i < n:
-            # search through each line of the function
-            curr = the_function.lines[i].tokens.copy()
-            m = len(curr)
-            line_number = []
-
-            if m > 0:
-                if len(curr[0]) > 0:
-                    if curr[0][0] == "`":
-                        line_number.append(curr[0])
-                        del curr[0]
-                        m -= 1
-
-            j = 0
-            while j < m:
-                # if this token is an = sign, 
-                # we should check if the token before
-                # is an operator
-                if curr[j] == "=":
-                    if j > 0:
-                        match(curr[j-1]):
-                            case "+":
-                                del curr[j-1]
-                                m -= 1
-                                j -= 1
-                                curr = line_number + curr[0:j+1] + curr[0:j] + ["+", "("] + curr[j+1:] + [")"]
-                                the_function.lines[i].tokens = curr
-                            case "-":
-                                del curr[j-1]
-                                m -= 1
-                                j -= 1
-                                curr = line_number + curr[0:j+1] + curr[0:j] + ["-", "("] + curr[j+1:] + [")"]
-                                the_function.lines[i].tokens = curr
-                            case "*":
-                                del curr[j-1]
-                                m -= 1
-                                j -= 1
-                                curr = line_number + curr[0:j+1] + curr[0:j] + ["*", "("] + curr[j+1:] + [")"]
-                                the_function.lines[i].tokens = curr
-                            case "/":
-                                del curr[j-1]
-                                m -= 1
-                                j -= 1
-                                curr = line_number + curr[0:j+1] + curr[0:j] + ["/", "("] + curr[j+1:] + [")"]
-                                the_function.lines[i].tokens = curr
-                            case "%":
-                                del curr[j-1]
-                                m -= 1
-                                j -= 1
-                                curr = line_number + curr[0:j+1] + curr[0:j] + ["%", "("] + curr[j+1:] + [")"]
-                                the_function.lines[i].tokens = curr
-                            case "|":
-                                # check if ||
-                                if j-1 > 0:
-                                    if curr[j-2] == "|":
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        curr = line_number + curr[0:j+1] + curr[0:j] + ["|", "|", "("] + curr[j+1:] + [")"]
-                                        the_function.lines[i].tokens = curr
-                                    else:
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        curr = line_number + curr[0:j+1] + curr[0:j] + ["|", "("] + curr[j+1:] + [")"]
-                                        the_function.lines[i].tokens = curr
-                                else:
-                                    del curr[j-1]
-                                    m -= 1
-                                    j -= 1
-                                    curr = line_number + curr[0:j+1] + curr[0:j] + ["|", "("] + curr[j+1:] + [")"]
-                                    the_function.lines[i].tokens = curr
-                            case "&":
-                                # check if &&
-                                if j-1 > 0:
-                                    if curr[j-2] == "&":
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        curr = line_number + curr[0:j+1] + curr[0:j] + ["&", "&", "("] + curr[j+1:] + [")"]
-                                        the_function.lines[i].tokens = curr
-                                    else:
-                                        del curr[j-1]
-                                        m -= 1
-                                        j -= 1
-                                        curr = line_number + curr[0:j+1] + curr[0:j] + ["&", "("] + curr[j+1:] + [")"]
-                                        the_function.lines[i].tokens = curr
-                                else:
-                                    del curr[j-1]
-                                    m -= 1
-                                    j -= 1
-                                    curr = line_number + curr[0:j+1] + curr[0:j] + ["&", "("] + curr[j+1:] + [")"]
-                                    the_function.lines[i].tokens = curr
-                j += 1
-            
-            i += 1
+        for node in walk(the_function.body):
+            if isinstance(node, Assignment):
+                self.desugar(node)
 
         return the_function
+
+    def desugar(self, node:Assignment):
+        # the compound operators are all the same rewrite, only the operator changes
+        if node.op != "=":
+            node.value = BinaryOp(COMPOUND_OPERATORS[node.op], node.target, node.value)
+            node.op = "="
+        return node
         
 
     def break_declarations(self, the_function:Function):
         # declarations can be in these two forms
         # int test = 4;
         # int test; test = 4;
-        
-        # function calls can use kwargs, but they must be inside parenthesis
-        # look for an equal sign outside of parenthesis
-        # after that, look for two strings (where neither is ".") to see what part is the name and what part is the declaration
-        # if there is no two tokens together, then this line just sets the variable
-        # the type can end in a word, *, or ]
-
-        i = 0
-        n = len(the_function.lines)
-        while i < n:
-            curr = the_function.lines[i].tokens.copy()
-            m = len(curr)
-            j = 0
-
-            inside = 0
-            line_number = ""
-            while j < m:
-                # iterate through this line, looking for an equal sign
-                
-                # get rid of the line number
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        line_number = curr[j]
-                        del curr[j]
-                        m -= 1
-                        continue
-
-                # look for an equal sign that is not inside of parenthesis
-                if curr[j] == "(":
-                    inside += 1
-                elif curr[j] == ")":
-                    inside -= 1
-                elif curr[j] == "=":
-                    if inside == 0:
-                        is_normal = 1
-                        # make sure the token before was not !, >, or <
-                        # make sure the token after is not =
-                        if j > 0:
-                            if curr[j-1] in ["!", "<", ">"]:
-                                is_normal = 0
-                        if j < m - 1:
-                            if curr[j+1] == "=":
-                                is_normal = 0
-                                j += 1
-
-                        if is_normal:
-                            # now we need to see if this is just setting or a declaration
-                            # if it is a declaration, there will be a type that ends with ], *, or a word
-                            # followed by a name that starts with a word
-                            is_declaration = False
-
-                            the_equal = j
-                            j = 0
-                            words = 0
-                            while j < the_equal:
-                                # look for *, ], or a word followed by a word other than .
-                                if curr[j] == "*":
-                                    # next can be either *, a word, [, or ]
-                                    words = 0
-                                    if j + 1 < the_equal:
-                                        if curr[j+1] not in ["*", "[", "]"]:
-                                            is_declaration = True
-                                            break
-                                elif curr[j] == "[":
-                                    # skip until "]"
-                                    words = 0
-                                    while j < the_equal and curr[j] != "]":
-                                        j += 1
-                                    j -= 1
-                                elif curr[j] == "]":
-                                    # next can be [, =, or another word
-                                    words = 0
-                                    if j + 1 < the_equal:
-                                        if curr[j+1] not in ["[", "="]:
-                                            is_declaration = True
-                                            break
-                                elif curr[j] not in [".", "[", "]", "*"]:
-                                    # this is a word
-                                    words += 1
-                                else:
-                                    # reset word counter
-                                    words = 0
-
-                                j += 1
-                                
-                                if words == 2:
-                                    is_declaration = True
-                                    break
-
-
-                            if is_declaration:
-                                new_line = Line(the_function.lines[i].tokens[:the_equal+1])
-                                new_line.is_declaration = True
-                                the_function.lines.insert(i, new_line)
-                                i += 1
-                                n += 1
-
-                                this_line = []
-                                if line_number != "":
-                                    this_line.append(line_number)
-
-                                the_function.lines[i].tokens = this_line + curr[j-1:]
-
-                            break
-
-                j += 1
-            
-            i += 1
+        # turn the first into the second
+        for body in bodies(the_function.body):
+            i = 0
+            while i < len(body):
+                node = body[i]
+                if isinstance(node, Declaration) and node.value != None:
+                    declaration = Declaration(node.type, node.name, None, node.line)
+                    assignment = Assignment(Name(node.name), "=", node.value, node.line)
+                    body[i:i+1] = [declaration, assignment]
+                    i += 1
+                i += 1
             
         return the_function
 
@@ -1783,660 +4079,1526 @@ class Sequencer:
         # % - mod
         # ^ - xor
         # ! - logicalNot
-        # && - logicalNot
+        # && - logicalAnd
         # || - logicalOr
         # [x:y] - splice
         # << - leftShift
         # >> - rightShift
+        # x[i] = y - setElement
 
-        operators = set(["+", "-", "*", "/", "==", "!=", ">", "<", ">=", "<=", "~", "|", "&", "%", "^", "!", "&&", "||", ">>", "<<"])
+        # x = 2 + 4 * 5
+        # x = 2.plus(4.times(5))
 
-        # convert lines like i += 1 to i = i + 1
-        the_function = self.convert_operation_equals(the_function)
+        # x = (2 + 4) * 5
+        # x = 2.plus(4).times(5)
 
         #  break declarations into multiple lines if assigned
         the_function = self.break_declarations(the_function)
 
-        i = 0
-        n = len(the_function.lines)
-        while i < n:
-            curr = the_function.lines[i].tokens
-            j = 0
-            m = len(curr)
-            while j < m:
-                if j + 1 < m:
-                    match(curr[j]):
-                        case "=":
-                            if curr[j+1] == "=":
-                                curr[j] = "=="
-                                del curr[j+1]
-                        case "<":
-                            if curr[j+1] == "=":
-                                curr[j] = "<="
-                                del curr[j+1]
-                            elif curr[j+1] == "<":
-                                curr[j] = "<<"
-                                del curr[j+1]
-                        case ">":
-                            if curr[j+1] == "=":
-                                curr[j] = ">="
-                                del curr[j+1]
-                            elif curr[j+1] == ">":
-                                curr[j] = ">>"
-                                del curr[j+1]
-                        case "<<":
-                            if curr[j+1] == "=":
-                                curr[j] = "<<="
-                                del curr[j+1]
-                        case ">>":
-                            if curr[j+1] == "=":
-                                curr[j] = ">>="
-                                del curr[j+1]
-                        case "&":
-                            if curr[j+1] == "&":
-                                curr[j] = "&&"
-                                del curr[j+1]
-                            pass
-                        case "|":
-                            if curr[j+1] == "|":
-                                curr[j] = "||"
-                                del curr[j+1]
-                        case "!":
-                            if curr[j+1] == "=":
-                                curr[j] = "!="
-                                del curr[j+1]
-
-                j += 1
-            i += 1
-
-        # handle negations, bitwise not, and logical not
-        i = 0
-        n = len(the_function.lines)
-        while i < n:
-            curr = the_function.lines[i].tokens
-            m = len(curr)
-            j = 0
-            while j < m:
-                # handle bitwise not and logical not
-                if curr[j] == "~" or curr[j] == "!":
-                    curr.insert(j, 0)
-                elif curr[j] == "-":
-                    # this is a negation if there is an operator, =, [, or ( directly before
-                    if j > 0:
-                        if curr[j-1] in operators or curr[j-1] in ["=", "[", "(", ",", ":"]:
-                            # convert to .negate()
-                            curr[j] = "("
-                            # the end of the negation will be directly before EOL or any operator
-                            while j < m:
-                                if curr[j] in operators or curr[j] in [")", "}", "]", "="]:
-                                    break
-
-                                j += 1
-                            curr.insert(j, ")")
-                            j += 1
-                            curr.insert(j, ".")
-                            j += 1
-                            curr.insert(j, "negate")
-                            j += 1
-                            curr.insert(j, "(")
-                            j += 1
-                            curr.insert(j, ")")
+        # every expression was already parsed (with its precedence) by the Parser,
+        # so each one is lowered in a single walk over its tree.
+        # lines like i += 1 are turned into i = i + 1 on the way
+        for body in bodies(the_function.body):
+            for i in range(len(body)):
+                body[i] = self.lower_statement(body[i])
 
-                j += 1
-
-            i += 1
-
-
-        # convert array accesses/splices
-        i = 0
-        n = len(the_function.lines)
-        while i < n:
-            curr = the_function.lines[i].tokens
-            m = len(curr)
-            j = 0
-
-            # only change this on lines that are not declarations
-            if the_function.lines[i].is_declaration == False:
-                while j < m:
-                    # look for [ and ]
-                    if curr[j] == "[":
-                        starti = i
-                        startj = j
-                        is_splice = False
-                        splicei = -1
-                        splicej = -1
-                        opens = 0
-                        while i < n:
-                            curr = the_function.lines[i].tokens
-                            m = len(curr)
-                            while j < m:
-                                # find the end of the access
-                                if curr[j] == "[":
-                                    opens += 1
-                                if curr[j] == "]":
-                                    opens -= 1
-                                if opens == 0:
-                                    break
-                                if opens == 1:
-                                    if curr[j] == ":":
-                                        is_splice = True
-                                        splicei = i 
-                                        splicej = j
-                                j += 1
-                            if opens == 0:
-                                break
-                            j = 0
-                            i += 1
-                        # found either the closing bracket or the end of the function
-                        if i == n and j == m:
-                            self.add_error("*", the_function.lines[starti], "SYNTAX", "'[' was unmatched...", "Add matching ']'.")
-                        else:
-                            # this can be an access, a splice, or an array declaration
-                            # if it is an access or a slice, there will be a word, ), or ] before it
-                            curr = the_function.lines[starti].tokens
-                            m = len(curr)
-                            is_splice_or_access = False
-                            if startj > 0:
-                                if curr[startj-1] != "=" and (curr[startj-1] not in operators or curr[startj-1] in [")", "]"]):
-                                    # this is a slice or access
-                                    is_splice_or_access = True
-
-                                    if is_splice:
-                                        # replace : with ,
-                                        # replace [ with ( and ] with )
-                                        # put splice before (
-                                        the_function.lines[splicei].tokens[splicej] = ","
-                                        the_function.lines[starti].tokens[startj] = "("
-                                        the_function.lines[i].tokens[j] = ")"
-                                        the_function.lines[starti].tokens.insert(startj, "splice")
-                                        the_function.lines[starti].tokens.insert(startj, ".")
-                                        startj += 2
-                                        splicej += 2
-                                        j += 2
-                                        m += 2
-
-                                        # set the arguments of splice to 0 if not present
-                                        if splicei == starti and splicej - startj == 1:
-                                            the_function.lines[splicei].tokens.insert(splicej, "0")
-                                            m += 1
-                                            splicej += 1
-                                            j += 1
-                                        if i == splicei and j - splicej == 1:
-                                            the_function.lines[i].tokens.insert(splicej+1, "0")
-                                            m += 1
-                                            j += 1
-
-                                        i = starti
-                                    else:
-                                        # a simple access
-                                        the_function.lines[starti].tokens[startj] = "("
-                                        the_function.lines[i].tokens[j] = ")"
-                                        the_function.lines[starti].tokens.insert(startj, "getElement")
-                                        the_function.lines[starti].tokens.insert(startj, ".")
-
-                                        m += 2
-                                        i = starti
-                                        j = startj + 2
-                            
-                            if not is_splice_or_access:
-                                # this is a declaration. join this onto one line
-                                while i > starti:
-                                    the_function.lines[i-1].tokens += the_function.lines[i].tokens
-                                    del the_function.lines[i]
-                                    i -= 1
-                                    n -= 1
-
-                                i = starti
-                                j = startj
-                        
-
-                    j += 1
-
-            i += 1
-        
-
-
-        # negations, array accesses, and unary operators are now taken care of
-
-        # operator:precedence
-        operator_functions = {
-                ")":")",
-
-                "||":"logicalOr",
-                "&&":"logicalAnd",
-                "|":"or",
-                "^":"xor",
-                "&":"and",
-
-                "==":"equals",
-                "!=":"doesNotEqual",
+        return the_function
 
-                ">":"isGreaterThan",
-                ">=":"isGreaterThanOrEqualTo",
-                "<":"isLessThan",
-                "<=":"isLessThanOrEqualTo",
+    def class_fields(self, the_class:Class):
+        # id(attribute) : the attribute with its value lowered to calls.
+        # the class can be shared with other builds, so a copy of it is lowered
+        # (once for each Sequencer) and kept here instead of on the class
+        result = self.fields.get(id(the_class))
+        if result == None:
+            result = {}
+            if the_class.body != None:
+                for x in the_class.body:
+                    if isinstance(x, Declaration):
+                        result[id(x)] = self.lower_statement(x.copy())
+            self.fields[id(the_class)] = result
+        return result
 
-                "<<":"leftShift",
-                ">>":"rightShift",
+    def field(self, attribute:Declaration):
+        # the variable of an attribute. Every function uses the same one,
+        # and its value is set once at the start of Main.main
+        varnum = self.field_variables.get(id(attribute))
+        if varnum != None:
+            return varnum
+        the_class = self.attributes[id(attribute)]
+        varnum = self.variables.add(attribute.name, self.class_table(the_class))
+        self.field_variables[id(attribute)] = varnum
+        debug(f"{attribute.name} is an attribute of {the_class.name}")
+
+        numbering = Numbering(self, the_class.name, the_class, self.variables)
+        self.variables.set_type(varnum, numbering.type(attribute.type, numbering.function_scope))
+        lowered = self.class_fields(the_class).get(id(attribute))
+        if lowered != None and lowered.value != None:
+            lowered.variable = varnum
+            numbering.line = lowered.line
+            # the attributes its value uses are set before it
+            numbering.expression(lowered.value, numbering.function_scope)
+            self.initializers.append((the_class, lowered))
+        return varnum
+
+    def lower_statement(self, node:Statement):
+        match node:
+            case Declaration() | Return() | ExpressionStatement():
+                if node.value != None:
+                    node.value = self.lower(node.value)
+            case Assignment():
+                node = self.desugar(node)
+                node.value = self.lower(node.value)
+                if isinstance(node.target, Index):
+                    # x[i] = y => x.setElement(i, y)
+                    setter = Call(Member(self.lower(node.target.value), "setElement"), [self.lower(node.target.index), node.value])
+                    return ExpressionStatement(setter, node.line)
+                node.target = self.lower(node.target)
+            case If() | While():
+                node.condition = self.lower(node.condition)
+            case For():
+                if node.init != None:
+                    node.init = self.lower_statement(node.init)
+                if node.condition != None:
+                    node.condition = self.lower(node.condition)
+                if node.step != None:
+                    node.step = self.lower_statement(node.step)
+            case ForEach():
+                node.iterable = self.lower(node.iterable)
+        return node
+
+    def lower(self, node:Node):
+        # the same expression with every operator replaced by a call
+        match node:
+            case BinaryOp():
+                return Call(Member(self.lower(node.left), OPERATOR_FUNCTIONS[node.op]), [self.lower(node.right)])
+            case UnaryOp():
+                if node.op == "new":
+                    return UnaryOp(node.op, self.lower(node.operand))
+                return Call(Member(self.lower(node.operand), OPERATOR_FUNCTIONS["unary " + node.op]), [])
+            case Index():
+                return Call(Member(self.lower(node.value), "getElement"), [self.lower(node.index)])
+            case Splice():
+                # the arguments of splice are 0 if they are left out
+                start = Literal("0") if node.start == None else self.lower(node.start)
+                end = Literal("0") if node.end == None else self.lower(node.end)
+                return Call(Member(self.lower(node.value), "splice"), [start, end])
+            case Call():
+                return Call(self.lower(node.function), [self.lower(x) for x in node.args])
+            case Keyword():
+                return Keyword(node.name, self.lower(node.value))
+            case Member():
+                return Member(self.lower(node.value), node.name)
+            case ArrayLiteral():
+                return ArrayLiteral([self.lower(x) for x in node.items])
+        return node
+
+
+    def follow(self, value, rest:list[str]):
+        # follow the names of rest through the classes they are in (Inner.Deeper.f).
+        # gives back what the path reached and the names that are left
+        while len(rest) > 0 and isinstance(value, Class):
+            table = self.class_table(value)
+            member = table.find_here(rest[0], set())
+            if member == None and isinstance(table.symbols.get("."), Class):
+                # the . class that wraps an import (lib . util)
+                value = table.symbols["."]
+                continue
+            if member == None:
+                break
+            value = member
+            rest = rest[1:]
+        return value, rest
+
+    def find_path(self, the_class:Class, path:list[str]):
+        # what a dotted path in the_class is (through its scopes, or from the
+        # global scope), and the names of the path that are left after it
+        value = self.class_table(the_class).find(path[0])
+        rest = path[1:]
+        if value == None:
+            value, depth = self.name_trie().find(path)
+            rest = path[depth:]
+        return self.follow(value, rest)
+
+    def is_reachable(self, x):
+        return self.reachable == None or id(x) in self.reachable
+
+    def remove_unreachable(self, main_function:Function):
+        # drop the classes and functions that Main.main can never reach, so that the
+        # later passes only see the parts of the imported files that are used.
+        # the classes can be shared with other builds, so they are not changed.
+        # the scopes leave out what is not reachable instead
+        reachability = Reachability(self)
+        self.reachable = reachability.run(main_function)
+        # id(class or function) : the class it is in
+        self.enclosing = reachability.enclosing
+        total = [0, 0]
+        dropped = [0, 0]
+        pending = list(self.classes)
+        while len(pending) > 0:
+            x = pending.pop()
+            total[0] += 1
+            total[1] += len(x.functions)
+            if not self.is_reachable(x):
+                debug(f"class {x.name} is never reached")
+                dropped[0] += 1
+            dropped[1] += len([f for f in x.functions if not self.is_reachable(f)])
+            pending += x.subclasses
+        debug(f"Dropped {dropped[0]}/{total[0]} classes and {dropped[1]}/{total[1]} functions that are never reached")
+
+        self.classes = [x for x in self.classes if self.is_reachable(x)]
+        self.tables = {}
+        self.imports = None
+        self.names = None
+
+    def imports_table(self):
+        # the global scope: every top level class, and the classes
+        # imported into the wrappers (private class . {}) of other files
+        if self.imports == None:
+            self.imports = SymbolTable(None, "imports")
+            pending = deque(self.classes)
+            while len(pending) > 0:
+                x = pending.popleft()
+                if x.name not in self.imports.symbols:
+                    self.imports.declare(x.name, x)
+                if not x.is_global:
+                    pending.extend([y for y in x.subclasses if self.is_reachable(y)])
+        return self.imports
+
+    def name_trie(self):
+        # every class, subclass and function by its dotted path. Imported classes
+        # can be reached through their wrappers (lib.util.Util) and by their own name
+        if self.names == None:
+            self.names = NameTrie()
+            pending = deque([([x.name], x) for x in self.classes])
+            while len(pending) > 0:
+                path, x = pending.popleft()
+                if x.name != ".":
+                    self.names.insert(path, x)
+                if len(path) > 1 and x.name in self.imports_table().symbols and x.name not in self.names.children:
+                    self.names.insert([x.name], x)
+                for f in x.functions:
+                    if self.is_reachable(f):
+                        self.names.insert(path + [f.name], f)
+                for y in x.subclasses:
+                    if not self.is_reachable(y):
+                        continue
+                    # the . classes that wrap imports (lib . util) are not part of the path
+                    if y.name == ".":
+                        pending.append((path, y))
+                    else:
+                        pending.append((path + [y.name], y))
+        return self.names
+
+    def class_table(self, the_class:Class):
+        # the scope of a class: its attributes, functions, subclasses and aliases,
+        # followed by the classes it extends
+        table = self.tables.get(id(the_class))
+        if table != None:
+            return table
+
+        table = SymbolTable(self.imports_table(), the_class.name)
+        # stored before the parents are added, in case two classes extend each other
+        self.tables[id(the_class)] = table
+
+        if the_class.body != None:
+            for node in the_class.body:
+                if isinstance(node, Declaration):
+                    table.declare(node.name, node)
+                    self.attributes[id(node)] = the_class
+        for x in the_class.functions:
+            if self.is_reachable(x):
+                table.declare(x.name, x)
+        for x in the_class.subclasses:
+            if self.is_reachable(x):
+                table.declare(x.name, x)
+        for x in the_class.uses:
+            table.aliases[x.second] = x.path
+
+        for name in the_class.parents:
+            parent = table.parent.find(name)
+            if isinstance(parent, Class):
+                table.bases.append(self.class_table(parent))
+            else:
+                debug(f"class {the_class.name} extends {name}, which was not found")
 
-                "+":"plus",
-                "-":"minus",
+        return table
 
-                "%":"mod",
-                "*":"times",
-                "/":"dividedBy",
+    def number_variables(self, the_function:Function, the_class:Class, variables:Variables=None, call_stack=[], is_global=True):
+        # each statement in the function should be one of the following:
+        #   a variable declaration
+        #   a function call
+        #   a control flow statement (if, for, while, switch)
 
-                "~":"not",
-                "!":"logicalNot",
+        # should perform access checking to make sure that nothing defies access specifiers
 
-                "(":"(",
+        # the names, types and sizes of the variables
+        if variables == None:
+            variables = Variables()
+
+        numbering = Numbering(self, the_function.name, the_class, variables)
+        numbering.run(the_function)
+        found = numbering.found
+
+        debug(str({x: variable_text(found[x]) for x in found}))
+        debug(str(variables.type_texts()))
+
+        return the_function, found, variables
+
+
+
+    def type_text(self, node:Node):
+        # the type of an argument as it is known at the call ("*" if it is not)
+        match node:
+            case Literal():
+                return literal_type(node.value)
+            case Name():
+                if node.name in ["true", "false"]:
+                    return "bool"
+                num = node.variable
+                if isinstance(num, int) and self.variables.types[num] != None:
+                    return "|".join([variable_text(x) for x in self.variables.types[num]])
+            case Call(function=Member()):
+                # an operator that was turned into a call (n - 1 is n.minus(1))
+                if node.function.name in BOOL_FUNCTIONS:
+                    return "bool"
+                if node.function.name in OPERATOR_FUNCTIONS.values():
+                    return self.type_text(node.function.value)
+        return "*"
+
+    def resolve_function(self, the_class:Class, node:Name):
+        # the function (and its class) that a call to a name in the_class calls
+        # None if it is not a function of a class in the program
+        table = self.class_table(the_class)
+        path = table.expand(node.name.split("."))
+        the_type = None
+        if isinstance(node.variable, tuple):
+            # a method of a variable, as it was numbered in the scope of the call
+            the_type = self.variables.types[node.variable[0]]
+        if len(path) > 1 and the_type != None and len(the_type) == 1 and isinstance(the_type[0], int):
+            # a method of a variable whose type is a class
+            value, rest = self.find_path(the_class, [self.variables.names[the_type[0]]] + path[1:])
+        else:
+            value, rest = self.find_path(the_class, path)
+        if len(rest) > 0 or not isinstance(value, Function) or id(value) not in self.enclosing:
+            return None
+        return value, self.enclosing[id(value)]
+
+    def calls(self, body:list[Statement], the_class:Class):
+        # the functions the statements of a trace call, with the types of the arguments.
+        # the names were already numbered in their scopes, so the types are
+        # the ones of the variables the call can see
+        result = []
+        for node in walk(body):
+            for expression in statement_expressions(node):
+                for x in expression_nodes(expression):
+                    if not isinstance(x, Call) or not isinstance(x.function, Name):
+                        continue
+                    callee = self.resolve_function(the_class, x.function)
+                    if callee != None:
+                        result.append((x, callee[0], callee[1], tuple([self.type_text(y) for y in x.args])))
+        return result
 
-                }
-        operators = {
-                ",":-2,
-                ")":-1,
+    def trace_function(self, the_function:Function, the_class:Class, arg_types:tuple=(), call_stack:list[str]=None):
+        # trace a function for the types of the arguments it is called with.
+        # every (class, function, argument types) is only traced once, later
+        # calls get the same trace. Recursive calls stop at the cache too, since
+        # a trace is stored before the functions it calls are traced
+        if call_stack == None:
+            call_stack = [f"{the_class.name}.{the_function.name}"]
+        key = (id(the_class), id(the_function), arg_types)
+        if key in self.traces:
+            self.trace_hits += 1
+            debug(f"{' -> '.join(call_stack)} {arg_types} was already traced")
+            return self.traces[key]
 
-                "||":0,
-                "&&":1,
-                "|":2,
-                "^":3,
-                "&":4,
+        traced = the_function.copy()
+        self.traces[key] = traced
+        self.trace_keys[id(traced)] = (the_class, arg_types)
 
-                "==":5,
-                "!=":5,
+        traced = self.convert_operations(traced)
 
-                ">":6,
-                ">=":6,
-                "<":6,
-                "<=":6,
+        traced, found, variables = self.number_variables(traced, the_class, self.variables, call_stack)
 
-                "<<":7,
-                ">>":7,
+        # the params take the types of the arguments when they could be more than one type
+        for param, the_type in zip(traced.params, arg_types):
+            declared = variables.types[param]
+            if the_type != "*" and (declared == None or declared == ["*"] or len(declared) > 1):
+                variables.set_type(param, [the_type])
 
-                "+":8,
-                "-":8,
+        self.callees[id(traced)] = []
+        for call, callee, callee_class, types in self.calls(traced.body, the_class):
+            self.call_targets[id(call)] = self.trace_function(callee, callee_class, types, call_stack + [f"{callee_class.name}.{callee.name}"])
+            self.callees[id(traced)].append(self.call_targets[id(call)])
 
-                "%":9,
-                "*":9,
-                "/":9,
+        return traced
 
-                "~":10,
-                "!":10,
 
-                "(":11,
+    def trace(self):
 
-                }
+        debug("Tracing...")
 
-        #operators = set(["+", "-", "*", "/", "==", "!=", ">", "<", ">=", "<=", "~", "|", "&", "%", "^", "!", "&&", "||", ">>", "<<"])
+        # get the main class and function
+        main_class, main_function = self.find_main_function()
 
-        # x = 2 + 4 * 5
-        # x = 2.plus(4.times(5))
+        # there is nothing to trace without a main class and function
+        # (find_main_function already added the error)
+        if main_class == None or main_function == None:
+            return
 
-        # x = (2 + 4) * 5
-        # x = 2.plus(4).times(5)
+        self.remove_unreachable(main_function)
 
-        op_stack = []
+        main_function = self.trace_function(main_function, main_class)
+        self.main_trace = main_function
 
+        # the functions that the values of the attributes call
+        # (tracing them can add more attributes)
         i = 0
-        n = len(the_function.lines)
-        while i < n:
-            # search through the lines of the function for these operators
-            curr = the_function.lines[i].tokens
-            m = len(curr)
-
-            j = 0
-            last_was_op = False
-            while j < m:
-                # search through a single line for these operators
-                if curr[j] in operators:
-                    # we found an operator
-                    if len(op_stack) == 0:
-                        op_stack.append(curr[j])
-                        if curr[j] != "(":
-                            curr.insert(j, ".")
-                            j += 1
-                            m += 1
-                            curr.insert(j, operator_functions[curr[j]])
-                            j += 1
-                            m += 1
-                        curr[j] = "("
-                    elif operators[curr[j]] > operators[op_stack[-1]]:
-                        # if you find an operator with higher precendence, 
-                        # start this operator and continue the one before
-                        op_stack.append(curr[j])
-                        if curr[j] != "(":
-                            curr.insert(j, ".")
-                            j += 1
-                            m += 1
-                            curr.insert(j, operator_functions[curr[j]])
-                            j += 1
-                            m += 1
-                        curr[j] = "("
-
-                    else:
-                        # while this operator has lower or equal precedence,
-                        # close the top operator and pop it
-                        # then open this operator
-                        if curr[j] != "(":
-                            if curr[j] == ")":
-                                # pop from the stack until reaching (
-                                while len(op_stack) > 0 and op_stack[-1] != "(":
-                                    curr.insert(j, ")")
-                                    j += 1
-                                    m += 1
-                                    op_stack.pop()
-
-                                j += 1
-                                if len(op_stack) > 0:
-                                    op_stack.pop()
-                                
-
-                            elif curr[j] == ",":
-                                # pop from the stack until reaching (
-                                while len(op_stack) > 0 and op_stack[-1] != "(":
-                                    curr.insert(j, ")")
-                                    j += 1
-                                    m += 1
-                                    op_stack.pop()
-                            else:
-
-                                while len(op_stack) > 0 and operators[curr[j]] <= operators[op_stack[-1]] and op_stack[-1] != "(":
-                                    curr.insert(j, ")")
-                                    j += 1
-                                    m += 1
-                                    op_stack.pop()
-                                op_stack.append(curr[j])
-                                curr.insert(j, ".")
-                                j += 1
-                                m += 1
-                                curr.insert(j, operator_functions[curr[j]])
-                                j += 1
-                                m += 1
-
-                                curr[j] = "("
-
-                    last_was_op = True
-                else:
-                    last_was_op = False
-                
-                j += 1
-
-            while len(op_stack) > 0:
-                curr.append(")")
-                op_stack.pop()
-                
-                
+        while i < len(self.initializers):
+            the_class, attribute = self.initializers[i]
+            for call, callee, callee_class, types in self.calls([attribute], the_class):
+                self.call_targets[id(call)] = self.trace_function(callee, callee_class, types)
             i += 1
+        debug(f"Traced {len(self.traces)} functions ({self.trace_hits} calls reused a trace)")
+
+        # variables are only written as #N here
+        for node in walk(main_function.body):
+            tokens = statement_tokens(node)
+            if tokens != None:
+                debug(str(tokens))
+
+
+# TCABIR (see tcabir/readme.md). Every instruction is an opcode and three operands
+# (a, b, c), which are variables (#N), literals (0-255) or indexes into the tables
+# of a Program. Operands that are not used are 0
+IR_SET = 0          # #a = b (b is a literal)
+IR_COPY = 1         # #a = #b
+IR_CONST = 2        # #a = constants[b] (numbers and strings that are not a literal)
+IR_LOAD = 3         # #a = #b[#c]
+IR_STORE = 4        # #a[#b] = #c
+IR_ARG = 5          # #a is the next argument of the next call
+IR_CALL = 6         # #a = functions[b](the c arguments before it)
+IR_IF = 7           # if #a {
+IR_ELSE = 8         # } else {
+IR_LOOP = 9         # while 1 {
+IR_END = 10         # }
+IR_BREAK = 11
+IR_CONTINUE = 12
+IR_RETURN = 13      # return #a (nothing is given back if a is -1)
+IR_FUNCTION = 14    # the start of functions[a]
+IR_PARAM = 15       # #a is the next param of the function
+# #a = #b <op> #c, where op is IR_BINARY_OPERATORS[opcode - IR_BINARY]
+IR_BINARY = 32
+# #a = <op>#b, where op is IR_UNARY_OPERATORS[opcode - IR_UNARY]
+IR_UNARY = 64
+
+IR_BINARY_OPERATORS = ["+", "-", "*", "/", "%", "&", "|", "^", "<<", ">>", "==", "!=", "<", ">", "<=", ">=", "&&", "||"]
+IR_UNARY_OPERATORS = ["-", "~", "!"]
+
+# how many operands of each opcode (below IR_BINARY) are written to a file
+IR_OPERANDS = [2, 2, 2, 3, 3, 1, 3, 1, 0, 0, 0, 0, 0, 1, 1, 1]
+
+
+def ir_operator_codes():
+    # the function an operator was lowered to (see OPERATOR_FUNCTIONS) : its opcode
+    result = {}
+    for op, name in OPERATOR_FUNCTIONS.items():
+        if op.startswith("unary "):
+            result[name] = IR_UNARY + IR_UNARY_OPERATORS.index(op[6:])
+        else:
+            result[name] = IR_BINARY + IR_BINARY_OPERATORS.index(op)
+    return result
 
-
-        # all operators have now been correctly converted into function calls
-
-        return the_function
-
-
-    def number_variables(self, the_function:Function, the_class:Class, starting_number:int=0, call_stack=[], is_global=True):
-        # each line in the function should be one of the following:
-        #   a variable declaration
-        #   a function call
-        #   a control flow statement (if, for, while, switch)
-
-        # should perform access checking to make sure that nothing defies access specifiers
-        
-        builtins = ["int", "bool", "float", "short", "long", "double", "char", "void", "if", "(", ")", "{", "}", "[", "]", ",", "while", "for", "switch", "case", "return", "=", "break", "continue", "private", "public", "protected", "static", ","]
-        builtins = set(builtins)
-
-        builtin_types = set(["int", "bool", "float", "short", "long", "double", "char", "void", "*"])
-
-
-        # "name":"#<varnum>"
-        found = {}
-        # "#<varnum>":"name"
-        reverse = {}
-        # "#<varnum>":"type"
-        types = {}
+IR_OPERATOR_CODES = ir_operator_codes()
 
 
-        # parse through the function's params
-        curr = " ".join(the_function.params)
-        curr = curr.split(" , ")
-        new_params = []
-        curr = [x.strip() for x in curr]
-        for x in range(len(curr)):
-            splitted = curr[x].split(" ")
-            varname = splitted[-1]
-            vartype = splitted[:-1]
-            vartype = "".join(vartype).split("|")
-            for y in range(len(vartype)):
-                if y not in builtin_types:
-                    varnum = f"#{starting_number}"
-                    found[vartype[y]] = varnum
-                    reverse[varnum] = vartype[y]
-                    types[varnum] = ["class"]
-                    vartype[y] = varnum
-                    starting_number += 1
-            
-            varnum = f"#{starting_number}"
-            found[varname] = varnum
-            reverse[varnum] = varname
-            types[varnum] = vartype
-            
-            new_params.append(varnum)
+def ir_operand_count(opcode:int):
+    if opcode >= IR_UNARY:
+        return 2
+    if opcode >= IR_BINARY:
+        return 3
+    return IR_OPERANDS[opcode]
 
-            starting_number += 1
 
-        the_function.params = new_params
+# the operands (1 is a, 2 is b, 3 is c) that each opcode (below IR_BINARY) reads
+IR_READS = [(), (2,), (), (2, 3), (1, 2, 3), (1,), (), (1,), (), (), (), (), (), (1,), (), ()]
 
 
-        i = 0
-        n = len(the_function.lines)
-        # iterate through the lines of the function
-        line_number = []
-        while i < n:
-            curr = the_function.lines[i].tokens.copy()
-            j = 0
-            while j < len(curr):
-                # get rid of line number tokens
-                if len(curr[j]) > 0:
-                    if curr[j][0] == '`':
-                        line_number = [curr[j]]
-                        del curr[j]
-                        j -= 1
-
-                # combine all $ with the token after them
-                if curr[j] == "$":
-                    if m > j + 1:
-                        curr[j] = curr[j] + curr[j + 1]
-                        del curr[j+1]
-                        m -= 1
+def ir_reads(opcode:int, a:int):
+    if opcode >= IR_UNARY:
+        return (2,)
+    if opcode >= IR_BINARY:
+        return (2, 3)
+    if opcode == IR_RETURN and a == -1:
+        return ()
+    return IR_READS[opcode]
 
-                j += 1
-            j = 0
-            m = len(curr)
 
-            # iterate through the tokens in this line
-            while j < m:
-                if curr[j] != "(":
-                    # if the next token is . 
-                    # keep combining tokens until it is not
-                    added = ""
-                    while j + 1 < m and (added == "." or curr[j+1] == "."):
-                        added = curr[j+1]
-                        curr[j] = curr[j] + curr[j+1]
-                        del curr[j+1]
-                        m -= 1
-
-                    # check if the combined token was found
-                    if curr[j] not in builtins:
-                        if curr[j] not in found:
-                            # make sure this is not just a float
-                            try:
-                                float(curr[j])
-                            except:
-                                debug(f"Found new variable: {curr[j]}")
-                                varnum = f"#{starting_number}"
-                                found[curr[j]] = varnum
-                                reverse[varnum] = curr[j]
-
-                                # determine the type of this variable
-                                # if it is the first token in a declaration
-                                if the_function.lines[i].is_declaration:
-                                    if j == 0:
-                                        # it is a class
-                                        types[varnum] = ["class"]
-                                    elif j == m - 1:
-                                        # if it is the last token in a declaration,
-                                        # it is either the type right before it
-                                        # or it is inferred (*)
-                                        resulting_type = ""
-                                        for k in range(j-1, -1, -1):
-                                            if curr[k] not in ["private", "public", "protected", "static"]:
-                                                resulting_type = curr[k] + resulting_type
-                                            else:
-                                                break
-                                        types[varnum] = [resulting_type]
-
-
-                                starting_number += 1
-
-                            # TODO
-                            # check to make sure that the new variable
-                            # does not violate access specifiers
-
-                            # built-ins such as 2, 2.3, "hello", or 'c' can be treated as global
-                            is_builtin_type = False
-                            splitted = curr[j].split(".")[0]
-                            try:
-                                int(splitted[0])
-                                is_builtin_type = True
-                            except:
-                                pass
-
-                            if len(curr[j]) > 0:
-                                if curr[j][0] == '"' and curr[j][-1] == '"':
-                                    is_builtin_type = True
-                                elif curr[j][0] == "'" and curr[j][-1] == "'":
-                                    is_builtin_type = True
-                            
+def ir_written(opcode:int, a:int):
+    # the variable an instruction writes (None if it does not write one).
+    # a store changes the array it stores into
+    if opcode >= IR_BINARY or opcode in (IR_SET, IR_COPY, IR_CONST, IR_LOAD, IR_STORE, IR_CALL, IR_PARAM):
+        return a
+    return None
 
-                            if not is_builtin_type:
-                                # make sure that the type exists and find function call definitions
 
-                                debug(f"{curr[j]} is not a builtin")
+def write_varint(out:bytearray, value:int):
+    # zigzag (so that -1 stays small), then 7 bits per byte
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
 
-                                # if this is a declaration, we are good
-                                if the_function.lines[i].is_declaration:
-                                    debug(f"this was a declaration of {curr[j]}")
-                                    continue
-                                
-
-                                # local scope is already checked (and args)
-
-                                # TODO: check parent (extended) classes to see if it exists there
-                                
-
-                                # check use statements to see if it is an alias
-                                aliased = False
-                                for k in range(len(the_class.uses)):
-                                    if the_class.uses[k].second == curr[j]:
-                                        # this is something that was aliased
-                                        # replace curr[j] with the thing that was aliased
-                                        curr[j] = the_class.uses[k].first
-                                        aliased = True
-                                        break
-                                if aliased:
-                                    # rerun the loop on the same variable now that it is aliased
-                                    continue
-                                
-                                # check instance variables (the only lines left in the class scope)
-                                if not the_class.converted:
-                                    the_class = self.convert_operations(the_class)
-                                    the_class.converted = True
-                                    # TODO
-                                    
 
-                                # check other classes if this is a global class
+def read_varint(data:bytes, position:int):
+    # gives back the value and the position after it
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return (result >> 1) ^ -(result & 1), position
 
 
-                                # we first need to know the type of each thing
-                                # if the variable was a function, make sure it is a valid access
-                                # recursively modify and add them
-                                # directly above where they are used
-                                # make sure to keep track of the function call trace so that recursive
-                                # functions are not recursively added
-                                pass
-                            
+class Program:
+    """
+    The TCABIR of a whole program.
+    The instructions are kept in one flat array, four ints each (opcode, a, b, c),
+    so that the passes over them do not go through a list of objects.
+    A program can be written to a compact binary file (each operand is a varint,
+    and only the operands an opcode uses are written) and dumped as text in the
+    form of tcabir/readme.md
+    """
+    MAGIC = b"TCABIR"
+    VERSION = 1
 
-                    if curr[j] in found:
-                        curr[j] = found[curr[j]]
-                        
-                j += 1
+    def __init__(self):
+        self.code = array('i')
+        # the names of the functions that are called (traced functions and system calls)
+        self.functions = []
+        self.function_ids = {}
+        # numbers and strings that do not fit in a literal (as written)
+        self.constants = []
+        self.constant_ids = {}
+        # the type (as text, "" if it is not known) and size in bytes of every variable
+        self.types = []
+        self.sizes = []
+
+    def __len__(self):
+        return len(self.code) // 4
+
+    def emit(self, opcode:int, a:int=0, b:int=0, c:int=0):
+        self.code.extend((opcode, a, b, c))
+
+    def instruction(self, i:int):
+        return self.code[4*i], self.code[4*i + 1], self.code[4*i + 2], self.code[4*i + 3]
+
+    def remove(self, dead:bytearray):
+        # drop every instruction i where dead[i] is set
+        if dead.count(1) == 0:
+            return
+        code = self.code
+        result = array('i')
+        for i in range(len(self)):
+            if not dead[i]:
+                result.extend(code[4*i:4*i + 4])
+        self.code = result
+
+    def function_id(self, name:str):
+        if name not in self.function_ids:
+            self.function_ids[name] = len(self.functions)
+            self.functions.append(name)
+        return self.function_ids[name]
+
+    def constant_id(self, value:str):
+        if value not in self.constant_ids:
+            self.constant_ids[value] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_ids[value]
+
+    def to_bytes(self):
+        out = bytearray(self.MAGIC)
+        out.append(self.VERSION)
+        for table in [self.functions, self.constants, self.types]:
+            write_varint(out, len(table))
+            for x in table:
+                data = x.encode("utf-8")
+                write_varint(out, len(data))
+                out += data
+        # one size for every type
+        for x in self.sizes:
+            write_varint(out, x)
+        write_varint(out, len(self))
+        code = self.code
+        for i in range(0, len(code), 4):
+            out.append(code[i])
+            for k in range(ir_operand_count(code[i])):
+                write_varint(out, code[i + 1 + k])
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data:bytes):
+        if data[:len(cls.MAGIC)] != cls.MAGIC or data[len(cls.MAGIC)] != cls.VERSION:
+            raise ValueError("not a TCABIR file (or from another version)")
+        result = cls()
+        position = len(cls.MAGIC) + 1
+        tables = []
+        for k in range(3):
+            count, position = read_varint(data, position)
+            table = []
+            for x in range(count):
+                length, position = read_varint(data, position)
+                table.append(data[position:position + length].decode("utf-8"))
+                position += length
+            tables.append(table)
+        result.functions, result.constants, result.types = tables
+        result.function_ids = {result.functions[i]: i for i in range(len(result.functions))}
+        result.constant_ids = {result.constants[i]: i for i in range(len(result.constants))}
+        for x in range(len(result.types)):
+            size, position = read_varint(data, position)
+            result.sizes.append(size)
+        count, position = read_varint(data, position)
+        for x in range(count):
+            opcode = data[position]
+            position += 1
+            operands = [0, 0, 0]
+            for k in range(ir_operand_count(opcode)):
+                operands[k], position = read_varint(data, position)
+            result.emit(opcode, *operands)
+        return result
 
-            # recreate the line with the changes
-            the_function.lines[i].tokens = line_number + curr
+    def write(self, filename:str):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
 
-            i += 1
+    @classmethod
+    def read(cls, filename:str):
+        with open(filename, "rb") as f:
+            return cls.from_bytes(f.read())
 
-        print(found)
-        print(types)
+    def text(self):
+        # the program as text, one operation per line
+        result = []
+        depth = 0
+        args = []
+        for i in range(len(self)):
+            opcode, a, b, c = self.instruction(i)
+            line = None
+            if opcode >= IR_UNARY:
+                line = f"#{a} = {IR_UNARY_OPERATORS[opcode - IR_UNARY]}#{b}"
+            elif opcode >= IR_BINARY:
+                line = f"#{a} = #{b} {IR_BINARY_OPERATORS[opcode - IR_BINARY]} #{c}"
+            elif opcode == IR_SET:
+                line = f"#{a} = {b}"
+            elif opcode == IR_COPY:
+                line = f"#{a} = #{b}"
+            elif opcode == IR_CONST:
+                line = f"#{a} = {self.constants[b]}"
+            elif opcode == IR_LOAD:
+                line = f"#{a} = #{b}[#{c}]"
+            elif opcode == IR_STORE:
+                line = f"#{a}[#{b}] = #{c}"
+            elif opcode == IR_ARG:
+                args.append(f"#{a}")
+            elif opcode == IR_CALL:
+                line = f"#{a} = {self.functions[b]}({', '.join(args[len(args) - c:])})"
+                args = args[:len(args) - c]
+            elif opcode == IR_IF:
+                line = f"if #{a} {{"
+            elif opcode == IR_ELSE:
+                line = "} else {"
+            elif opcode == IR_LOOP:
+                line = "while 1 {"
+            elif opcode == IR_END:
+                line = "}"
+            elif opcode == IR_BREAK:
+                line = "break"
+            elif opcode == IR_CONTINUE:
+                line = "continue"
+            elif opcode == IR_RETURN:
+                line = "return" if a == -1 else f"return #{a}"
+            elif opcode == IR_FUNCTION:
+                line = f"function {self.functions[a]} {{"
+            elif opcode == IR_PARAM:
+                line = f"param #{a}"
+            if line == None:
+                continue
+            if line[0] == "}":
+                depth -= 1
+            result.append("    " * depth + line)
+            if line[-1] == "{":
+                depth += 1
+        return "\n".join(result)
+
+
+class Lowerer:
+    """
+    Lowers the functions a Sequencer traced to TCABIR.
+    Expressions are flattened to one operation per instruction, with a new
+    variable for every value in between. A call between traced functions goes
+    to the specialization that the Sequencer traced for it. TCABIR only has
+    while loops, so for loops become a loop that breaks when its condition fails.
+    All variables of TCABIR are global, so a call has no frame of its own, and
+    a function that calls itself (through any number of calls) is an error.
+    The attributes are set at the start of Main.main
+    """
+    def __init__(self, sequencer:Sequencer):
+        self.sequencer = sequencer
+        self.variables = sequencer.variables
+        self.program = Program()
+        self.EXCEPTIONS = []
+        # the class and statement being lowered (for errors)
+        self.the_class = None
+        self.statement = None
+        # the step of every loop being lowered (None for while loops), run before a continue
+        self.steps = []
+        # the traced function being lowered
+        self.function = None
+        # id(traced function) : ids of the traced functions it can reach through calls
+        self.reached = {}
+
+        self.lower()
+
+    def add_error(self, cause:str):
+        result = ErrorMessage()
+        result.file = self.the_class.file
+        result.type = "IR"
+        result.line_number = "0" if self.statement.line == None else str(self.statement.line.line_number)
+        result.source = self.sequencer.sources.get(self.the_class.file)
+        result.cause = cause
+        result.suggestions = "This can not be compiled yet."
+        self.EXCEPTIONS.append(result)
 
-        return the_function, found, reverse, types
+    def lower(self):
+        debug("Lowering to TCABIR...")
+        for the_function in self.sequencer.traces.values():
+            self.lower_function(the_function)
+
+        # every variable, including the ones made while lowering
+        for i in range(len(self.variables)):
+            the_type = self.variables.types[i]
+            self.program.types.append("" if the_type == None else "|".join([variable_text(x) for x in the_type]))
+            self.program.sizes.append(self.variables.sizes[i])
+        debug(f"{len(self.program)} instructions, {len(self.program.types)} variables")
+
+    def function_id(self, the_function:Function):
+        # the name of a traced function, with the types it was traced for
+        the_class, arg_types = self.sequencer.trace_keys[id(the_function)]
+        name = f"{the_class.name}.{the_function.name}"
+        if len(arg_types) > 0:
+            name += f"({', '.join(arg_types)})"
+        return self.program.function_id(name)
+
+    def lower_function(self, the_function:Function):
+        self.function = the_function
+        self.program.emit(IR_FUNCTION, self.function_id(the_function))
+        for x in the_function.params:
+            self.program.emit(IR_PARAM, x)
+        if the_function is self.sequencer.main_trace:
+            for the_class, attribute in self.sequencer.initializers:
+                self.the_class = the_class
+                self.lower_statement(attribute)
+        self.the_class = self.sequencer.trace_keys[id(the_function)][0]
+        self.lower_body(the_function.body)
+        self.program.emit(IR_END)
+
+    def reaches(self, the_function:Function, target:Function):
+        # whether the_function can call target (through any number of calls)
+        if id(the_function) not in self.reached:
+            reached = set()
+            pending = list(self.sequencer.callees.get(id(the_function), []))
+            while len(pending) > 0:
+                x = pending.pop()
+                if id(x) not in reached:
+                    reached.add(id(x))
+                    pending += self.sequencer.callees.get(id(x), [])
+            self.reached[id(the_function)] = reached
+        return id(target) in self.reached[id(the_function)]
+
+    def lower_body(self, body:list[Statement]):
+        for node in body:
+            self.lower_statement(node)
+
+    def temporary(self):
+        # a new variable for a value in between
+        return self.variables.add("", None)
+
+    def variable(self, node:Node):
+        # the variable a Name or Declaration was numbered as
+        if isinstance(node.variable, int):
+            return node.variable
+        if isinstance(node.variable, tuple):
+            self.add_error(f"{node.name} is a member of a variable, which can not be used here yet")
+        elif id(node) not in self.sequencer.unknown:
+            self.add_error(f"{node.name} was never numbered")
+        return self.temporary()
+
+    def member(self, value:tuple):
+        # the variable a member (p.x is (3, "x")) is stored in, and its key.
+        # members are stored by name, the way elements are stored by index
+        receiver = value[0]
+        path = value[1].split(".")
+        for x in path[:-1]:
+            inner = self.temporary()
+            self.program.emit(IR_LOAD, inner, receiver, self.literal(f'"{x}"'))
+            receiver = inner
+        return receiver, self.literal(f'"{path[-1]}"')
+
+    def exit_unless(self, condition:int):
+        # leave the loop if condition is 0
+        failed = self.temporary()
+        self.program.emit(IR_UNARY + IR_UNARY_OPERATORS.index("!"), failed, condition)
+        self.program.emit(IR_IF, failed)
+        self.program.emit(IR_BREAK)
+        self.program.emit(IR_END)
+
+    def lower_statement(self, node:Statement):
+        self.statement = node
+        emit = self.program.emit
+        match node:
+            case Declaration():
+                if node.value != None:
+                    self.lower_expression(node.value, self.variable(node))
+            case Assignment(target=Name(variable=tuple()), op="="):
+                receiver, key = self.member(node.target.variable)
+                emit(IR_STORE, receiver, key, self.lower_expression(node.value))
+            case Assignment(target=Name(), op="="):
+                self.lower_expression(node.value, self.variable(node.target))
+            case ExpressionStatement():
+                self.lower_expression(node.value)
+            case If():
+                emit(IR_IF, self.lower_expression(node.condition))
+                self.lower_body(node.body)
+                if len(node.orelse) > 0:
+                    emit(IR_ELSE)
+                    self.lower_body(node.orelse)
+                emit(IR_END)
+            case While():
+                self.steps.append(None)
+                emit(IR_LOOP)
+                self.exit_unless(self.lower_expression(node.condition))
+                self.lower_body(node.body)
+                emit(IR_END)
+                self.steps.pop()
+            case For():
+                if node.init != None:
+                    self.lower_statement(node.init)
+                self.statement = node
+                self.steps.append(node.step)
+                emit(IR_LOOP)
+                if node.condition != None:
+                    self.exit_unless(self.lower_expression(node.condition))
+                self.lower_body(node.body)
+                if node.step != None:
+                    self.lower_statement(node.step)
+                emit(IR_END)
+                self.steps.pop()
+            case Scope():
+                self.lower_body(node.body)
+            case Return():
+                if node.value == None:
+                    emit(IR_RETURN, -1)
+                else:
+                    emit(IR_RETURN, self.lower_expression(node.value))
+            case Break():
+                emit(IR_BREAK)
+            case Continue():
+                # the step of a for loop still runs before the next time around
+                if len(self.steps) > 0 and self.steps[-1] != None:
+                    self.lower_statement(self.steps[-1])
+                emit(IR_CONTINUE)
+            case _:
+                self.add_error(f"{type(node).__name__} statements can not be lowered to TCABIR yet")
+
+    def literal(self, value:str, dest:int=None):
+        if dest == None:
+            dest = self.temporary()
+        if value[0] == "'" and len(value) == 3:
+            value = str(ord(value[1]))
+        try:
+            number = int(value)
+        except ValueError:
+            number = -1
+        if number < 0:
+            self.program.emit(IR_CONST, dest, self.program.constant_id(value))
+            return dest
+
+        # literals only go up to 255, so bigger numbers are put together a byte at a time
+        parts = number.to_bytes(max(1, (number.bit_length() + 7) // 8), "big")
+        self.program.emit(IR_SET, dest, parts[0])
+        if len(parts) > 1:
+            shift = self.temporary()
+            byte = self.temporary()
+            self.program.emit(IR_SET, shift, 8)
+            for x in parts[1:]:
+                self.program.emit(IR_BINARY + IR_BINARY_OPERATORS.index("<<"), dest, dest, shift)
+                self.program.emit(IR_SET, byte, x)
+                self.program.emit(IR_BINARY + IR_BINARY_OPERATORS.index("|"), dest, dest, byte)
+        return dest
+
+    def call(self, function_id:int, args:list[int], dest:int=None):
+        if dest == None:
+            dest = self.temporary()
+        for x in args:
+            self.program.emit(IR_ARG, x)
+        self.program.emit(IR_CALL, dest, function_id, len(args))
+        return dest
+
+    def lower_expression(self, node:Node, dest:int=None):
+        # emit the instructions of an expression. Gives back the variable with its value
+        # (dest if it is given)
+        emit = self.program.emit
+        match node:
+            case Literal():
+                return self.literal(node.value, dest)
+            case Name(name="true") | Name(name="false"):
+                return self.literal("1" if node.name == "true" else "0", dest)
+            case Name(variable=tuple()):
+                receiver, key = self.member(node.variable)
+                if dest == None:
+                    dest = self.temporary()
+                emit(IR_LOAD, dest, receiver, key)
+                return dest
+            case Name():
+                source = self.variable(node)
+                if dest == None or dest == source:
+                    return source
+                emit(IR_COPY, dest, source)
+                return dest
+            case Call(function=Member()):
+                method = node.function.name
+                receiver = self.lower_expression(node.function.value)
+                args = [self.lower_expression(x) for x in node.args]
+                code = IR_OPERATOR_CODES.get(method)
+                if method == "setElement" and len(args) == 2:
+                    # the value of a store is the value stored
+                    emit(IR_STORE, receiver, args[0], args[1])
+                    if dest == None or dest == args[1]:
+                        return args[1]
+                    emit(IR_COPY, dest, args[1])
+                    return dest
+                if dest == None:
+                    dest = self.temporary()
+                if code != None and code >= IR_UNARY and len(args) == 0:
+                    emit(code, dest, receiver)
+                elif code != None and code < IR_UNARY and len(args) == 1:
+                    emit(code, dest, receiver, args[0])
+                elif method == "getElement" and len(args) == 1:
+                    emit(IR_LOAD, dest, receiver, args[0])
+                else:
+                    # any other method is a call with what it is called on as the first argument
+                    self.call(self.program.function_id(method), [receiver] + args, dest)
+                return dest
+            case Call(function=Name()):
+                args = [self.lower_expression(x) for x in node.args]
+                target = self.sequencer.call_targets.get(id(node))
+                if target != None:
+                    if target is self.function or self.reaches(target, self.function):
+                        # the callee would write over the variables of this call
+                        caller = self.program.functions[self.function_id(self.function)]
+                        callee = self.program.functions[self.function_id(target)]
+                        cause = f"{caller} calls itself" if target is self.function else f"{caller} calls {callee}, which calls {caller} again"
+                        self.add_error(f"{cause}, but TCABIR variables are global, so recursion can not be lowered yet")
+                    return self.call(self.function_id(target), args, dest)
+                value = node.function.variable
+                if isinstance(value, tuple):
+                    # a method of a variable
+                    return self.call(self.program.function_id(value[1]), [value[0]] + args, dest)
+                if isinstance(value, int):
+                    # something outside the program (System.out.println)
+                    return self.call(self.program.function_id(self.variables.names[value]), args, dest)
+                return self.call(self.program.function_id(node.function.name), args, dest)
+            case ArrayLiteral():
+                # the items are stored one after the other
+                if dest == None:
+                    dest = self.temporary()
+                for i in range(len(node.items)):
+                    emit(IR_STORE, dest, self.literal(str(i)), self.lower_expression(node.items[i]))
+                return dest
+        self.add_error(f"{type(node).__name__} expressions can not be lowered to TCABIR yet")
+        return self.temporary() if dest == None else dest
+
+
+# stands for everything stored in arrays, so that facts about loads can depend on it
+IR_MEMORY = -2
+
+# x <op> k is x when k is the value given here (on the right, or either side)
+IR_RIGHT_IDENTITIES = {"+": 0, "-": 0, "*": 1, "/": 1, "|": 0, "^": 0, "<<": 0, ">>": 0}
+IR_LEFT_IDENTITIES = {"+": 0, "*": 1, "|": 0, "^": 0}
+
+IR_COMMUTATIVE = set(["+", "*", "&", "|", "^", "==", "!=", "&&", "||"])
+
+FLOAT_TYPES = set(["float", "double"])
+INT_TYPES = set(["bool", "char", "short", "int", "long"])
+
+
+def ir_fold_binary(op:str, x:int, y:int):
+    # the value of x <op> y, as the generated code would work it out
+    # (None if it can not be known while compiling)
+    match op:
+        case "+": result = x + y
+        case "-": result = x - y
+        case "*": result = x * y
+        case "/" | "%":
+            if y == 0:
+                return None
+            # rounds toward 0
+            result = abs(x) // abs(y)
+            if (x < 0) != (y < 0):
+                result = -result
+            if op == "%":
+                result = x - y * result
+        case "&": result = x & y
+        case "|": result = x | y
+        case "^": result = x ^ y
+        case "<<" | ">>":
+            if y < 0 or y > 31:
+                return None
+            result = x << y if op == "<<" else x >> y
+        case "==": result = int(x == y)
+        case "!=": result = int(x != y)
+        case "<": result = int(x < y)
+        case ">": result = int(x > y)
+        case "<=": result = int(x <= y)
+        case ">=": result = int(x >= y)
+        case "&&": result = int(x != 0 and y != 0)
+        case "||": result = int(x != 0 or y != 0)
+    if result < -(1 << 31) or result >= 1 << 31:
+        return None
+    return result
+
+
+def ir_fold_unary(op:str, x:int):
+    match op:
+        case "-": result = -x
+        case "~": result = ~x
+        case "!": result = int(x == 0)
+    if result < -(1 << 31) or result >= 1 << 31:
+        return None
+    return result
+
+
+class Facts:
+    """
+    What a pass knows at one point of a function, as key : value.
+    Every fact depends on some variables, and is forgotten as soon as one of them is written
+    """
+    __slots__ = ("values", "users")
 
+    def __init__(self):
+        self.values = {}
+        # variable : the keys of the facts that depend on it
+        self.users = {}
+
+    def copy(self):
+        result = Facts()
+        result.values = self.values.copy()
+        result.users = {x: keys.copy() for x, keys in self.users.items()}
+        return result
 
+    def add(self, key, value, depends:tuple):
+        self.values[key] = value
+        for x in depends:
+            if x not in self.users:
+                self.users[x] = set()
+            self.users[x].add(key)
 
-    def trace_function(self, the_function:Function, the_class:Class):
-        current_number = 0
+    def kill(self, variable:int):
+        for key in self.users.pop(variable, ()):
+            self.values.pop(key, None)
 
-        the_function = self.convert_operations(the_function)
+    def kill_all(self, variables:set):
+        for x in [x for x in self.users if x in variables]:
+            self.kill(x)
 
-        the_function, found, reverse, types = self.number_variables(the_function, the_class, current_number, ["Main.main"])
+    def meet(self, other):
+        # only what is known on both ways here. None is a way that never gets here
+        if other == None:
+            return self
+        self.values = {key: x for key, x in self.values.items() if key in other.values and other.values[key] == x}
+        return self
 
-        return the_function
 
+def meet_facts(x:Facts, y:Facts):
+    if x == None:
+        return y
+    return x.meet(y)
 
-    def trace(self):
 
-        debug("Tracing...")
+class Optimizer:
+    """
+    Optimizes the instructions of a Program in place, with the passes OPTIMIZE_LEVEL asks for.
+    Each pass walks every function once, front to back, going into ifs and loops the way the
+    code would run, so what it knows at an instruction holds on every way there.
+    Anything a loop writes is forgotten at its start, and anything more than one function
+    uses is forgotten at every call. A call that can come back into the function making it
+    (recursion) also forgets the variables of that function, since they are global too.
+    The instructions and time each pass saved are kept in stats
+    """
+    def __init__(self, program:Program, level:int=None):
+        self.program = program
+        self.level = OPTIMIZE_LEVEL if level == None else level
+        # pass name : [times run, instructions removed, instructions changed, seconds]
+        self.stats = {}
+        # set for the instructions the running pass removes
+        self.dead = None
+        # how many instructions the running pass changed
+        self.changed = 0
+        # IF/LOOP/FUNCTION : its END, IF : its ELSE, LOOP : what it writes (see structure)
+        self.ends = {}
+        self.elses = {}
+        self.loop_writes = {}
+        self.shared = self.shared_variables()
+        # function : the variables only it uses, and the functions it calls
+        self.owned, self.callees = self.call_graph()
+        # function : the functions it can call (through any number of calls)
+        self.reached = {}
+        # CALL : the variables it may change (see structure)
+        self.call_kills = {}
+
+        self.optimize()
+
+    def passes(self):
+        result = []
+        if self.level >= 1:
+            result.append(("constant folding", self.fold_constants))
+            result.append(("copy propagation", self.propagate_copies))
+        if self.level >= 2:
+            # the copies it leaves are propagated in the next round
+            result.append(("common subexpressions", self.eliminate_common_subexpressions))
+        if self.level >= 1:
+            result.append(("dead code", self.remove_dead_code))
+        return result
 
-        # get the main class and function
-        main_class, main_function = self.find_main_function()
+    def optimize(self):
+        if self.level <= 0:
+            return
+        debug(f"Optimizing TCABIR (-O{self.level})...")
+        before = len(self.program)
+        rounds = 1 if self.level == 1 else OPTIMIZE_ROUNDS
+        for x in range(rounds):
+            changes = 0
+            for name, the_pass in self.passes():
+                changes += self.run_pass(name, the_pass)
+            if changes == 0:
+                break
+        for name, (runs, removed, changed, seconds) in self.stats.items():
+            debug(f"{name}: {removed} instructions removed, {changed} changed in {seconds:.4f}s")
+        debug(f"{before} -> {len(self.program)} instructions")
+
+    def run_pass(self, name:str, the_pass):
+        # gives back how many instructions the pass removed or changed
+        before = len(self.program)
+        self.dead = bytearray(before)
+        self.changed = 0
+        start = time.perf_counter()
+        the_pass()
+        self.program.remove(self.dead)
+        seconds = time.perf_counter() - start
+
+        removed = before - len(self.program)
+        if name not in self.stats:
+            self.stats[name] = [0, 0, 0, 0.0]
+        stats = self.stats[name]
+        stats[0] += 1
+        stats[1] += removed
+        stats[2] += self.changed
+        stats[3] += seconds
+        return removed + self.changed
+
+    def shared_variables(self):
+        # the variables more than one function uses, which any call may change
+        code = self.program.code
+        owners = {}
+        result = set([IR_MEMORY])
+        function = -1
+        for i in range(len(self.program)):
+            opcode, a = code[4*i], code[4*i + 1]
+            if opcode == IR_FUNCTION:
+                function = i
+                continue
+            slots = list(ir_reads(opcode, a))
+            if ir_written(opcode, a) != None:
+                slots.append(1)
+            for slot in slots:
+                x = code[4*i + slot]
+                if owners.setdefault(x, function) != function:
+                    result.add(x)
+        return result
 
-        # kill the program and show the user that they need
-        # a main class and function if they do not have one
-        if main_class == None or main_function == None:
-            [print(x) for x in self.EXCEPTIONS]
-            exit()
+    def call_graph(self):
+        # the variables only each function uses (its own), and the functions each one calls
+        code = self.program.code
+        owned = {-1: set()}
+        callees = {-1: set()}
+        function = -1
+        for i in range(len(self.program)):
+            opcode, a = code[4*i], code[4*i + 1]
+            if opcode == IR_FUNCTION:
+                function = a
+                owned.setdefault(function, set())
+                callees.setdefault(function, set())
+                continue
+            if opcode == IR_CALL:
+                callees[function].add(code[4*i + 2])
+            slots = list(ir_reads(opcode, a))
+            if ir_written(opcode, a) != None:
+                slots.append(1)
+            for slot in slots:
+                x = code[4*i + slot]
+                if x not in self.shared:
+                    owned[function].add(x)
+        return owned, callees
+
+    def reaches(self, function:int, target:int):
+        # whether function can call target (through any number of calls)
+        if function not in self.reached:
+            reached = set()
+            pending = list(self.callees.get(function, []))
+            while len(pending) > 0:
+                x = pending.pop()
+                if x not in reached:
+                    reached.add(x)
+                    pending += self.callees.get(x, [])
+            self.reached[function] = reached
+        return target in self.reached[function]
+
+    def call_kill(self, function:int, callee:int):
+        # what a call in function may change: the shared variables, and the ones
+        # of function itself if the callee can call it again
+        if callee == function or self.reaches(callee, function):
+            return self.shared | self.owned[function]
+        return self.shared
+
+    def structure(self):
+        # find the END of every block, the ELSE of every IF, what every loop writes
+        # and what every call may change
+        code = self.program.code
+        self.ends = {}
+        self.elses = {}
+        self.loop_writes = {}
+        self.call_kills = {}
+        blocks = []
+        loops = []
+        function = -1
+        for i in range(len(self.program)):
+            opcode, a = code[4*i], code[4*i + 1]
+            if opcode == IR_CALL:
+                self.call_kills[i] = self.call_kill(function, code[4*i + 2])
+            if opcode in (IR_IF, IR_LOOP, IR_FUNCTION):
+                blocks.append(i)
+                if opcode == IR_LOOP:
+                    loops.append(set())
+                elif opcode == IR_FUNCTION:
+                    function = a
+            elif opcode == IR_ELSE:
+                self.elses[blocks[-1]] = i
+            elif opcode == IR_END:
+                start = blocks.pop()
+                self.ends[start] = i
+                if code[4*start] == IR_LOOP:
+                    writes = loops.pop()
+                    self.loop_writes[start] = writes
+                    # an outer loop writes everything its inner loops do
+                    if len(loops) > 0:
+                        loops[-1] |= writes
+            elif len(loops) > 0:
+                if opcode == IR_CALL:
+                    loops[-1] |= self.call_kills[i]
+                elif opcode == IR_STORE:
+                    loops[-1].add(IR_MEMORY)
+                written = ir_written(opcode, a)
+                if written != None:
+                    loops[-1].add(written)
+
+    def forward(self, visit):
+        # call visit(i, facts) for every instruction that can be run, in order,
+        # with what is known just before it. visit updates facts for what the instruction does
+        self.structure()
+        code = self.program.code
+        facts = None
+        # [opcode, the facts before it, the facts at the end of its first part, if it has an ELSE]
+        blocks = []
+        for i in range(len(self.program)):
+            opcode = code[4*i]
+            if opcode == IR_FUNCTION:
+                facts = Facts()
+                blocks.append([opcode, None, None, False])
+            elif opcode == IR_IF:
+                if facts != None:
+                    visit(i, facts)
+                blocks.append([opcode, None if facts == None else facts.copy(), None, False])
+            elif opcode == IR_ELSE:
+                block = blocks[-1]
+                block[2] = facts
+                block[3] = True
+                facts = block[1]
+            elif opcode == IR_LOOP:
+                if facts != None:
+                    facts.kill_all(self.loop_writes[i])
+                # what is left holds every time around, and after the loop
+                blocks.append([opcode, None if facts == None else facts.copy(), None, False])
+            elif opcode == IR_END:
+                block = blocks.pop()
+                if block[0] == IR_FUNCTION:
+                    facts = None
+                elif block[0] == IR_LOOP:
+                    facts = block[1]
+                elif block[3]:
+                    facts = meet_facts(block[2], facts)
+                else:
+                    facts = meet_facts(block[1], facts)
+            elif facts != None:
+                visit(i, facts)
+                # nothing after these runs until the block ends
+                if opcode in (IR_BREAK, IR_CONTINUE, IR_RETURN):
+                    facts = None
+
+    def rewrite(self, i:int, opcode:int, a:int, b:int=0, c:int=0):
+        self.program.code[4*i:4*i + 4] = array('i', (opcode, a, b, c))
+        self.changed += 1
+
+    def constant_value(self, constant:int):
+        # the int a CONST gives (None if it is not an int)
+        try:
+            return int(self.program.constants[constant])
+        except ValueError:
+            return None
 
-        main_function = self.trace_function(main_function, main_class)
+    def set_constant(self, i:int, a:int, value:int):
+        if value >= 0 and value <= 255:
+            self.rewrite(i, IR_SET, a, value)
+        else:
+            self.rewrite(i, IR_CONST, a, self.program.constant_id(str(value)))
+
+    def fold_constants(self):
+        self.forward(self.fold_instruction)
+
+    def fold_instruction(self, i:int, facts:Facts):
+        # work out what only uses values that are known, and skip branches that can never run
+        opcode, a, b, c = self.program.instruction(i)
+        known = facts.values
+        value = None
+        if opcode == IR_IF:
+            if a in known:
+                self.fold_branch(i, known[a] != 0)
+            return
+        if opcode == IR_SET:
+            value = b
+        elif opcode == IR_CONST:
+            value = self.constant_value(b)
+        elif opcode == IR_COPY:
+            value = known.get(b)
+            if value != None:
+                self.set_constant(i, a, value)
+        elif opcode >= IR_UNARY:
+            if b in known:
+                value = ir_fold_unary(IR_UNARY_OPERATORS[opcode - IR_UNARY], known[b])
+                if value != None:
+                    self.set_constant(i, a, value)
+        elif opcode >= IR_BINARY:
+            op = IR_BINARY_OPERATORS[opcode - IR_BINARY]
+            if b in known and c in known:
+                value = ir_fold_binary(op, known[b], known[c])
+                if value != None:
+                    self.set_constant(i, a, value)
+            # x + 0 is only x when x is a number
+            elif c in known and IR_RIGHT_IDENTITIES.get(op) == known[c] and self.program.types[b] in INT_TYPES:
+                self.rewrite(i, IR_COPY, a, b)
+            elif b in known and IR_LEFT_IDENTITIES.get(op) == known[b] and self.program.types[c] in INT_TYPES:
+                self.rewrite(i, IR_COPY, a, c)
+        elif opcode == IR_CALL:
+            facts.kill_all(self.call_kills[i])
+        elif opcode == IR_STORE:
+            facts.kill(IR_MEMORY)
+
+        written = ir_written(opcode, a)
+        if written != None:
+            facts.kill(written)
+            # a float that is given an int is not an int from then on
+            if value != None and self.program.types[a] not in FLOAT_TYPES:
+                facts.add(a, value, (a,))
+
+    def fold_branch(self, i:int, taken:bool):
+        # keep only the part of the if at i that runs
+        end = self.ends[i]
+        other = self.elses.get(i, end)
+        if taken:
+            self.dead[i] = 1
+            self.dead[other:end + 1] = bytes([1]) * (end + 1 - other)
+        else:
+            self.dead[i:other + 1] = bytes([1]) * (other + 1 - i)
+            self.dead[end] = 1
+
+    def propagate_copies(self):
+        self.forward(self.propagate_instruction)
+
+    def propagate_instruction(self, i:int, facts:Facts):
+        # read the variable a copy came from instead of the copy
+        code = self.program.code
+        opcode, a = code[4*i], code[4*i + 1]
+        copies = facts.values
+        for slot in ir_reads(opcode, a):
+            # a store changes the array it is given, so it has to stay the same variable
+            if opcode == IR_STORE and slot == 1:
+                continue
+            source = copies.get(code[4*i + slot])
+            if source != None:
+                code[4*i + slot] = source
+                self.changed += 1
+
+        if opcode == IR_CALL:
+            facts.kill_all(self.call_kills[i])
+        written = ir_written(opcode, a)
+        if written != None:
+            facts.kill(written)
+        if opcode == IR_COPY:
+            b = code[4*i + 2]
+            if a == b:
+                self.dead[i] = 1
+            else:
+                facts.add(a, b, (a, b))
+
+    def eliminate_common_subexpressions(self):
+        self.forward(self.common_instruction)
+
+    def common_instruction(self, i:int, facts:Facts):
+        # copy a value that was already worked out instead of working it out again
+        opcode, a, b, c = self.program.instruction(i)
+        key = None
+        if opcode >= IR_BINARY or opcode == IR_LOAD:
+            if opcode < IR_UNARY and opcode != IR_LOAD and b > c and IR_BINARY_OPERATORS[opcode - IR_BINARY] in IR_COMMUTATIVE:
+                b, c = c, b
+            key = (opcode, b, c)
+            holder = facts.values.get(key)
+            if holder != None and holder != a:
+                self.rewrite(i, IR_COPY, a, holder)
+                key = None
+        elif opcode == IR_CALL:
+            facts.kill_all(self.call_kills[i])
+        elif opcode == IR_STORE:
+            facts.kill(IR_MEMORY)
+
+        written = ir_written(opcode, a)
+        if written != None:
+            facts.kill(written)
+        if key == None or a == b or (a == c and opcode < IR_UNARY):
+            return
+        if opcode >= IR_UNARY:
+            facts.add(key, a, (b, a))
+        elif opcode == IR_LOAD:
+            facts.add(key, a, (b, c, a, IR_MEMORY))
+        else:
+            facts.add(key, a, (b, c, a))
 
-        [print(x) for x in main_function.lines]
+    def remove_dead_code(self):
+        code = self.program.code
+        dead = self.dead
+        n = len(self.program)
 
+        # nothing after a break, continue or return runs until its block ends
+        i = 0
+        while i < n:
+            opcode = code[4*i]
+            i += 1
+            if opcode not in (IR_BREAK, IR_CONTINUE, IR_RETURN) or dead[i - 1]:
+                continue
+            depth = 0
+            while i < n:
+                opcode = code[4*i]
+                if depth == 0 and opcode in (IR_END, IR_ELSE):
+                    break
+                if opcode in (IR_IF, IR_LOOP):
+                    depth += 1
+                elif opcode == IR_END:
+                    depth -= 1
+                dead[i] = 1
+                i += 1
+
+        # ifs and elses with nothing in them
+        live = []
+        for i in range(n):
+            if dead[i]:
+                continue
+            opcode = code[4*i]
+            if opcode == IR_END and len(live) > 0 and code[4*live[-1]] == IR_ELSE:
+                dead[live.pop()] = 1
+            if opcode == IR_END and len(live) > 0 and code[4*live[-1]] == IR_IF:
+                dead[live.pop()] = 1
+                dead[i] = 1
+                continue
+            live.append(i)
+
+        # instructions that only give a value nobody reads (which may leave more of them)
+        reads = {}
+        writers = {}
+        for i in live:
+            if dead[i]:
+                continue
+            opcode, a = code[4*i], code[4*i + 1]
+            for slot in ir_reads(opcode, a):
+                x = code[4*i + slot]
+                reads[x] = reads.get(x, 0) + 1
+            if opcode >= IR_BINARY or opcode in (IR_SET, IR_COPY, IR_CONST, IR_LOAD):
+                if a not in writers:
+                    writers[a] = []
+                writers[a].append(i)
+        unread = [x for x in writers if reads.get(x, 0) == 0]
+        # copies to themselves
+        unread += [code[4*i + 1] for i in live if not dead[i] and code[4*i] == IR_COPY and code[4*i + 1] == code[4*i + 2]]
+        while len(unread) > 0:
+            x = unread.pop()
+            for i in writers.get(x, []):
+                opcode, a = code[4*i], code[4*i + 1]
+                if dead[i] or (reads.get(a, 0) > 0 and not (opcode == IR_COPY and a == code[4*i + 2])):
+                    continue
+                dead[i] = 1
+                for slot in ir_reads(opcode, a):
+                    y = code[4*i + slot]
+                    reads[y] -= 1
+                    if reads[y] == 0:
+                        unread.append(y)
 
 
-class Variable:
-    def __init__(self, num:int):
-        self.num = num
-        self.type = "void"
+if __name__ == '__main__':
+    if WATCH:
+        Daemon("test.tcab").run()
 
+    if SERVER_SOCKET != None:
+        CompileServer(SERVER_SOCKET).run()
 
-if __name__ == '__main__':
     all_exceptions = []
 
-    compiler = Compiler("test.tcab")
+    if PARALLEL_IMPORTS:
+        compiler = BuildScheduler("test.tcab").build()
+    else:
+        compiler = Compiler("test.tcab")
 
     all_exceptions += compiler.EXCEPTIONS
 
 
     # the compiler now has a massive tree of classes and all imports handled
     # the only remaining tokens should be compiler directives, functions, statements inside of functions, declarations, and use statements
-    parser = Parser(compiler.remaining_lines, compiler.classes)
+    parser = Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
 
 
     all_exceptions += parser.EXCEPTIONS
 
-    sequencer = Sequencer(parser.classes, parser.directives)
+    sequencer = Sequencer(parser.classes, parser.directives, parser.sources)
 
     all_exceptions += sequencer.EXCEPTIONS
 
+    lowerer = Lowerer(sequencer)
+    all_exceptions += lowerer.EXCEPTIONS
+    Optimizer(lowerer.program)
+    debug(lowerer.program.text())
+    if IR_OUTPUT != None:
+        lowerer.program.write(IR_OUTPUT)
+
     print()
     print("EXCEPTIONS:")
     [print(x) for x in all_exceptions]
@@ -0,0 +1,174 @@
+import os
+import zlib
+import pickle
+
+import main
+
+
+MAIN = """import lib.bad;
+public class Main {
+    public static void main(String[] args){
+        int y = 2;
+    }
+}
+"""
+
+BAD = """int z = 1;
+class Bad {
+}
+"""
+
+
+def write_program(directory):
+    (directory / "lib").mkdir()
+    (directory / "main.tcab").write_text(MAIN)
+    (directory / "lib" / "bad.tcab").write_text(BAD)
+
+
+def test_errors_keep_their_lines_without_a_global_registry(tmp_path, monkeypatch, capsys):
+    write_program(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    batch = main.Batch()
+    for x in range(2):
+        exceptions = batch.build("main.tcab")
+        assert [x.get_line() for x in exceptions] == ["int z = 1;"]
+    # the sources of a build go away with it
+    assert not hasattr(main, "SOURCE_FILES")
+
+
+def test_lines_are_found_without_splitting_the_file():
+    source = main.SourceFile("main.tcab", "int a\n\nint b = 2\nend")
+    assert source._line_starts == None
+    assert [source.line(x) for x in range(5)] == [None, "int a", "", "int b = 2", "end"]
+    assert list(source.line_starts()) == [0, 6, 7, 17]
+
+
+NESTED = """public class Main {
+    int a = 1
+    class Inner {
+        int b = 2
+        class Deeper {
+            int c = 3
+        }
+        int d = 4
+    }
+    public static void main(String[] args){
+        int y = 2
+    }
+}
+class Other {
+}
+"""
+
+
+def tree(classes:list):
+    # the names and lines of a tree of classes
+    return [(x.name, [str(y) for y in x.lines], tree(x.subclasses)) for x in classes]
+
+
+def test_classes_nest_in_the_classes_around_them(tmp_path, monkeypatch, capsys):
+    (tmp_path / "main.tcab").write_text(NESTED)
+    monkeypatch.chdir(tmp_path)
+    compiler = main.Compiler("main.tcab")
+    deeper = ("Deeper", ["['class', 'Deeper', '{']", "['int', 'c', '=', '3']", "['}']"], [])
+    inner = ("Inner", ["['class', 'Inner', '{']", "['int', 'b', '=', '2']", "['int', 'd', '=', '4']", "['}']"], [deeper])
+    assert tree(compiler.classes)[0][2] == [inner]
+    assert [x[0] for x in tree(compiler.classes)] == ["Main", "Other"]
+    # the lines of a class leave out the classes in it
+    assert "['int', 'b', '=', '2']" not in tree(compiler.classes)[0][1]
+    # nothing is printed unless DEBUG is set
+    assert capsys.readouterr().out == ""
+
+
+UTIL = """class Util {
+    int u = 1
+}
+"""
+
+MORE = """import util;
+class More {
+    int m = 2
+}
+"""
+
+IMPORTS = """import lib.util;
+import lib.more;
+public class Main {
+    public static void main(String[] args){
+        int y = 2
+    }
+}
+"""
+
+
+def write_imports(directory):
+    (directory / "lib").mkdir()
+    (directory / "lib" / "util.tcab").write_text(UTIL)
+    (directory / "lib" / "more.tcab").write_text(MORE)
+    (directory / "main.tcab").write_text(IMPORTS)
+
+
+def test_parallel_build_links_the_same_classes(tmp_path, monkeypatch, capsys):
+    write_imports(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    expected = main.Compiler("main.tcab")
+    compiler = main.BuildScheduler("main.tcab", 2).build()
+    assert compiler.imports == expected.imports
+    assert tree(compiler.classes) == tree(expected.classes)
+    assert sorted(compiler.resolver.sources) == sorted(expected.resolver.sources)
+
+
+def test_cache_hits_misses_and_bad_entries(tmp_path, monkeypatch, capsys):
+    write_imports(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "CACHE_DIR", str(tmp_path / "cache"))
+    expected = tree(main.Compiler("main.tcab").classes)
+    entries = sorted(os.listdir(tmp_path / "cache"))
+    assert len(entries) == 3
+
+    # every file is a hit now
+    preprocess = main.Compiler.preprocess
+    def fail(self):
+        raise AssertionError(f"{self.filename} was preprocessed")
+    monkeypatch.setattr(main.Compiler, "preprocess", fail)
+    assert tree(main.Compiler("main.tcab").classes) == expected
+
+    # an entry that can not be read, or that is missing a field, is a miss
+    monkeypatch.setattr(main.Compiler, "preprocess", preprocess)
+    (tmp_path / "cache" / entries[0]).write_bytes(b"not an entry")
+    state = {x: [] for x in main.ModuleCache.FIELDS if x != "store"}
+    (tmp_path / "cache" / entries[1]).write_bytes(zlib.compress(pickle.dumps(state)))
+    assert tree(main.Compiler("main.tcab").classes) == expected
+    assert sorted(os.listdir(tmp_path / "cache")) == entries
+
+
+def test_cache_keys_change_with_what_is_pickled(tmp_path, monkeypatch):
+    cache = main.ModuleCache(str(tmp_path))
+    source = main.SourceFile("./main.tcab", "class Main {\n}\n")
+    path = cache.path(source)
+    assert path == main.ModuleCache(str(tmp_path)).path(source)
+    assert "Line(_tokens store start end" in cache.layout()
+    monkeypatch.setattr(main.Line, "__slots__", ["_tokens", "store"])
+    assert main.ModuleCache(str(tmp_path)).path(source) != path
+
+
+def test_imports_are_known_by_their_real_path(tmp_path, monkeypatch):
+    write_imports(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    resolver = main.ImportResolver()
+    assert resolver.add("./lib/util.tcab")
+    assert not resolver.add("./lib/../lib/util.tcab")
+    assert resolver.files == ["./lib/util.tcab"]
+    # import statements are resolved once per directory
+    result = resolver.resolve("./main.tcab", ["import", "lib", ".", "util"])
+    assert result == ("lib/util.tcab", ["lib", ".", "util"])
+    assert resolver.resolve("./other.tcab", ["import", "lib", ".", "util"]) is result
+    # a file is imported from the directory of the file importing it, and every . goes up one
+    assert resolver.resolve("./lib/more.tcab", ["import", "util"])[0] == "lib/util.tcab"
+    assert resolver.resolve("./lib/more.tcab", ["import", ".", "main"])[0] == "main.tcab"
+
+
+def test_circular_imports_are_found():
+    resolver = main.ImportResolver()
+    resolver.graph = {"a": ["b"], "b": ["c", "d"], "c": ["a"], "d": [], "e": ["e", "a"]}
+    assert resolver.cycles() == [["a", "b", "c"], ["e"]]
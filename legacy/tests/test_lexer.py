@@ -0,0 +1,89 @@
+import glob
+import os
+
+import pytest
+
+import main
+
+
+# the .tcab files of the repo
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+EXAMPLES = sorted(glob.glob(os.path.join(ROOT, "**", "*.tcab"), recursive=True))
+
+EDGE_CASES = [
+    # escapes inside strings, and quotes in characters
+    'String s = "a \\"q\\" b"\nchar c = \'"\'\n',
+    "String t = \"tab\\t // not a comment\"\n",
+    # a line broken with \
+    "int x = 1 + \\\n    2\n",
+    # comments, including ones inside a line and doc blocks
+    "x = 1 // one\n/* two\n three */ y = 2\n@ docs { int z }\nw = 3\n",
+    # floats
+    "float f = 1.5e3 + .5 - 2.\n",
+    # operators that are more than one character
+    "a <<= b >>= c && d || e != f == g <= h >= i\n",
+    # blocks opened and closed on one line, semicolons
+    "if (x) { y = 1; z = 2; }\n",
+]
+
+
+def legacy_tokenize(source:str):
+    return main.Compiler.__new__(main.Compiler).legacy_tokenize(source)
+
+
+@pytest.mark.parametrize("filename", EXAMPLES, ids=[os.path.relpath(x, ROOT) for x in EXAMPLES])
+def test_examples_match_legacy_tokenize(filename):
+    with open(filename) as f:
+        source = f.read()
+    assert main.Lexer().tokenize(source) == legacy_tokenize(source)
+
+
+@pytest.mark.parametrize("source", EDGE_CASES)
+def test_edge_cases_match_legacy_tokenize(source):
+    assert main.Lexer().tokenize(source) == legacy_tokenize(source)
+
+
+def chunks(data:str, size:int):
+    # pieces of about size characters that each end with a newline (like SourceFile.chunks)
+    position = 0
+    while position < len(data):
+        end = data.find("\n", position + size)
+        end = len(data) if end == -1 else end + 1
+        yield data[position:end]
+        position = end
+
+
+SOURCES = [
+    "public class Main {\n    int x = 1 // one\n    /* two\n    lines */ float y = 2.5\n}\n",
+    "String s = \"a // b\"\n@ docs {\nint z = 3\n",
+    # a line comment that ends right after another piece was tokenized
+    "aa /\n/*//\n",
+    "\n//\"{}*\n'*\"\n{",
+    "//\"/\n\"\n//\n '\"",
+]
+
+
+def test_stream_matches_tokenize():
+    for source in SOURCES:
+        whole = main.Lexer().tokenize(source)
+        for size in [1, 4, 64]:
+            assert list(main.Lexer().tokenize_stream(chunks(source, size))) == whole
+
+
+def test_mapped_source_streams_the_same_tokens(tmp_path):
+    path = tmp_path / "main.tcab"
+    path.write_text(SOURCES[0] * 50)
+    source = main.SourceFile.map(str(path))
+    assert source.mapped
+    whole = main.Lexer().tokenize(path.read_text())
+    assert list(main.Lexer().tokenize_stream(source.chunks(64))) == whole
+    assert source.line(2) == "    int x = 1 // one"
+
+
+def test_filter_tokens_joins_broken_lines_and_splits_statements():
+    compiler = main.Compiler.__new__(main.Compiler)
+    tokens = main.Lexer().tokenize("int x = 1 + \\\n2; x = 3;\ny = 4\n")
+    assert list(compiler.filter_tokens(tokens)) == [
+        "int", "x", "=", "1", "+", "`1", "2", "\n", "x", "=", "3", "\n", "`2",
+        "y", "=", "4", "\n", "`3",
+    ]
@@ -0,0 +1,137 @@
+import re
+
+import main
+
+
+FIELDS = """public class Main {
+    int counter = 1 + 2;
+    int step = counter * 2;
+    public static void main(String[] args){
+        counter = counter + step;
+        bump();
+    }
+    void bump(){
+        counter = counter + 1;
+    }
+}
+"""
+
+RECURSIVE = """public class Main {
+    public static void main(String[] args){
+        int a = fact(5);
+    }
+    int fact(int n){
+        if n < 2 {
+            return 1;
+        }
+        return n * fact(n - 1);
+    }
+}
+"""
+
+MEMBERS = """public class Main {
+    public static void main(String[] args){
+        Point p;
+        int y = p.x;
+        p.x = y;
+        int n = args.length;
+    }
+}
+
+class Point {
+    int x = 0;
+}
+"""
+
+ELEMENTS = """public class Main {
+    public static void main(String[] args){
+        int[] arr;
+        int i = 1;
+        int v = 7;
+        arr[i] = v;
+        int w = arr[i];
+    }
+}
+"""
+
+
+def lower(directory, source):
+    (directory / "main.tcab").write_text(source)
+    compiler = main.Compiler("main.tcab")
+    parser = main.Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    lowerer = main.Lowerer(sequencer)
+    return sequencer, lowerer
+
+
+def renamed(sequencer, lowerer):
+    # the IR with its variables numbered in the order they first show up, so that
+    # the tests do not depend on the order the Sequencer numbers them in.
+    # named variables are written as their names instead ($counter)
+    numbers = {}
+    def rename(match):
+        varnum = int(match.group(1))
+        name = sequencer.variables.names[varnum]
+        if name != "":
+            return "$" + name
+        if varnum not in numbers:
+            numbers[varnum] = len(numbers)
+        return f"#{numbers[varnum]}"
+    return re.sub(r"#(\d+)", rename, lowerer.program.text()).split("\n")
+
+
+def test_attributes_are_set_before_main(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    sequencer, lowerer = lower(tmp_path, FIELDS)
+    assert sequencer.EXCEPTIONS + lowerer.EXCEPTIONS == []
+    # one variable for each attribute, the same in every function
+    assert sequencer.variables.names.count("counter") == 1
+    # bump has no params, and adds to the same counter
+    assert renamed(sequencer, lowerer) == [
+        "function Main.main {",
+        "    param $args",
+        "    #0 = 1",
+        "    #1 = 2",
+        "    $counter = #0 + #1",
+        "    #2 = 2",
+        "    $step = $counter * #2",
+        "    $counter = $counter + $step",
+        "    #3 = Main.bump()",
+        "}",
+        "function Main.bump {",
+        "    #4 = 1",
+        "    $counter = $counter + #4",
+        "}",
+    ]
+
+
+def test_recursion_is_an_error(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    sequencer, lowerer = lower(tmp_path, RECURSIVE)
+    assert [x.cause for x in lowerer.EXCEPTIONS] == ["Main.fact(int) calls itself, but TCABIR variables are global, so recursion can not be lowered yet"]
+    assert lowerer.EXCEPTIONS[0].line_number == "9"
+
+
+def test_members_are_loaded_and_stored_by_name(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    sequencer, lowerer = lower(tmp_path, MEMBERS)
+    assert sequencer.EXCEPTIONS + lowerer.EXCEPTIONS == []
+    assert renamed(sequencer, lowerer) == [
+        "function Main.main {",
+        "    param $args",
+        '    #0 = "x"',
+        "    $y = $p[#0]",
+        '    #1 = "x"',
+        "    $p[#1] = $y",
+        '    #2 = "length"',
+        "    $n = $args[#2]",
+        "}",
+    ]
+
+
+def test_elements_are_loaded_and_stored_by_index(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    sequencer, lowerer = lower(tmp_path, ELEMENTS)
+    assert sequencer.EXCEPTIONS + lowerer.EXCEPTIONS == []
+    lines = renamed(sequencer, lowerer)
+    assert lines[-3:] == ["    $arr[$i] = $v", "    $w = $arr[$i]", "}"]
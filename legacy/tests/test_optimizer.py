@@ -0,0 +1,66 @@
+import main
+
+
+ADD = main.IR_BINARY + main.IR_BINARY_OPERATORS.index("+")
+
+
+def program():
+    result = main.Program()
+    result.types = ["int"] * 16
+    result.sizes = [4] * 16
+    return result
+
+
+def optimize(the_program, level=1):
+    main.Optimizer(the_program, level)
+    return the_program.text().split("\n")
+
+
+def test_constants_are_folded():
+    p = program()
+    p.emit(main.IR_FUNCTION, p.function_id("main"))
+    p.emit(main.IR_SET, 1, 2)
+    p.emit(main.IR_SET, 2, 3)
+    p.emit(ADD, 3, 1, 2)
+    p.emit(main.IR_RETURN, 3)
+    p.emit(main.IR_END)
+    assert optimize(p) == ["function main {", "    #3 = 5", "    return #3", "}"]
+
+
+def recursive(callee):
+    # f sets #1, calls callee (which comes back into f), then reads #1.
+    # variables are global, so the call can change #1
+    p = program()
+    f = p.function_id("f")
+    p.emit(main.IR_FUNCTION, f)
+    p.emit(main.IR_PARAM, 0)
+    p.emit(main.IR_IF, 0)
+    p.emit(main.IR_SET, 1, 5)
+    p.emit(main.IR_SET, 2, 0)
+    p.emit(main.IR_ARG, 2)
+    p.emit(main.IR_CALL, 3, p.function_id(callee), 1)
+    p.emit(ADD, 4, 1, 2)
+    p.emit(main.IR_RETURN, 4)
+    p.emit(main.IR_ELSE)
+    p.emit(main.IR_SET, 1, 1)
+    p.emit(main.IR_RETURN, 1)
+    p.emit(main.IR_END)
+    p.emit(main.IR_END)
+    return p
+
+
+def test_recursive_calls_change_the_variables_of_the_caller():
+    for level in [1, 2]:
+        assert "        #4 = #1 + #2" in optimize(recursive("f"), level)
+
+
+def test_calls_that_come_back_change_the_variables_of_the_caller():
+    p = recursive("g")
+    # g calls f again
+    p.emit(main.IR_FUNCTION, p.function_id("g"))
+    p.emit(main.IR_PARAM, 5)
+    p.emit(main.IR_ARG, 5)
+    p.emit(main.IR_CALL, 6, p.function_id("f"), 1)
+    p.emit(main.IR_RETURN, 6)
+    p.emit(main.IR_END)
+    assert "        #4 = 5" not in optimize(p, 2)
@@ -0,0 +1,112 @@
+import pickle
+
+import main
+
+
+def parse(source:str):
+    # the syntax tree of the lines of source (one statement per line)
+    lines = [main.Line(line.split(" ")) for line in source.split("\n")]
+    return main.TreeBuilder(lines).build()
+
+
+def test_declarations():
+    for source, the_type, name in [
+        ("int x", ["int"], "x"),
+        ("int [ ] arr = [ 1 , 2 ]", ["int", "[", "]"], "arr"),
+        ("lib . Thing t", ["lib", ".", "Thing"], "t"),
+        ("int * p", ["int", "*"], "p"),
+    ]:
+        node = parse(source)[0]
+        assert isinstance(node, main.Declaration)
+        assert node.type == the_type and node.name == name
+
+
+def test_comparisons_are_expressions():
+    for source, op in [("a > = b", ">="), ("x = = y", "=="), ("a ! = b", "!="), ("a < b", "<"), ("a > b", ">")]:
+        node = parse(source)[0]
+        assert isinstance(node, main.ExpressionStatement)
+        assert isinstance(node.value, main.BinaryOp) and node.value.op == op
+
+
+def test_arithmetic_is_an_expression():
+    for source, op in [("a + b", "+"), ("a - b", "-"), ("a % b", "%"), ("a < < b", "<<")]:
+        node = parse(source)[0]
+        assert isinstance(node, main.ExpressionStatement)
+        assert isinstance(node.value, main.BinaryOp) and node.value.op == op
+
+
+def test_literals_are_not_names():
+    node = parse("x 1")[0]
+    assert not isinstance(node, main.Declaration)
+
+
+def shape(node):
+    # an expression written with every operation in parentheses
+    match node:
+        case main.Name():
+            return node.name
+        case main.Literal():
+            return node.value
+        case main.UnaryOp():
+            return f"({node.op} {shape(node.operand)})"
+        case main.BinaryOp():
+            return f"({shape(node.left)} {node.op} {shape(node.right)})"
+        case main.Call():
+            return f"{shape(node.function)}({', '.join([shape(x) for x in node.args])})"
+        case main.Member():
+            return f"{shape(node.value)}.{node.name}"
+        case main.Index():
+            return f"{shape(node.value)}[{shape(node.index)}]"
+
+
+def test_precedence_and_associativity():
+    for source, expected in [
+        ("a - b - c", "((a - b) - c)"),
+        ("a / b / c", "((a / b) / c)"),
+        ("a + b * c", "(a + (b * c))"),
+        ("a * b + c", "((a * b) + c)"),
+        ("a & b = = c", "(a & (b == c))"),
+        ("a | | b & & c", "(a || (b && c))"),
+        ("a < < b + c", "(a << (b + c))"),
+        ("- a * b", "((- a) * b)"),
+        ("- a - - b", "((- a) - (- b))"),
+        ("! a & & b", "((! a) && b)"),
+        ("f ( a ) + b * c", "(f(a) + (b * c))"),
+        ("a * f ( b + c , d )", "(a * f((b + c), d))"),
+        ("arr [ i ] * arr [ i + 1 ]", "(arr[i] * arr[(i + 1)])"),
+        ("- arr [ 0 ]", "(- arr[0])"),
+        ("( a + b ) * c", "((a + b) * c)"),
+    ]:
+        assert shape(main.ExpressionParser(source.split(" ")).parse()) == expected, source
+
+
+def test_operators_are_lowered_to_nested_calls():
+    # Sequencer.lower only looks at the expression
+    sequencer = main.Sequencer.__new__(main.Sequencer)
+    for source, expected in [
+        ("a - b - c", "a.minus(b).minus(c)"),
+        ("a + b * c", "a.plus(b.times(c))"),
+        ("- a * b", "a.negate().times(b)"),
+        ("f ( a ) + arr [ i ]", "f(a).plus(arr.getElement(i))"),
+    ]:
+        node = main.ExpressionParser(source.split(" ")).parse()
+        assert shape(sequencer.lower(node)) == expected, source
+
+
+def test_nodes_have_no_dict_and_lines_pickle():
+    node = main.BinaryOp("+", main.Name("a"), main.Literal("1"))
+    assert not hasattr(node, "__dict__")
+    line = main.Line(["int", "x", "=", "1"])
+    assert not hasattr(line, "__dict__")
+    assert str(pickle.loads(pickle.dumps(line))) == str(line)
+
+
+def test_compound_assignments_are_desugared():
+    sequencer = main.Sequencer.__new__(main.Sequencer)
+    for op, binary in main.COMPOUND_OPERATORS.items():
+        # the Lexer splits the operator into one token per character
+        node = parse(f"x {' '.join(op)} y")[0]
+        assert isinstance(node, main.Assignment) and node.op == op
+        node = sequencer.desugar(node)
+        assert node.op == "="
+        assert shape(node.value) == f"(x {binary} y)"
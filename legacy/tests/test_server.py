@@ -0,0 +1,74 @@
+import json
+import os
+import socket
+
+import main
+
+
+NO_MAIN = """public class Other {
+    public static void main(String[] args){
+        int y = 2;
+    }
+}
+"""
+
+
+def ask(server, request:dict):
+    # one request over a socket, the way an editor sends it
+    editor, connection = socket.socketpair()
+    with editor, editor.makefile('rwb') as f:
+        f.write(json.dumps(request).encode() + b"\n")
+        f.flush()
+        editor.shutdown(socket.SHUT_WR)
+        server.handle(connection)
+        return json.loads(f.readline())
+
+
+def test_program_without_main(tmp_path, monkeypatch, capsys):
+    (tmp_path / "other.tcab").write_text(NO_MAIN)
+    monkeypatch.chdir(tmp_path)
+    server = main.CompileServer(str(tmp_path / "server.sock"))
+    response = ask(server, {"file": "other.tcab"})
+    assert "error" not in response
+    assert [x["cause"] for x in response["errors"]] == ["A class named Main is required in the global context..."]
+    # the server keeps answering
+    assert "errors" in ask(server, {"file": "other.tcab"})
+
+
+def test_invalid_request(tmp_path, capsys):
+    server = main.CompileServer(str(tmp_path / "server.sock"))
+    assert ask(server, {"path": "x"}) == {"error": "Expected {\"file\": path}"}
+
+
+UTIL = """class Util {
+    int base = 2;
+}
+"""
+
+MAIN = """import lib.util;
+public class Main {
+    public static void main(String[] args){
+        int y = 2;
+    }
+}
+"""
+
+
+def test_daemon_rebuilds_only_what_changed(tmp_path, monkeypatch, capsys):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "util.tcab").write_text(UTIL)
+    (tmp_path / "main.tcab").write_text(MAIN)
+    monkeypatch.chdir(tmp_path)
+    daemon = main.Daemon("main.tcab")
+    assert daemon.build(set()) == []
+    assert daemon.changes() == set()
+    util = daemon.modules[daemon.paths.canonical("lib/util.tcab")]
+
+    (tmp_path / "main.tcab").write_text(MAIN.replace("int y = 2", "int y = 3"))
+    os.utime(tmp_path / "main.tcab", (0, 0))
+    assert daemon.changes() == set([daemon.root])
+    assert daemon.build(daemon.changes()) == []
+    # the file that did not change keeps its classes
+    assert daemon.modules[daemon.paths.canonical("lib/util.tcab")] is util
+    assert daemon.changes() == set()
+    assert sorted(daemon.modules[daemon.root].resolver.sources) == ["./lib/util.tcab", "./main.tcab"]
@@ -0,0 +1,86 @@
+import main
+
+
+SOURCE = """class A {
+    int x = 1
+    class B { int y = x
+    }
+}
+int z = {
+"""
+
+
+def store(source:str=SOURCE):
+    # the TokenStore of source, after the same filter a Compiler runs
+    compiler = main.Compiler.__new__(main.Compiler)
+    tokens = compiler.filter_tokens(main.Lexer().tokenize(source))
+    return main.TokenStore.from_tokens(main.SourceFile("test.tcab", source), tokens)
+
+
+def test_equal_tokens_share_a_string():
+    tokens = store()
+    assert list(tokens) == [x for x in main.Lexer().tokenize(SOURCE) if x[0] != "`"]
+    assert len(tokens.strings) < len(tokens)
+    x = [i for i in range(len(tokens)) if tokens.text(i) == "x"]
+    assert len(x) == 2 and tokens.ids[x[0]] == tokens.ids[x[1]]
+    # the span of every token is where it is in the source
+    for i in range(len(tokens)):
+        if tokens.kinds[i] != main.TOKEN_NEWLINE:
+            assert SOURCE[tokens.starts[i]:tokens.ends[i]] == tokens.text(i)
+
+
+def test_lines_are_ranges_of_the_store():
+    tokens = store()
+    line = main.Line(store=tokens, start=5, end=9)
+    assert line.copy_tokens() == ["int", "x", "=", "1"]
+    assert line._tokens == None
+    # only a pass that asks for the tokens makes the line own them
+    line.tokens[0] = "float"
+    assert line.tokens == ["float", "x", "=", "1"]
+    assert tokens.texts(5, 9) == ["int", "x", "=", "1"]
+
+
+def test_line_numbers_are_kept_out_of_the_stream():
+    tokens = store()
+    assert not any([x[0] == "`" for x in tokens])
+    y = list(tokens).index("y")
+    assert tokens.position(y) == (3, 19)
+    assert main.Line(store=tokens, start=y, end=y + 3).line_number == 3
+
+
+def test_braces_are_paired_once():
+    tokens = store()
+    pairs = tokens.brace_pairs()
+    opens = [i for i in range(len(tokens)) if tokens.text(i) == "{"]
+    closes = [i for i in range(len(tokens)) if tokens.text(i) == "}"]
+    # class A, class B and the { that is never closed
+    assert len(opens) == 3 and len(closes) == 2
+    assert pairs[opens[0]] == closes[1] and pairs[closes[1]] == opens[0]
+    assert pairs[opens[1]] == closes[0]
+    assert opens[2] not in pairs
+    assert tokens.brace_pairs() is pairs
+
+
+def test_find_block_end():
+    tokens = store()
+    lines = []
+    start = 0
+    for i in range(len(tokens)):
+        if tokens.kinds[i] == main.TOKEN_NEWLINE:
+            if start < i:
+                lines.append(main.Line(store=tokens, start=start, end=i))
+            start = i + 1
+    assert [str(x) for x in lines] == [
+        "['class', 'A', '{']",
+        "['int', 'x', '=', '1']",
+        "['class', 'B', '{']",
+        "['int', 'y', '=', 'x']",
+        "['}']",
+        "['}']",
+        "['int', 'z', '=', '{']",
+    ]
+    assert main.find_block_end(lines, 0, len(lines)) == 5
+    assert main.find_block_end(lines, 2, len(lines)) == 4
+    # a block that is never closed, and a line that does not open one
+    assert main.find_block_end(lines, 6, len(lines)) == len(lines)
+    assert main.find_block_end(lines, 1, len(lines)) == len(lines)
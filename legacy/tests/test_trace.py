@@ -0,0 +1,242 @@
+import main
+
+
+UTIL = """public class Util {
+    int base = 2 + 3;
+    int twice(int v){
+        return v + v + base;
+    }
+}
+"""
+
+MAIN = """import lib.util;
+public class Main {
+    public static void main(String[] args){
+        int a = Util.twice(4);
+    }
+}
+"""
+
+MAIN2 = """import lib.util;
+public class Main {
+    public static void main(String[] args){
+        float b = 2.5;
+        int c = Util.twice(1) + Util.twice(2);
+    }
+}
+"""
+
+
+def write_programs(directory):
+    (directory / "lib").mkdir()
+    (directory / "lib" / "util.tcab").write_text(UTIL)
+    (directory / "main.tcab").write_text(MAIN)
+    (directory / "main2.tcab").write_text(MAIN2)
+
+
+def parse(filename):
+    compiler = main.Compiler(filename)
+    return main.Parser(compiler.remaining_lines, compiler.classes, compiler.resolver.sources)
+
+
+def fresh_ir(filename):
+    parser = parse(filename)
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    return main.Lowerer(sequencer).program.text()
+
+
+def test_shared_classes_trace_the_same_in_every_program(tmp_path, monkeypatch, capsys):
+    write_programs(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    expected = {x: fresh_ir(x) for x in ["main.tcab", "main2.tcab"]}
+    # the shared class as the Parser leaves it
+    lines = [str(x) for x in parse("lib/util.tcab").classes[0].lines]
+
+    batch = main.Batch()
+    for filename in ["main.tcab", "main2.tcab", "main.tcab", "main2.tcab"]:
+        assert batch.build(filename) == []
+        assert batch.program.text() == expected[filename]
+
+    # the programs that traced the shared class did not change it
+    util = batch.modules[batch.paths.canonical("lib/util.tcab")].classes[0]
+    assert [str(x) for x in util.lines] == lines
+
+
+def variables(body):
+    # name : what every use of it in body was numbered as
+    result = {}
+    for node in main.walk(body):
+        if isinstance(node, main.Declaration):
+            result.setdefault(node.name, []).append(node.variable)
+        for value in [getattr(node, "target", None), getattr(node, "value", None), getattr(node, "condition", None)]:
+            for x in main.expression_nodes(value):
+                if isinstance(x, main.Name):
+                    result.setdefault(x.name, []).append(x.variable)
+    return result
+
+
+BLOCKS = """public class Main {
+    public static void main(String[] args){
+        int n = 1;
+        if n {
+            float v = 2.5;
+            n = v;
+        }
+        if n {
+            int v = 3;
+            n = v;
+        }
+    }
+}
+"""
+
+
+def test_declarations_only_hide_names_in_their_block(tmp_path, monkeypatch, capsys):
+    (tmp_path / "main.tcab").write_text(BLOCKS)
+    monkeypatch.chdir(tmp_path)
+    parser = parse("main.tcab")
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    numbered = variables(sequencer.main_trace.body)
+    assert len(set(numbered["n"])) == 1
+    # each block has a v of its own
+    assert len(set(numbered["v"])) == 2
+    assert sequencer.EXCEPTIONS == []
+
+
+SCOPES = """public class Main {
+    public static void main(String[] args){
+        int n = 1;
+        if n {
+            float v = 2.5;
+            twice(v);
+        }
+        if n {
+            int v = 3;
+            twice(v);
+        }
+    }
+    int twice(int|float v){
+        return v + v;
+    }
+}
+"""
+
+
+def test_calls_see_the_variables_of_their_block(tmp_path, monkeypatch, capsys):
+    (tmp_path / "main.tcab").write_text(SCOPES)
+    monkeypatch.chdir(tmp_path)
+    parser = parse("main.tcab")
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    program = main.Lowerer(sequencer).program
+    assert "Main.twice(float)" in program.functions
+    assert "Main.twice(int)" in program.functions
+
+
+UNKNOWN = """public class Main {
+    public static void main(String[] args){
+        int a = 4.times(2);
+        int b = mystery.plus(1) + a;
+        print(b);
+    }
+}
+"""
+
+
+def test_only_declared_names_are_numbered(tmp_path, monkeypatch, capsys):
+    (tmp_path / "main.tcab").write_text(UNKNOWN)
+    monkeypatch.chdir(tmp_path)
+    parser = parse("main.tcab")
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    # literals and names that were never declared are not variables
+    assert sorted(sequencer.variables.names) == sorted(["String[]", "args", "a", "b"])
+    assert [(x.line_number, x.cause) for x in sequencer.EXCEPTIONS] == [("4", "mystery was never declared...")]
+    # print is not in the program, so it is a system call
+    assert "print" in main.Lowerer(sequencer).program.functions
+
+
+def test_dotted_names_are_found_by_their_longest_start():
+    trie = main.NameTrie()
+    trie.insert(["System"], "system")
+    trie.insert(["System", "out", "println"], "println")
+    assert trie.find(["System", "out", "println", "x"]) == ("println", 3)
+    assert trie.find(["System", "out", "print"]) == ("system", 1)
+    assert trie.find(["Other", "out"]) == (None, 0)
+
+
+def test_variables_are_numbered_with_their_types():
+    variables = main.Variables()
+    scope = main.SymbolTable()
+    assert [variables.add(x, scope) for x in ["a", "b", "p"]] == [0, 1, 2]
+    variables.set_type(0, ["int"])
+    variables.set_type(1, ["double"])
+    # a class that was numbered itself is its number
+    variables.set_type(2, [1])
+    assert len(variables) == 3
+    assert variables.sizes == [4, 8, 0]
+    assert variables.type_texts() == {"#0": ["int"], "#1": ["double"], "#2": ["#1"]}
+    assert variables.scopes == [scope, scope, scope]
+
+
+REACHABLE = """import lib.util;
+public class Main {
+    public static void main(String[] args){
+        int a = Util.twice(4);
+    }
+}
+class Other {
+    int never(){
+        return 1;
+    }
+}
+"""
+UTIL = """public class Util {
+    int twice(int v){
+        return v + v;
+    }
+    int unused(int v){
+        return v;
+    }
+}
+"""
+
+
+def test_only_what_main_reaches_is_traced(tmp_path, monkeypatch, capsys):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "util.tcab").write_text(UTIL)
+    (tmp_path / "main.tcab").write_text(REACHABLE)
+    monkeypatch.chdir(tmp_path)
+    parser = parse("main.tcab")
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    other = [x for x in parser.classes if x.name == "Other"][0]
+    assert other not in sequencer.classes
+    assert not sequencer.is_reachable(other.functions[0])
+    the_class, depth = sequencer.name_trie().find(["Util"])
+    functions = dict([(x.name, x) for x in the_class.functions])
+    assert sequencer.is_reachable(functions["twice"])
+    assert not sequencer.is_reachable(functions["unused"])
+
+
+TWICE = """public class Main {
+    public static void main(String[] args){
+        int a = twice(1) + twice(2);
+        float b = twice(2.5);
+    }
+    int twice(int|float v){
+        return v + v;
+    }
+}
+"""
+
+
+def test_functions_are_traced_once_per_argument_types(tmp_path, monkeypatch, capsys):
+    (tmp_path / "main.tcab").write_text(TWICE)
+    monkeypatch.chdir(tmp_path)
+    parser = parse("main.tcab")
+    sequencer = main.Sequencer(parser.classes, parser.directives, parser.sources)
+    functions = dict([(x.name, x) for x in parser.classes[0].functions])
+    traced = [key[2] for key in sequencer.traces if key[1] == id(functions["twice"])]
+    assert sorted(traced) == [("float",), ("int",)]
+    assert sequencer.trace_hits == 1
+    # the traces are copies, so the parsed functions are not numbered
+    assert sequencer.main_trace is not functions["main"]
+    assert set(variables(functions["main"].body)["a"]) == set([None])